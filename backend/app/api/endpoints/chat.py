@@ -1,7 +1,13 @@
+import json
 import logging
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import ChatRequest, ChatResponse
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.models.schemas import ChatRequest, ChatResponse, BatchChatRequest, BatchChatResponse
 from app.services.rag_pipeline import RAGPipeline
+from app.services.executor import executor_service
+from app.services.metrics import RequestTrace
+from app.services.vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +20,22 @@ async def chat_with_tutor(request: ChatRequest):
     Send a question to the AI tutor and get a response with relevant image
     """
     try:
-        logger.info("Chat request | topic=%s question='%s'", request.topic_id, request.question)
+        logger.info("Chat request | mode=%s topic=%s question='%s'", request.mode, request.topic_id, request.question)
         
-        # Process the question through RAG pipeline
-        result = rag_pipeline.process_query(request.topic_id, request.question)
+        if request.mode == "topic" and not request.topic_id:
+            raise HTTPException(status_code=400, detail="topic_id is required in topic mode")
+        
+        # Process the question through RAG pipeline on the query lane
+        trace = RequestTrace(profile=request.profile)
+        with trace.activate():
+            if request.mode == "library":
+                result = await executor_service.query.run(
+                    rag_pipeline.process_library_query, request.question, request.topic_ids
+                )
+            else:
+                result = await executor_service.query.run(
+                    rag_pipeline.process_query, request.topic_id, request.question
+                )
         
         logger.info(
             "RAG pipeline completed | answer_len=%s chunks=%s image=%s",
@@ -31,9 +49,115 @@ async def chat_with_tutor(request: ChatRequest):
             relevant_chunks=result["relevant_chunks"],
             image_id=result["image_id"],
             image_filename=result["image_filename"],
-            image_title=result["image_title"]
+            image_title=result["image_title"],
+            source_topic_ids=result["source_topic_ids"],
+            timings=trace.timings_ms() if request.include_timings else None,
+            profile=trace.profile_report(),
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error in chat endpoint: %s", e)
-        raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Server-Sent Events version of `/chat`. Emits `chunks` (retrieved
+    passages), one `answer` event per piece of the answer (`{"delta": ...}`),
+    `image` once the diagram is chosen, and `done` with the full
+    ChatResponse. Failures after the stream starts arrive as `error`.
+    `timings` in `done` covers the pipeline up to that event.
+    """
+    if request.mode == "topic":
+        if not request.topic_id:
+            raise HTTPException(status_code=400, detail="topic_id is required in topic mode")
+        if not VectorStore(request.topic_id).exists():
+            raise HTTPException(status_code=404, detail=f"No vector store found for topic: {request.topic_id}")
+    logger.info("Chat stream request | mode=%s topic=%s question='%s'", request.mode, request.topic_id, request.question)
+    
+    # Generators are lazy: nothing runs until `_sse` pulls the first event
+    if request.mode == "library":
+        events = rag_pipeline.stream_library_query(request.question, request.topic_ids)
+    else:
+        events = rag_pipeline.stream_query(request.topic_id, request.question)
+    
+    return StreamingResponse(
+        _sse(events, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _sse(events, request: ChatRequest):
+    # The pipeline is a blocking generator; each step runs on the query lane
+    done = object()
+    trace = RequestTrace(profile=request.profile)
+    try:
+        while True:
+            with trace.activate():
+                item = await executor_service.query.run(next, events, done)
+            if item is done:
+                return
+            event, data = item
+            if event == "done":
+                data = ChatResponse(
+                    **data,
+                    timings=trace.timings_ms() if request.include_timings else None,
+                    profile=trace.profile_report(),
+                ).model_dump()
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    except Exception as e:
+        logger.exception("Error in chat stream: %s", e)
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many questions about one topic. Results keep question order;
+    with `stream` they are sent as NDJSON lines (`{"index": i, ...}`) as
+    each batch of `CHAT_BATCH_SIZE` questions finishes.
+    """
+    if len(request.questions) > settings.CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.CHAT_BATCH_MAX_QUESTIONS} questions per batch",
+        )
+    if not VectorStore(request.topic_id).exists():
+        raise HTTPException(status_code=404, detail=f"No vector store found for topic: {request.topic_id}")
+    
+    logger.info("Batch chat request | topic=%s questions=%s stream=%s",
+                request.topic_id, len(request.questions), request.stream)
+    
+    if request.stream:
+        return StreamingResponse(_stream_batch(request), media_type="application/x-ndjson")
+    
+    try:
+        results = await executor_service.query.run(
+            rag_pipeline.process_queries, request.topic_id, request.questions
+        )
+        return BatchChatResponse(
+            topic_id=request.topic_id,
+            results=[ChatResponse(**result) for result in results],
+        )
+    except Exception as e:
+        logger.exception("Error in batch chat endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
+
+
+async def _stream_batch(request: BatchChatRequest):
+    questions = request.questions
+    for start in range(0, len(questions), settings.CHAT_BATCH_SIZE):
+        try:
+            results = await executor_service.query.run(
+                rag_pipeline.process_queries, request.topic_id, questions[start:start + settings.CHAT_BATCH_SIZE]
+            )
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in-band
+            logger.exception("Error in batch chat stream: %s", e)
+            yield json.dumps({"index": start, "error": str(e)}) + "\n"
+            return
+        for offset, result in enumerate(results):
+            yield json.dumps({"index": start + offset, **result}) + "\n"
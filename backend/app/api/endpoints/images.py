@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import TopicImagesResponse, ImageMetadata
 from app.services.image_service import ImageService
+from app.services.executor import executor_service
 
 router = APIRouter()
 image_service = ImageService()
@@ -11,15 +12,12 @@ async def get_topic_images(topic_id: str):
     Get all image metadata for a specific topic
     """
     try:
-        if not image_service.ensure_topic_images(topic_id):
+        catalog = await executor_service.query.run(image_service.get_catalog, topic_id)
+        if catalog is None:
             raise HTTPException(status_code=404, detail=f"No images available for topic {topic_id}")
         
-        images_data = image_service.get_all_images(topic_id)
-        
-        # Convert to Pydantic models
-        images = []
-        for img_data in images_data:
-            images.append(ImageMetadata(**img_data))
+        # Catalog records become Pydantic models only here
+        images = [ImageMetadata(**image.to_dict()) for image in catalog.images]
         
         return TopicImagesResponse(
             topic_id=topic_id,
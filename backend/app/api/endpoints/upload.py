@@ -1,37 +1,42 @@
+import hashlib
 import logging
+import time
 from fastapi import APIRouter, UploadFile, File, HTTPException
 import uuid
 import os
 import aiofiles
-from app.models.schemas import UploadResponse
-from app.services.pdf_processor import PDFProcessor
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_store import VectorStore
-from app.services.image_service import ImageService
+from app.models.schemas import UploadResponse, IngestionJobStatus
+from app.services.ingestion_jobs import ingestion_job_manager
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-pdf_processor = PDFProcessor()
-embedding_service = EmbeddingService()
-image_service = ImageService()
 
-async def save_uploaded_file(file: UploadFile, destination: str):
-    """Save uploaded file asynchronously in chunks and rewind the stream."""
+async def save_uploaded_file(file: UploadFile, destination: str) -> str:
+    """
+    Save uploaded file asynchronously in chunks and rewind the stream.
+    Returns the SHA-256 of the bytes written.
+    """
+    digest = hashlib.sha256()
     await file.seek(0)
     async with aiofiles.open(destination, 'wb') as buffer:
         while True:
             chunk = await file.read(1024 * 1024)
             if not chunk:
                 break
+            digest.update(chunk)
             await buffer.write(chunk)
     await file.seek(0)
+    return digest.hexdigest()
 
-@router.post("/upload", response_model=UploadResponse)
+@router.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_pdf(file: UploadFile = File(...)):
     """
-    Upload a PDF file, extract chunks, generate embeddings, and persist a vector index.
+    Upload a PDF file and queue a background job that extracts chunks,
+    generates embeddings and persists a vector index. Poll
+    `/upload/jobs/{job_id}` until the job is completed. A file that was
+    already indexed returns its existing topic with a completed job.
     """
     pdf_path = None
     try:
@@ -46,38 +51,33 @@ async def upload_pdf(file: UploadFile = File(...)):
         pdf_filename = f"{topic_id}.pdf"
         pdf_path = os.path.join(settings.PDF_DIR, pdf_filename)
         
-        await save_uploaded_file(file, pdf_path)
+        file_hash = await save_uploaded_file(file, pdf_path)
         file_size = os.path.getsize(pdf_path)
         if file_size == 0:
             os.remove(pdf_path)
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
         
-        logger.info("PDF saved | path=%s size=%s bytes", pdf_path, file_size)
+        logger.info("PDF saved | path=%s size=%s bytes sha256=%s", pdf_path, file_size, file_hash[:12])
         
-        # Extract text chunks
-        result = pdf_processor.process_pdf_from_path(pdf_path, topic_id)
-        chunk_texts = [chunk["text"] for chunk in result["chunks"]]
-        if not chunk_texts:
-            raise HTTPException(status_code=400, detail="No readable text found in PDF.")
-        
-        # Create embeddings + FAISS index
-        embeddings = embedding_service.generate_embeddings(chunk_texts, namespace="chunks")
-        vector_store = VectorStore(topic_id)
-        vector_store.create_index(embeddings, result["chunks"])
-        vector_store.save_index()
+        existing_topic_id = ingestion_job_manager.find_indexed_topic(file_hash)
+        if existing_topic_id is not None:
+            os.remove(pdf_path)
+            job = ingestion_job_manager.record_duplicate(existing_topic_id, filename, file_hash)
+            return UploadResponse(
+                topic_id=existing_topic_id,
+                job_id=job["job_id"],
+                status=job["status"],
+                message="This PDF has already been processed; its existing topic is ready.",
+            )
         
-        # Prepare image metadata for this topic
-        image_service.create_sample_images(topic_id)
+        job = ingestion_job_manager.submit(topic_id, pdf_path, filename, file_hash)
         
-        response = UploadResponse(
+        return UploadResponse(
             topic_id=topic_id,
-            message="PDF processed successfully. You can start chatting about it now.",
-            chunks_processed=result["chunk_count"]
+            job_id=job["job_id"],
+            status=job["status"],
+            message="PDF received. Processing has started; poll the job status until it completes.",
         )
-        logger.info(
-            "Upload complete | topic=%s chunks=%s", topic_id, result["chunk_count"]
-        )
-        return response
         
     except HTTPException:
         raise
@@ -85,4 +85,17 @@ async def upload_pdf(file: UploadFile = File(...)):
         if pdf_path and os.path.exists(pdf_path):
             os.remove(pdf_path)
         logger.exception("Error processing PDF upload: %s", e)
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+@router.get("/upload/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_upload_status(job_id: str):
+    """
+    Report the stage, page progress and per-stage timings of an ingestion job
+    """
+    job = ingestion_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    
+    if job["started_at"]:
+        job["elapsed_seconds"] = round((job["finished_at"] or time.time()) - job["started_at"], 4)
+    return IngestionJobStatus(**job)
@@ -14,6 +14,16 @@ class Settings:
     # Model Settings
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+    # "extractive" (built-in, no network), "openai", "gemini" or "openai_compatible"
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "extractive")
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "")  # defaults per provider
+    LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")  # defaults to OPENAI_API_KEY / GEMINI_API_KEY
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+    LLM_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", 512))
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", 0.2))
     
     # File Paths
     DATA_DIR: str = "data"
@@ -21,12 +31,94 @@ class Settings:
     VECTOR_DIR: str = os.path.join(DATA_DIR, "vectors")
     IMAGE_DIR: str = os.path.join(DATA_DIR, "images")
     METADATA_DIR: str = os.path.join(DATA_DIR, "metadata")
+    JOB_DIR: str = os.path.join(DATA_DIR, "jobs")
+    LIBRARY_DIR: str = os.path.join(VECTOR_DIR, "library")
     
     # RAG Settings
-    CHUNK_SIZE: int = 1000
-    CHUNK_OVERLAP: int = 200
+    # Chunk edges: words | sentences | paragraphs; CHUNK_SIZE and CHUNK_OVERLAP count CHUNK_UNIT (words | tokens | chars)
+    CHUNK_STRATEGY: str = os.getenv("CHUNK_STRATEGY", "paragraphs")
+    CHUNK_UNIT: str = os.getenv("CHUNK_UNIT", "words")
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", 200))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", 40))
     TOP_K_CHUNKS: int = 3
+    # Hybrid retrieval: BM25 keyword search next to the vector search, merged by "rrf" or "weighted" fusion
+    HYBRID_SEARCH_ENABLED: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    HYBRID_FUSION: str = os.getenv("HYBRID_FUSION", "rrf")
+    HYBRID_VECTOR_WEIGHT: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", 0.5))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", 60))
+    # Results taken from each retriever before fusion
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", 20))
+    BM25_K1: float = float(os.getenv("BM25_K1", 1.2))
+    BM25_B: float = float(os.getenv("BM25_B", 0.75))
+    TFIDF_MAX_FEATURES: int = int(os.getenv("TFIDF_MAX_FEATURES", 1000))
+    # "faiss" stores dense vectors; "sparse" keeps TF-IDF CSR matrices end to end
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "faiss")
+    # "topic" fits a vectorizer per upload; "shared" reuses the global `chunks` vocabulary
+    VECTORIZER_SCOPE: str = os.getenv("VECTORIZER_SCOPE", "topic")
+    # flat_ip | ivf_flat | hnsw_flat | flat_l2 (legacy) | auto (flat_ip, ivf_flat for large topics)
+    FAISS_INDEX_TYPE: str = os.getenv("FAISS_INDEX_TYPE", "auto")
+    # TF-IDF vectors cluster loosely, so IVF needs many probes; below this exact search is cheap enough
+    FAISS_ANN_MIN_VECTORS: int = int(os.getenv("FAISS_ANN_MIN_VECTORS", 50000))
+    FAISS_IVF_NPROBE: int = int(os.getenv("FAISS_IVF_NPROBE", 0))  # 0 = nlist / 4
+    FAISS_HNSW_M: int = int(os.getenv("FAISS_HNSW_M", 32))
+    FAISS_HNSW_EF_SEARCH: int = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+    # Cross-topic library index (hashed term space shared by every topic)
+    LIBRARY_HASH_FEATURES: int = int(os.getenv("LIBRARY_HASH_FEATURES", 2 ** 18))
+    LIBRARY_SHARD_SIZE: int = int(os.getenv("LIBRARY_SHARD_SIZE", 50000))
+    PDF_PAGE_BATCH_SIZE: int = int(os.getenv("PDF_PAGE_BATCH_SIZE", 16))
+    # Upload dedup and incremental re-indexing (file and per-page content hashes)
+    CONTENT_REGISTRY_ENABLED: bool = os.getenv("CONTENT_REGISTRY_ENABLED", "true").lower() == "true"
+    CONTENT_REGISTRY_DB_PATH: str = os.getenv("CONTENT_REGISTRY_DB_PATH", os.path.join(DATA_DIR, "content_registry.sqlite3"))
+    # Share of a new file's pages an earlier topic must contain to serve as its base
+    INCREMENTAL_MIN_SHARED_PAGES: float = float(os.getenv("INCREMENTAL_MIN_SHARED_PAGES", 0.5))
+    # Above this share of new chunks the vectorizer is refitted and the index rebuilt
+    INCREMENTAL_MAX_NEW_CHUNKS: float = float(os.getenv("INCREMENTAL_MAX_NEW_CHUNKS", 0.5))
     IMAGE_SIMILARITY_THRESHOLD: float = float(os.getenv("IMAGE_SIMILARITY_THRESHOLD", 0.25))
+    # Batch chat: questions per request, and per pipeline call when streaming
+    CHAT_BATCH_MAX_QUESTIONS: int = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", 5000))
+    CHAT_BATCH_SIZE: int = int(os.getenv("CHAT_BATCH_SIZE", 256))
+    
+    # Cache Settings
+    INDEX_CACHE_MAX_ENTRIES: int = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", 64))
+    INDEX_CACHE_MAX_BYTES: int = int(os.getenv("INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    VECTORIZER_MMAP: bool = os.getenv("VECTORIZER_MMAP", "true").lower() == "true"
+    # Multi-worker serving: FAISS indexes, sparse postings and library shards are read as
+    # read-only memory maps, so uvicorn workers share one copy of them in the page cache
+    INDEX_MMAP: bool = os.getenv("INDEX_MMAP", "false").lower() == "true"
+    # Load the most recently indexed topics into the caches at startup; one worker warms the page cache
+    INDEX_PRELOAD: bool = os.getenv("INDEX_PRELOAD", "false").lower() == "true"
+    INDEX_PRELOAD_MAX_TOPICS: int = int(os.getenv("INDEX_PRELOAD_MAX_TOPICS", 0))  # 0 = INDEX_CACHE_MAX_ENTRIES
+    # Convert vectorizers pickled by older releases to .npy on first load
+    ALLOW_PICKLE_MIGRATION: bool = os.getenv("ALLOW_PICKLE_MIGRATION", "true").lower() == "true"
+    VECTORIZER_CACHE_MAX_ENTRIES: int = int(os.getenv("VECTORIZER_CACHE_MAX_ENTRIES", 128))
+    VECTORIZER_CACHE_MAX_BYTES: int = int(os.getenv("VECTORIZER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # Finished chat answers keyed by (topic, normalized question, index version)
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 4096))
+    RESPONSE_CACHE_PERSIST: bool = os.getenv("RESPONSE_CACHE_PERSIST", "false").lower() == "true"
+    RESPONSE_CACHE_DB_PATH: str = os.getenv("RESPONSE_CACHE_DB_PATH", os.path.join(DATA_DIR, "response_cache.sqlite3"))
+    # Near-duplicate questions (TF-IDF cosine >= threshold) reuse a recent answer
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+    SEMANTIC_CACHE_MAX_PER_TOPIC: int = int(os.getenv("SEMANTIC_CACHE_MAX_PER_TOPIC", 256))
+    SEMANTIC_CACHE_MAX_TOPICS: int = int(os.getenv("SEMANTIC_CACHE_MAX_TOPICS", 64))
+    IMAGE_CATALOG_CACHE_MAX_ENTRIES: int = int(os.getenv("IMAGE_CATALOG_CACHE_MAX_ENTRIES", 256))
+    
+    # Concurrency Settings
+    QUERY_THREAD_WORKERS: int = int(os.getenv("QUERY_THREAD_WORKERS", 8))
+    INGEST_THREAD_WORKERS: int = int(os.getenv("INGEST_THREAD_WORKERS", 2))
+    RETRIEVAL_THREAD_WORKERS: int = int(os.getenv("RETRIEVAL_THREAD_WORKERS", 4))
+    PDF_PROCESS_WORKERS: int = int(os.getenv("PDF_PROCESS_WORKERS", 2))
+    PROCESS_START_METHOD: str = os.getenv("PROCESS_START_METHOD", "spawn")
+    
+    # Metrics and profiling
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Recent observations per histogram series that p50/p95/p99 are computed from
+    METRICS_QUANTILE_WINDOW: int = int(os.getenv("METRICS_QUANTILE_WINDOW", 1024))
+    # Allow `"profile": true` on chat requests (returns sampled stacks to the client)
+    PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+    PROFILER_INTERVAL_MS: float = float(os.getenv("PROFILER_INTERVAL_MS", 1))
     
     # Create directories if they don't exist
     def __init__(self):
@@ -34,5 +126,7 @@ class Settings:
         os.makedirs(self.VECTOR_DIR, exist_ok=True)
         os.makedirs(self.IMAGE_DIR, exist_ok=True)
         os.makedirs(self.METADATA_DIR, exist_ok=True)
+        os.makedirs(self.JOB_DIR, exist_ok=True)
+        os.makedirs(self.LIBRARY_DIR, exist_ok=True)
 
 settings = Settings()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import logging
 from logging.config import dictConfig
+from typing import Optional
 
 
 DEFAULT_LOGGING_CONFIG = {
@@ -21,7 +22,7 @@ DEFAULT_LOGGING_CONFIG = {
 }
 
 
-def setup_logging(config: dict | None = None):
+def setup_logging(config: Optional[dict] = None):
     """
     Configure application wide logging. Pass a dictConfig-compatible
     structure to override the defaults in tests if needed.
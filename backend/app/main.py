@@ -1,9 +1,22 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 from app.core.logging_config import setup_logging
 from app.api.endpoints import upload, chat, images
+from app.services.vector_store import index_cache
+from app.services.embedding_service import vectorizer_cache
+from app.services.image_service import image_catalog_cache
+from app.services.response_cache import response_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.llm_providers import llm_runner
+from app.services.executor import executor_service
+from app.services.metrics import registry as metrics_registry
+from app.services.ingestion_jobs import ingestion_job_manager
+from app.services.index_preloader import index_preloader
+from app.api.endpoints.chat import rag_pipeline
 
 setup_logging()
 
@@ -28,19 +41,88 @@ app.mount(
     name="chapter-images",
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so `/images/{topic_id}` stays one series
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics_registry.observe("http_request_seconds", time.perf_counter() - started, route=path)
+    metrics_registry.inc("http_requests_total", method=request.method, route=path, status=response.status_code)
+    return response
+
+
 app.include_router(upload.router, prefix="/api/v1", tags=["upload"])
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
 app.include_router(images.router, prefix="/api/v1", tags=["images"])
 
 
+@app.on_event("startup")
+async def resume_ingestion_jobs():
+    ingestion_job_manager.resume_pending()
+    # Older topics are migrated and added to the library in the background
+    executor_service.ingest.submit(rag_pipeline.migrate_chunk_stores)
+    executor_service.ingest.submit(rag_pipeline.sync_library)
+    if settings.INDEX_PRELOAD:
+        executor_service.ingest.submit(index_preloader.run)
+
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    executor_service.shutdown(wait=False)
+    llm_runner.shutdown()
+
+
 @app.get("/")
 async def root():
     return {"message": "RAG AI Tutor API is running"}
 
 
+def _cache_stats():
+    return {
+        **{cache.name: cache.stats() for cache in (index_cache, vectorizer_cache, image_catalog_cache)},
+        "response": response_cache.stats(),
+        "semantic": semantic_cache.stats(),
+    }
+
+
+def _runtime_gauges():
+    """Numeric cache, lane and LLM stats as gauges, read at scrape time."""
+    groups = (
+        ("rag_cache", "cache", _cache_stats()),
+        ("rag_executor", "lane", executor_service.stats()),
+        ("rag_llm", None, {"runner": llm_runner.stats()}),
+    )
+    for prefix, label, stats_by_name in groups:
+        for name, stats in stats_by_name.items():
+            for field, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield (f"{prefix}_{field}", f"{prefix.replace('_', ' ')} {field}", "gauge",
+                           {label: name} if label else {}, value)
+
+
+metrics_registry.register_collector(_runtime_gauges)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "caches": _cache_stats(),
+        "executors": executor_service.stats(),
+        "llm": llm_runner.stats(),
+        "preload": index_preloader.stats(),
+        "latency": metrics_registry.summary(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Counters, latency histograms and cache/lane gauges in the Prometheus text format."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
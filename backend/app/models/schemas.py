@@ -1,14 +1,44 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 
 class UploadResponse(BaseModel):
     topic_id: str
     message: str
-    chunks_processed: int
+    chunks_processed: int = 0
+    job_id: Optional[str] = None
+    status: str = "completed"
 
-class ChatRequest(BaseModel):
+class IngestionJobStatus(BaseModel):
+    job_id: str
     topic_id: str
+    filename: str
+    status: str
+    stage: str
+    pages_total: Optional[int] = None
+    pages_processed: int = 0
+    # Pages and chunks taken from an earlier upload instead of being processed again
+    pages_reused: int = 0
+    chunks_processed: int = 0
+    chunks_reused: int = 0
+    base_topic_id: Optional[str] = None
+    deduplicated: bool = False
+    error: Optional[str] = None
+    stage_timings: Dict[str, float] = {}
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    elapsed_seconds: Optional[float] = None
+
+class ChatRequest(BaseModel):
+    topic_id: Optional[str] = None
     question: str
+    # "topic" answers from `topic_id`; "library" searches `topic_ids`, or every topic if omitted
+    mode: Literal["topic", "library"] = "topic"
+    topic_ids: Optional[List[str]] = None
+    # Return the per-stage latency breakdown (milliseconds) in `timings`
+    include_timings: bool = False
+    # Sample the request's stacks into `profile` (needs PROFILER_ENABLED)
+    profile: bool = False
 
 class ChatResponse(BaseModel):
     answer: str
@@ -16,6 +46,19 @@ class ChatResponse(BaseModel):
     image_id: Optional[str] = None
     image_filename: Optional[str] = None
     image_title: Optional[str] = None
+    source_topic_ids: Optional[List[str]] = None
+    timings: Optional[Dict[str, float]] = None
+    profile: Optional[Dict[str, Any]] = None
+
+class BatchChatRequest(BaseModel):
+    topic_id: str
+    questions: List[str]
+    # Stream one NDJSON line per answer instead of a single JSON body
+    stream: bool = False
+
+class BatchChatResponse(BaseModel):
+    topic_id: str
+    results: List[ChatResponse]
 
 class ImageMetadata(BaseModel):
     id: str
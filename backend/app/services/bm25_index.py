@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from app.core.config import settings
+from app.services.sentence_index import normalize_token
+
+# TfidfVectorizer's default token pattern: two or more word characters
+TERM_PATTERN = re.compile(r"\b\w\w+\b")
+
+_PARTS = ("terms", "offsets", "rows", "weights")
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        normalize_token(token)
+        for token in TERM_PATTERN.findall(text.lower())
+        if token not in ENGLISH_STOP_WORDS
+    ]
+
+
+def term_hashes(terms: Iterable[str]) -> np.ndarray:
+    """Stable 64-bit ids for terms (the index stores these instead of strings)."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little") for term in terms],
+        dtype=np.uint64,
+    )
+
+
+class BM25Index:
+    """
+    Okapi BM25 keyword index over a topic's chunks.
+    
+    Postings are flat arrays: `terms` holds the sorted 64-bit hash of every
+    term, `offsets` (n_terms + 1) slices `rows` (chunk row, int32) and
+    `weights` (float32) per term. Each weight is the term's full BM25
+    contribution for that chunk, precomputed at build time with `BM25_K1`
+    and `BM25_B`, so a query is a binary search per query term and one
+    weighted `bincount` over the matching postings. That is eight bytes per
+    posting plus eight per term, and the `.npy` files are memory-mapped on
+    load, so thousands of topics cost only the pages their queries touch.
+    Rows are positions in the topic's chunk store. The search API mirrors
+    `SparseIndex` (`(scores, rows)`, best first, padded with -1).
+    """
+    def __init__(self, arrays, doc_count: int):
+        for part in _PARTS:
+            setattr(self, part, arrays[part])
+        self.doc_count = doc_count
+    
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], k1: Optional[float] = None, b: Optional[float] = None) -> "BM25Index":
+        k1 = settings.BM25_K1 if k1 is None else k1
+        b = settings.BM25_B if b is None else b
+        
+        term_ids = {}
+        doc_terms, doc_lengths = [], []
+        for text in texts:
+            tokens = tokenize(text)
+            doc_terms.append(np.array([term_ids.setdefault(token, len(term_ids)) for token in tokens], dtype=np.int64))
+            doc_lengths.append(len(tokens))
+        doc_count = len(doc_terms)
+        
+        # (term, row, tf) for every distinct term of every chunk
+        posting_terms, posting_rows, posting_tfs = [], [], []
+        for row, ids in enumerate(doc_terms):
+            unique_ids, counts = np.unique(ids, return_counts=True)
+            posting_terms.append(unique_ids)
+            posting_rows.append(np.full(len(unique_ids), row, dtype=np.int32))
+            posting_tfs.append(counts)
+        posting_terms = np.concatenate(posting_terms) if doc_terms else np.zeros(0, dtype=np.int64)
+        posting_rows = np.concatenate(posting_rows) if doc_terms else np.zeros(0, dtype=np.int32)
+        posting_tfs = np.concatenate(posting_tfs).astype(np.float32) if doc_terms else np.zeros(0, dtype=np.float32)
+        
+        # Order postings by term hash, then row
+        hashes = term_hashes(term_ids)
+        rank = np.empty(len(hashes), dtype=np.int64)
+        rank[np.argsort(hashes)] = np.arange(len(hashes))
+        posting_terms = rank[posting_terms]
+        order = np.lexsort((posting_rows, posting_terms))
+        posting_terms, posting_rows, posting_tfs = posting_terms[order], posting_rows[order], posting_tfs[order]
+        
+        document_frequency = np.bincount(posting_terms, minlength=len(hashes))
+        offsets = np.zeros(len(hashes) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=offsets[1:])
+        
+        idf = np.log1p((doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        lengths = np.array(doc_lengths, dtype=np.float32)
+        average_length = float(lengths.mean()) if doc_count and lengths.mean() > 0 else 1.0
+        norms = k1 * (1.0 - b + b * lengths[posting_rows] / average_length)
+        weights = idf[posting_terms] * posting_tfs * (k1 + 1.0) / (posting_tfs + norms)
+        
+        return cls({
+            "terms": np.sort(hashes),
+            "offsets": offsets,
+            "rows": posting_rows,
+            "weights": weights.astype(np.float32),
+        }, doc_count)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, part).nbytes for part in _PARTS)
+    
+    def score(self, question: str) -> np.ndarray:
+        """BM25 score of every chunk for one question."""
+        hashes = np.unique(term_hashes(set(tokenize(question))))
+        positions = np.searchsorted(self.terms, hashes)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == hashes[found]
+        positions = positions[found]
+        if not len(positions):
+            return np.zeros(self.doc_count, dtype=np.float32)
+        postings = [np.arange(self.offsets[position], self.offsets[position + 1]) for position in positions]
+        postings = np.concatenate(postings)
+        return np.bincount(self.rows[postings], weights=self.weights[postings], minlength=self.doc_count)
+    
+    def search_batch(self, questions: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return `(scores, rows)` of shape (n_questions, k), best first. Chunks
+        sharing no term with a question are not returned (row -1, score 0).
+        """
+        scores = np.zeros((len(questions), k), dtype=np.float32)
+        rows = np.full((len(questions), k), -1, dtype=np.int64)
+        k_eff = min(k, self.doc_count)
+        if k_eff == 0:
+            return scores, rows
+        for i, question in enumerate(questions):
+            chunk_scores = self.score(question)
+            top = np.argpartition(-chunk_scores, k_eff - 1)[:k_eff]
+            top = top[np.argsort(-chunk_scores[top], kind="stable")]
+            top = top[chunk_scores[top] > 0]
+            scores[i, :len(top)] = chunk_scores[top]
+            rows[i, :len(top)] = top
+        return scores, rows
+    
+    def save(self, prefix: str):
+        """Write `{prefix}_{part}.npy`, replacing each file atomically."""
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        for part, path in zip(_PARTS, self.files(prefix)):
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, getattr(self, part))
+            os.replace(f"{path}.tmp", path)
+    
+    @classmethod
+    def load(cls, prefix: str, doc_count: int, mmap: bool = True) -> "BM25Index":
+        mmap_mode = "r" if mmap else None
+        return cls({part: np.load(path, mmap_mode=mmap_mode) for part, path in zip(_PARTS, cls.files(prefix))},
+                   doc_count)
+    
+    @staticmethod
+    def files(prefix: str) -> List[str]:
+        return [f"{prefix}_{part}.npy" for part in _PARTS]
+    
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return all(os.path.exists(path) for path in cls.files(prefix))
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and (approximate) byte size.
+    Callers supply the size of each value because only they know what is
+    expensive about it (index vectors, chunk text, ...).
+    """
+    def __init__(self, name: str, max_entries: int, max_bytes: int = 0):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable, is_valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached value for `key` or None. When `is_valid` rejects the
+        cached value it is dropped and the lookup counts as a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and is_valid is not None and not is_valid(entry[0]):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, value: Any, nbytes: int = 0):
+        """Insert or replace a value, evicting least recently used entries as needed."""
+        if self.max_entries <= 0 or (self.max_bytes and nbytes > self.max_bytes):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes)
+            self._current_bytes += nbytes
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes and self._current_bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+    
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`; returns how many."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+    
+    def _remove(self, key: Hashable):
+        _, nbytes = self._entries.pop(key)
+        self._current_bytes -= nbytes
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
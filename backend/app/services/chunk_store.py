@@ -0,0 +1,303 @@
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+import numpy as np
+from app.services import sentence_index
+
+FORMAT_VERSION = "columnar-v1"
+
+_PARTS = ("text", "offsets", "meta", "sentences", "sentence_offsets", "tokens", "token_offsets", "vocab")
+# Written by newer versions; stores without them still load
+_OPTIONAL_PARTS = ("idf",)
+
+META_DTYPE = np.dtype([
+    ("key", "<i8"),
+    ("id", "S36"),
+    ("chunk_id", "<i4"),
+    ("start_index", "<i8"),
+    ("end_index", "<i8"),
+    ("word_count", "<i4"),
+])
+SENTENCE_DTYPE = np.dtype([("start", "<i4"), ("end", "<i4")])
+CHUNK_META_FIELDS = ("chunk_id", "start_index", "end_index", "word_count")
+
+
+class ChunkStore:
+    """
+    Columnar, memory-mappable storage for a topic's chunks.
+    
+    Chunk texts are one UTF-8 blob sliced by an offsets array (n + 1), and
+    `chunk_id`/`start_index`/`end_index`/`word_count` are fixed-width
+    columns of a structured array. Sentence spans and their content words
+    (see `sentence_index`) are flattened the same way: per-chunk offsets into
+    a span array, per-sentence offsets into token ids, and a sorted
+    vocabulary. `idf` holds the topic's sentence idf aligned with the
+    vocabulary. Loading maps the `.npy` files without reading them, so load
+    time does not grow with the document and a search only touches the pages
+    of the rows it returns.
+    
+    Indexing materialises a row as the chunk dict the rest of the pipeline
+    has always used, so a ChunkStore can stand in for the list; search
+    results are `ChunkHit` views that read single columns instead.
+    Each row also has a `key`: the id of its vector in the search index,
+    which differs from the row number once an index has been updated.
+    """
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        for part in _PARTS:
+            setattr(self, part, arrays[part])
+        self.idf: Optional[np.ndarray] = arrays.get("idf")
+        self._rows_by_key: Optional[np.ndarray] = None
+    
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]], keys: Optional[np.ndarray] = None,
+                    idf: Optional[sentence_index.Weights] = None) -> "ChunkStore":
+        """
+        Build from chunk dicts annotated by `sentence_index.annotate_chunks`,
+        whose returned `idf` is stored with the vocabulary.
+        `keys` defaults to the row numbers.
+        """
+        if not all(sentence_index.is_annotated(chunk) for chunk in chunks):
+            raise ValueError("Chunks must be annotated with sentences before they are stored")
+        
+        encoded = [chunk["text"].encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        
+        meta = np.zeros(len(chunks), dtype=META_DTYPE)
+        meta["key"] = np.arange(len(chunks)) if keys is None else keys
+        for row, chunk in enumerate(chunks):
+            meta[row] = (
+                meta["key"][row],
+                chunk.get("id", "").encode("ascii"),
+                chunk["chunk_id"],
+                chunk["start_index"],
+                chunk["end_index"],
+                chunk["word_count"],
+            )
+        
+        vocab = sorted({token for chunk in chunks for tokens in chunk["sentence_tokens"] for token in tokens})
+        token_ids = {token: i for i, token in enumerate(vocab)}
+        spans, sentence_counts, tokens, token_counts = [], [], [], []
+        for chunk in chunks:
+            spans.extend(tuple(span) for span in chunk["sentences"])
+            sentence_counts.append(len(chunk["sentences"]))
+            for sentence_tokens in chunk["sentence_tokens"]:
+                tokens.extend(token_ids[token] for token in sentence_tokens)
+                token_counts.append(len(sentence_tokens))
+        
+        sentence_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum(sentence_counts, out=sentence_offsets[1:])
+        token_offsets = np.zeros(len(token_counts) + 1, dtype=np.int64)
+        np.cumsum(token_counts, out=token_offsets[1:])
+        
+        store = cls({
+            "text": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "offsets": offsets,
+            "meta": meta,
+            "sentences": np.array(spans, dtype=SENTENCE_DTYPE),
+            "sentence_offsets": sentence_offsets,
+            "tokens": np.array(tokens, dtype=np.int32),
+            "token_offsets": token_offsets,
+            "vocab": np.array(vocab, dtype=f"<U{max(map(len, vocab), default=1)}"),
+        })
+        return store.with_idf(idf) if idf is not None else store
+    
+    def with_idf(self, idf: sentence_index.Weights) -> "ChunkStore":
+        """This store with `idf` (token -> weight) stored along the vocabulary."""
+        arrays = {part: getattr(self, part) for part in _PARTS}
+        arrays["idf"] = np.array([idf.get(term, 1.0) for term in self.vocab.tolist()], dtype=np.float64)
+        return ChunkStore(arrays)
+    
+    def term_weights(self) -> Optional[sentence_index.TermWeights]:
+        """The stored sentence idf, looked up in the memory-mapped vocabulary."""
+        if self.idf is None:
+            return None
+        return sentence_index.TermWeights(self.vocab, self.idf)
+    
+    def __len__(self) -> int:
+        return len(self.meta)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self[row]
+    
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        row = self._check_row(row)
+        meta = self.meta[row]
+        return {
+            "id": meta["id"].decode("ascii"),
+            "chunk_id": int(meta["chunk_id"]),
+            "text": self.text_at(row),
+            "word_count": int(meta["word_count"]),
+            "start_index": int(meta["start_index"]),
+            "end_index": int(meta["end_index"]),
+            "sentences": self.sentences_at(row),
+            "sentence_tokens": self.sentence_tokens_at(row),
+        }
+    
+    def _check_row(self, row: int) -> int:
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Chunk row {row} out of range")
+        return row
+    
+    def field(self, row: int, name: str) -> Any:
+        """One field of the chunk dict at `row`, read from its column only."""
+        row = self._check_row(row)
+        if name == "text":
+            return self.text_at(row)
+        if name == "sentences":
+            return self.sentences_at(row)
+        if name == "sentence_tokens":
+            return self.sentence_tokens_at(row)
+        if name == "id":
+            return self.meta["id"][row].decode("ascii")
+        if name in CHUNK_META_FIELDS:
+            return int(self.meta[name][row])
+        raise KeyError(name)
+    
+    def sentences_at(self, row: int) -> List[List[int]]:
+        first, last = self.sentence_offsets[row], self.sentence_offsets[row + 1]
+        return [list(span) for span in self.sentences[first:last].tolist()]
+    
+    def sentence_tokens_at(self, row: int) -> List[List[str]]:
+        first, last = self.sentence_offsets[row], self.sentence_offsets[row + 1]
+        token_offsets = self.token_offsets[first:last + 1]
+        base = token_offsets[0]
+        words = self.vocab[self.tokens[base:token_offsets[-1]]].tolist()
+        return [
+            words[start - base:end - base]
+            for start, end in zip(token_offsets[:-1].tolist(), token_offsets[1:].tolist())
+        ]
+    
+    @property
+    def keys(self) -> np.ndarray:
+        if "key" not in self.meta.dtype.names:
+            # Stores written before index updates existed are keyed by row
+            return np.arange(len(self), dtype=np.int64)
+        return np.asarray(self.meta["key"], dtype=np.int64)
+    
+    def rows_for_keys(self, keys: np.ndarray) -> np.ndarray:
+        """Map index ids to rows; ids not in the store (e.g. -1 padding) map to -1."""
+        if self._rows_by_key is None:
+            own_keys = self.keys
+            rows_by_key = np.full(int(own_keys.max(initial=0)) + 1, -1, dtype=np.int64)
+            rows_by_key[own_keys] = np.arange(len(own_keys))
+            self._rows_by_key = rows_by_key
+        keys = np.asarray(keys, dtype=np.int64)
+        known = (keys >= 0) & (keys < len(self._rows_by_key))
+        return np.where(known, self._rows_by_key[np.where(known, keys, 0)], -1)
+    
+    def text_at(self, row: int) -> str:
+        return self.text[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+    
+    def texts(self) -> Iterator[str]:
+        """Chunk texts in row order without materialising the other columns."""
+        for row in range(len(self)):
+            yield self.text_at(row)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, part).nbytes for part in _PARTS + _OPTIONAL_PARTS if getattr(self, part) is not None)
+    
+    def save(self, prefix: str):
+        """
+        Write each column as `{prefix}_{part}.npy`. Files are replaced
+        atomically, so processes still mapping the previous version keep
+        reading it instead of a truncated file.
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        for part, path in zip(_PARTS + _OPTIONAL_PARTS, self.files(prefix) + self.optional_files(prefix)):
+            array = getattr(self, part)
+            if array is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{path}.tmp", path)
+    
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> "ChunkStore":
+        mmap_mode = "r" if mmap else None
+        arrays = {part: np.load(path, mmap_mode=mmap_mode) for part, path in zip(_PARTS, cls.files(prefix))}
+        for part, path in zip(_OPTIONAL_PARTS, cls.optional_files(prefix)):
+            if os.path.exists(path):
+                arrays[part] = np.load(path, mmap_mode=mmap_mode)
+        return cls(arrays)
+    
+    @staticmethod
+    def files(prefix: str) -> List[str]:
+        return [f"{prefix}_{part}.npy" for part in _PARTS]
+    
+    @staticmethod
+    def optional_files(prefix: str) -> List[str]:
+        return [f"{prefix}_{part}.npy" for part in _OPTIONAL_PARTS]
+    
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return all(os.path.exists(path) for path in cls.files(prefix))
+
+
+class ChunkHit:
+    """
+    A search result: one row of a topic's chunks and its scores. Fields are
+    read from the row's columns when first asked for (`hit["text"]`, as on
+    the chunk dicts results used to be), so a result costs a slotted object
+    instead of a copied dict with its sentence lists. `to_dict` gives the
+    full dict where a plain value is needed.
+    """
+    __slots__ = ("chunks", "row", "similarity_score", "keyword_score", "fused_score", "_text")
+    SCORES = ("similarity_score", "distance", "keyword_score", "fused_score")
+    
+    def __init__(self, chunks: Union[ChunkStore, Sequence[Dict[str, Any]]], row: int, similarity_score: float,
+                 keyword_score: Optional[float] = None, fused_score: Optional[float] = None):
+        self.chunks = chunks
+        self.row = int(row)
+        self.similarity_score = float(similarity_score)
+        self.keyword_score = None if keyword_score is None else float(keyword_score)
+        self.fused_score = None if fused_score is None else float(fused_score)
+        self._text: Optional[str] = None
+    
+    @property
+    def distance(self) -> float:
+        """Cosine distance"""
+        return 1.0 - self.similarity_score
+    
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._field("text")
+        return self._text
+    
+    @property
+    def annotated(self) -> bool:
+        return isinstance(self.chunks, ChunkStore) or sentence_index.is_annotated(self.chunks[self.row])
+    
+    def _field(self, name: str) -> Any:
+        if isinstance(self.chunks, ChunkStore):
+            return self.chunks.field(self.row, name)
+        # Legacy topics keep chunk dicts until they are migrated
+        return self.chunks[self.row][name]
+    
+    def __getitem__(self, name: str) -> Any:
+        if name == "text":
+            return self.text
+        if name in self.SCORES:
+            value = getattr(self, name)
+            if value is None:
+                raise KeyError(name)
+            return value
+        return self._field(name)
+    
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+    
+    def to_dict(self) -> Dict[str, Any]:
+        chunk = dict(self.chunks[self.row])
+        chunk.update({name: self[name] for name in self.SCORES if self.get(name) is not None})
+        return chunk
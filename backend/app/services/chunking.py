@@ -0,0 +1,226 @@
+import re
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+import numpy as np
+
+# A blank line, or a line break before a bullet or a numbered heading / list item
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n|\n(?=[ \t]*(?:[•▪◦]|\d+(?:\.\d+)*\.?[ \t]?[A-Z]))")
+# Rough LLM-style token: a run of word characters or a single symbol
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Same boundaries as `sentence_index.SENTENCE_BREAK`: a word ending in . ! or ?
+SENTENCE_END = ".!?"
+_SENTENCE_END_CODES = np.array([ord(c) for c in SENTENCE_END], dtype=np.uint32)
+_SPACE = ord(" ")
+
+WordWeights = Callable[[str, np.ndarray, np.ndarray], np.ndarray]
+
+
+def _word_weights(text: str, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    return np.ones(len(starts), dtype=np.int64)
+
+
+def _token_weights(text: str, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    positions = np.fromiter((match.start() for match in TOKEN_PATTERN.finditer(text)), dtype=np.int64)
+    owners = np.searchsorted(starts, positions, side="right") - 1
+    return np.bincount(owners, minlength=len(starts)).astype(np.int64)
+
+
+def _char_weights(text: str, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Each word plus the space that separates it from the next
+    return (ends - starts + 1).astype(np.int64)
+
+
+# What CHUNK_SIZE / CHUNK_OVERLAP count
+UNITS: Dict[str, WordWeights] = {
+    "words": _word_weights,
+    "tokens": _token_weights,
+    "chars": _char_weights,
+}
+
+# Where a window may start or end, coarsest first. A span heavier than a
+# whole window is split at the next level down, ending with single words.
+STRATEGIES: Dict[str, Tuple[str, ...]] = {
+    "words": ("words",),
+    "sentences": ("sentences", "words"),
+    "paragraphs": ("paragraphs", "sentences", "words"),
+}
+
+
+class _WordBuffer:
+    """
+    Text not yet covered by an emitted window, normalised to single spaces,
+    with per-word arrays: character offsets into `text`, weight in the
+    chunk unit, and whether the word starts a sentence or a paragraph.
+    """
+    def __init__(self, weigh: WordWeights):
+        self.weigh = weigh
+        self.text = ""
+        self.base = 0  # absolute index of the first buffered word
+        self.break_pending = False  # the last page ended with a paragraph break
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.ends = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0, dtype=np.int64)
+        self.flags = {level: np.zeros(0, dtype=bool) for level in ("sentences", "paragraphs")}
+        # Words of a sentence or paragraph known to be heavier than a window
+        self.heavy = {level: np.zeros(0, dtype=bool) for level in ("sentences", "paragraphs")}
+    
+    def __len__(self) -> int:
+        return len(self.starts)
+    
+    def append(self, page_text: str):
+        parts = [" ".join(part.split()) for part in PARAGRAPH_BREAK.split(page_text)]
+        paragraphs = [paragraph for paragraph in parts if paragraph]
+        if not paragraphs:
+            self.break_pending |= len(parts) > 1
+            return
+        text = " ".join(paragraphs)
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        spaces = np.flatnonzero(codes == _SPACE)
+        starts = np.concatenate(([0], spaces + 1))
+        ends = np.concatenate((spaces, [len(codes)]))
+        
+        sentence_starts = np.zeros(len(starts), dtype=bool)
+        sentence_starts[1:] = np.isin(codes[ends[:-1] - 1], _SENTENCE_END_CODES)
+        paragraph_starts = np.zeros(len(starts), dtype=bool)
+        paragraph_lengths = [paragraph.count(" ") + 1 for paragraph in paragraphs[:-1]]
+        paragraph_starts[np.cumsum(paragraph_lengths, dtype=np.int64)] = True
+        # A page that follows a finished sentence starts a new paragraph
+        paragraph_starts[0] = (not self.text or self.text[-1] in SENTENCE_END
+                               or self.break_pending or not parts[0])
+        self.break_pending = len(parts) > 1 and not parts[-1]
+        sentence_starts |= paragraph_starts
+        
+        offset = len(self.text) + 1 if self.text else 0
+        self.text = f"{self.text} {text}" if self.text else text
+        self.starts = np.concatenate((self.starts, starts + offset))
+        self.ends = np.concatenate((self.ends, ends + offset))
+        self.weights = np.concatenate((self.weights, self.weigh(text, starts, ends)))
+        self.flags["sentences"] = np.concatenate((self.flags["sentences"], sentence_starts))
+        self.flags["paragraphs"] = np.concatenate((self.flags["paragraphs"], paragraph_starts))
+        self.heavy = {level: np.concatenate((heavy, np.zeros(len(starts), dtype=bool)))
+                      for level, heavy in self.heavy.items()}
+    
+    def drop(self, count: int):
+        """Forget the first `count` words."""
+        if count <= 0:
+            return
+        count = min(count, len(self))
+        cut = int(self.starts[count]) if count < len(self) else len(self.text)
+        self.text = self.text[cut:]
+        self.base += count
+        self.starts = self.starts[count:] - cut
+        self.ends = self.ends[count:] - cut
+        self.weights = self.weights[count:]
+        self.flags = {level: flags[count:] for level, flags in self.flags.items()}
+        self.heavy = {level: heavy[count:] for level, heavy in self.heavy.items()}
+
+
+class Chunker:
+    """
+    Splits a stream of texts (e.g. PDF pages) into overlapping windows.
+    
+    `strategy` decides where windows may start and end (any word, sentence
+    or paragraph boundaries), `unit` what `size` and `overlap` count (words,
+    tokens or characters). A window takes as many whole units as fit in
+    `size`; the next one starts at the first unit boundary that keeps at
+    most `overlap` of the previous window, and always moves forward.
+    
+    Windows are packed with searches over cumulative unit weights, and a
+    chunk's text is one slice of a whitespace-normalised buffer, so there is
+    no per-window list slicing or joining. Pages are consumed as they
+    arrive: a window is emitted as soon as the text after it shows where it
+    ends, and text before the next window's start is dropped, so only about
+    one window plus one page is held. `start_index`/`end_index` remain word
+    positions in the whole text, whatever the unit.
+    """
+    def __init__(self, strategy: str = "words", size: int = 1000, overlap: int = 200, unit: str = "words"):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown chunk strategy '{strategy}', expected one of {', '.join(STRATEGIES)}")
+        if unit not in UNITS:
+            raise ValueError(f"Unknown chunk unit '{unit}', expected one of {', '.join(UNITS)}")
+        if size <= 0 or overlap < 0:
+            raise ValueError("Chunk size must be positive and overlap non-negative")
+        self.strategy = strategy
+        self.unit = unit
+        self.size = size
+        self.overlap = overlap
+    
+    def chunk_text(self, text: str) -> List[Dict[str, Any]]:
+        return list(self.iter_chunks([text]))
+    
+    def iter_chunks(self, texts: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        buffer = _WordBuffer(UNITS[self.unit])
+        chunk_id = 0
+        for text in texts:
+            buffer.append(text)
+            windows, next_start = self._pack(buffer, final=False)
+            for start, end in windows:
+                yield self._make_chunk(chunk_id, buffer, start, end)
+                chunk_id += 1
+            buffer.drop(next_start)
+        windows, _ = self._pack(buffer, final=True)
+        for start, end in windows:
+            yield self._make_chunk(chunk_id, buffer, start, end)
+            chunk_id += 1
+    
+    def _unit_bounds(self, buffer: _WordBuffer, cumulative: np.ndarray) -> np.ndarray:
+        """
+        Word index of every unit start, followed by the word count. Spans
+        found too heavy stay marked on the buffer, so the rest of one
+        still splits the same way after its start has been dropped.
+        """
+        count = len(buffer)
+        levels = STRATEGIES[self.strategy]
+        bounds = np.arange(count) if levels[0] == "words" else np.flatnonzero(buffer.flags[levels[0]])
+        bounds = np.union1d([0], bounds)
+        for coarse, level in zip(levels, levels[1:]):
+            edges = np.append(bounds, count)
+            heavy = cumulative[edges[1:]] - cumulative[edges[:-1]] > self.size
+            heavy |= np.logical_or.reduceat(buffer.heavy[coarse], bounds)
+            buffer.heavy[coarse] = np.repeat(heavy, np.diff(edges))
+            if not heavy.any():
+                break
+            finer = np.arange(count) if level == "words" else np.flatnonzero(buffer.flags[level])
+            owners = np.searchsorted(bounds, finer, side="right") - 1
+            bounds = np.union1d(bounds, finer[heavy[owners]])
+        return np.append(bounds, count)
+    
+    def _pack(self, buffer: _WordBuffer, final: bool) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        `[start, end)` word ranges of the windows that can be emitted now,
+        and the first word a later window can still need. Unless `final`,
+        the last unit may grow with the next page, so a window is only
+        emitted once the unit after it is complete.
+        """
+        if len(buffer) == 0:
+            return [], 0
+        cumulative = np.zeros(len(buffer) + 1, dtype=np.int64)
+        np.cumsum(buffer.weights, out=cumulative[1:])
+        bounds = self._unit_bounds(buffer, cumulative)
+        weights = cumulative[bounds]
+        unit_count = len(bounds) - 1
+        
+        windows = []
+        start = 0
+        while start < unit_count:
+            end = int(np.searchsorted(weights, weights[start] + self.size, side="right")) - 1
+            end = min(max(end, start + 1), unit_count)
+            if not final and end >= unit_count - 1:
+                break
+            windows.append((int(bounds[start]), int(bounds[end])))
+            if end == unit_count:
+                start = unit_count
+                break
+            start = max(start + 1, int(np.searchsorted(weights, weights[end] - self.overlap, side="left")))
+        return windows, int(bounds[start]) if start < unit_count else len(buffer)
+    
+    @staticmethod
+    def _make_chunk(chunk_id: int, buffer: _WordBuffer, start: int, end: int) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "chunk_id": chunk_id,
+            "text": buffer.text[buffer.starts[start]:buffer.ends[end - 1]],
+            "word_count": end - start,
+            "start_index": buffer.base + start,
+            "end_index": buffer.base + end,
+        }
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ContentRegistry:
+    """
+    Records what each topic was built from: the SHA-256 of the uploaded
+    file and, per page, a content fingerprint with the text extracted from
+    it. A byte-identical upload is answered with the existing topic, and a
+    revised file reuses the text of every page it shares with an earlier
+    topic instead of extracting it again.
+    
+    Kept in a SQLite file so every worker process sees the same registry.
+    Topics are registered once their index is saved; entries pointing at
+    topics that no longer exist are dropped when they are found.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.enabled = settings.CONTENT_REGISTRY_ENABLED
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.enabled:
+            self._open_db(db_path or settings.CONTENT_REGISTRY_DB_PATH)
+    
+    def _open_db(self, db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS topics ("
+                " topic_id TEXT PRIMARY KEY, file_hash TEXT NOT NULL, registered_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS topics_file_hash ON topics (file_hash)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " topic_id TEXT NOT NULL, page_number INTEGER NOT NULL,"
+                " fingerprint TEXT NOT NULL, text TEXT NOT NULL,"
+                " PRIMARY KEY (topic_id, page_number))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS pages_fingerprint ON pages (fingerprint)")
+            db.commit()
+            self._db = db
+        except sqlite3.Error as e:
+            logger.warning("Content registry %s unavailable, uploads will not be deduplicated: %s", db_path, e)
+    
+    def topics_for_file(self, file_hash: str) -> List[str]:
+        """Topics built from exactly these bytes, newest first."""
+        if self._db is None:
+            return []
+        try:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT topic_id FROM topics WHERE file_hash = ? ORDER BY registered_at DESC", (file_hash,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Content registry lookup failed: %s", e)
+            return []
+        return [row[0] for row in rows]
+    
+    def candidate_bases(self, fingerprints: List[str], limit: int = 3) -> List[str]:
+        """Topics sharing the most page fingerprints with a new file, best first."""
+        if self._db is None or not fingerprints:
+            return []
+        try:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT p.topic_id, COUNT(DISTINCT p.fingerprint) AS shared"
+                    " FROM pages p JOIN topics t ON t.topic_id = p.topic_id"
+                    " WHERE p.fingerprint IN (SELECT value FROM json_each(?))"
+                    " GROUP BY p.topic_id ORDER BY shared DESC, t.registered_at DESC LIMIT ?",
+                    (json.dumps(sorted(set(fingerprints))), limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Content registry lookup failed: %s", e)
+            return []
+        return [row[0] for row in rows]
+    
+    def page_texts(self, topic_id: str) -> Dict[str, str]:
+        """Extracted text of a topic's pages, keyed by page fingerprint."""
+        if self._db is None:
+            return {}
+        try:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT fingerprint, text FROM pages WHERE topic_id = ?", (topic_id,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Content registry lookup failed: %s", e)
+            return {}
+        return dict(rows)
+    
+    def register(self, topic_id: str, file_hash: str, fingerprints: List[str], page_texts: List[str]):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM pages WHERE topic_id = ?", (topic_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO topics VALUES (?, ?, ?)", (topic_id, file_hash, time.time())
+                )
+                self._db.executemany(
+                    "INSERT INTO pages VALUES (?, ?, ?, ?)",
+                    [(topic_id, page_number, fingerprint, text)
+                     for page_number, (fingerprint, text) in enumerate(zip(fingerprints, page_texts))],
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Could not register content of topic %s: %s", topic_id, e)
+    
+    def forget(self, topic_id: str):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM pages WHERE topic_id = ?", (topic_id,))
+                self._db.execute("DELETE FROM topics WHERE topic_id = ?", (topic_id,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Could not remove topic %s from the content registry: %s", topic_id, e)
+
+
+content_registry = ContentRegistry()
@@ -1,114 +1,232 @@
 import logging
 import os
+import pickle
+import threading
 import numpy as np
+from scipy import sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-import pickle
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from app.core.config import settings
+from app.services.cache import LRUCache
+from app.services.tfidf_model import TfidfModel
 
 logger = logging.getLogger(__name__)
 
+# Per-topic vectorizers loaded for query-time transforms, keyed by topic_id.
+vectorizer_cache = LRUCache(
+    "vectorizer",
+    max_entries=settings.VECTORIZER_CACHE_MAX_ENTRIES,
+    max_bytes=settings.VECTORIZER_CACHE_MAX_BYTES,
+)
+
 class EmbeddingService:
     """
     Shared TF-IDF embedding utility.
     Supports logical namespaces (e.g. `chunks`, `images`) so that
     we can experiment with different vocabularies without breaking
-    previously stored indices.
+    previously stored indices. Topic chunks get their own vectorizer,
+    fitted on that topic's text and stored next to its index with a
+    version hash the VectorStore checks at load.
+    
+    scikit-learn is only used to fit. Fitted vectorizers are stored as
+    `TfidfModel` arrays (`.npy`, memory-mapped on load) and transforms
+    run on those, so workers share pages and never unpickle anything.
     """
     _instance = None
-    _vectorizers: Dict[str, TfidfVectorizer] = {}
-    _vectorizer_paths: Dict[str, str] = {}
+    _models: Dict[str, TfidfModel] = {}
+    _fit_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(EmbeddingService, cls).__new__(cls)
         return cls._instance
     
-    def _get_vectorizer_path(self, namespace: str) -> str:
-        if namespace not in self._vectorizer_paths:
-            filename = f"tfidf_{namespace}_vectorizer.pkl"
-            self._vectorizer_paths[namespace] = os.path.join(settings.VECTOR_DIR, filename)
-        return self._vectorizer_paths[namespace]
+    def _get_vectorizer_prefix(self, namespace: str) -> str:
+        return os.path.join(settings.VECTOR_DIR, f"tfidf_{namespace}_vectorizer")
+    
+    def _get_topic_vectorizer_prefix(self, topic_id: str) -> str:
+        return os.path.join(settings.VECTOR_DIR, f"{topic_id}_vectorizer")
+    
+    @staticmethod
+    def _fit(texts: list) -> Tuple[TfidfModel, sp.csr_matrix]:
+        vectorizer = TfidfVectorizer(max_features=settings.TFIDF_MAX_FEATURES, stop_words='english')
+        embeddings = vectorizer.fit_transform(texts)
+        return TfidfModel.from_vectorizer(vectorizer), embeddings
+    
+    def _load_model(self, prefix: str) -> Optional[TfidfModel]:
+        """
+        Load a stored model, converting a legacy `{prefix}.pkl` vectorizer
+        once if pickle migration is allowed.
+        """
+        if TfidfModel.exists(prefix):
+            return TfidfModel.load(prefix, mmap=settings.VECTORIZER_MMAP)
+        
+        legacy_path = f"{prefix}.pkl"
+        if not os.path.exists(legacy_path):
+            return None
+        if not settings.ALLOW_PICKLE_MIGRATION:
+            logger.warning("Ignoring pickled vectorizer %s (ALLOW_PICKLE_MIGRATION is off)", legacy_path)
+            return None
+        
+        with open(legacy_path, 'rb') as f:
+            vectorizer = pickle.load(f)
+        TfidfModel.from_vectorizer(vectorizer).save(prefix)
+        os.remove(legacy_path)
+        logger.info("Migrated pickled vectorizer %s to .npy arrays", legacy_path)
+        return TfidfModel.load(prefix, mmap=settings.VECTORIZER_MMAP)
     
-    def _get_or_create_vectorizer(self, namespace: str) -> TfidfVectorizer:
-        if namespace in self._vectorizers:
-            return self._vectorizers[namespace]
+    def _get_model(self, namespace: str) -> Optional[TfidfModel]:
+        """Return the fitted model for a namespace, or None before its first fit."""
+        model = self._models.get(namespace)
+        if model is not None:
+            return model
         
-        vectorizer_path = self._get_vectorizer_path(namespace)
         try:
-            if os.path.exists(vectorizer_path):
-                with open(vectorizer_path, 'rb') as f:
-                    vectorizer = pickle.load(f)
-                logger.info("Loaded TF-IDF vectorizer for namespace '%s'", namespace)
-            else:
-                vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-                logger.info("Created TF-IDF vectorizer for namespace '%s'", namespace)
+            model = self._load_model(self._get_vectorizer_prefix(namespace))
         except Exception as e:
             logger.exception("Error loading vectorizer '%s': %s", namespace, e)
-            vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+            model = None
+        if model is not None:
+            self._models[namespace] = model
+            logger.info("Loaded TF-IDF vectorizer for namespace '%s'", namespace)
+        return model
+    
+    def _get_topic_model(self, topic_id: str) -> Optional[TfidfModel]:
+        """Return a topic's model, or None if it has none (legacy topics)."""
+        prefix = self._get_topic_vectorizer_prefix(topic_id)
+        try:
+            mtime = os.stat(TfidfModel.paths(prefix)[2]).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        if mtime is not None:
+            cached = vectorizer_cache.get(topic_id, is_valid=lambda entry: entry[0] == mtime)
+            if cached is not None:
+                return cached[1]
+        
+        model = self._load_model(prefix)
+        if model is None:
+            return None
+        mtime = os.stat(TfidfModel.paths(prefix)[2]).st_mtime_ns
+        vectorizer_cache.put(topic_id, (mtime, model), nbytes=model.nbytes)
+        logger.info("Loaded TF-IDF vectorizer for topic %s (version %s)", topic_id, model.version)
+        return model
+    
+    def get_vectorizer_version(self, topic_id: str) -> Optional[str]:
+        """Version hash of a topic's vectorizer, or None for topics using a shared namespace."""
+        model = self._get_topic_model(topic_id)
+        return model.version if model else None
+    
+    def fit_topic_embeddings(self, topic_id: str, texts: list, sparse: bool = False):
+        """
+        Fit a fresh vectorizer on one topic's texts, persist it and return
+        `(embeddings, version)`.
+        """
+        if not texts:
+            raise ValueError("No texts provided for embedding generation.")
         
-        self._vectorizers[namespace] = vectorizer
-        return vectorizer
+        try:
+            logger.info("Fitting TF-IDF vectorizer on %s texts (topic=%s)", len(texts), topic_id)
+            model, embeddings = self._fit(texts)
+            model.save(self._get_topic_vectorizer_prefix(topic_id), topic_id=topic_id)
+            vectorizer_cache.invalidate(topic_id)
+            logger.info("Saved TF-IDF vectorizer for topic %s (version %s)", topic_id, model.version)
+            return self._finalize(embeddings, sparse), model.version
+        except Exception as e:
+            raise Exception(f"Error generating embeddings for topic '{topic_id}': {str(e)}")
     
-    def _save_vectorizer(self, namespace: str):
-        """Persist a namespace-scoped vectorizer to disk."""
+    def copy_topic_vectorizer(self, source_topic_id: str, topic_id: str) -> Optional[str]:
+        """
+        Give `topic_id` the vectorizer of `source_topic_id` so vectors copied
+        from that topic stay comparable. Returns the version, or None when the
+        source uses a shared namespace.
+        """
+        model = self._get_topic_model(source_topic_id)
+        if model is None:
+            return None
         try:
-            vectorizer = self._vectorizers.get(namespace)
-            if vectorizer is None:
-                return
-            
-            path = self._get_vectorizer_path(namespace)
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            with open(path, 'wb') as f:
-                pickle.dump(vectorizer, f)
-            logger.info("Saved TF-IDF vectorizer for namespace '%s'", namespace)
+            model.save(self._get_topic_vectorizer_prefix(topic_id), topic_id=topic_id)
+            vectorizer_cache.invalidate(topic_id)
+            return model.version
         except Exception as e:
-            logger.exception("Error saving vectorizer '%s': %s", namespace, e)
+            raise Exception(f"Error copying vectorizer to topic '{topic_id}': {str(e)}")
     
-    def generate_embeddings(self, texts: list, namespace: str = "chunks") -> np.ndarray:
+    def _resolve_model(self, namespace: str, topic_id: Optional[str]) -> Optional[TfidfModel]:
+        if topic_id is not None:
+            model = self._get_topic_model(topic_id)
+            if model is not None:
+                return model
+        return self._get_model(namespace)
+    
+    def generate_embeddings(self, texts: list, namespace: str = "chunks", sparse: bool = False,
+                            topic_id: Optional[str] = None):
         """
         Generate TF-IDF embeddings for a list of texts in a namespace.
         The first call for a namespace will fit the vectorizer; subsequent
         calls reuse the learned vocabulary to keep dimensions stable.
+        When `topic_id` has its own vectorizer, that one is used instead.
+        With `sparse=True` the float32 CSR matrix is returned as-is instead
+        of being densified.
         """
         if not texts:
             raise ValueError("No texts provided for embedding generation.")
         
         try:
-            vectorizer = self._get_or_create_vectorizer(namespace)
             logger.info("Generating TF-IDF embeddings for %s texts (namespace='%s')", len(texts), namespace)
+            model = self._resolve_model(namespace, topic_id)
+            if model is None:
+                with self._fit_lock:
+                    model = self._get_model(namespace)
+                    if model is None:
+                        model, embeddings = self._fit(texts)
+                        model.save(self._get_vectorizer_prefix(namespace), namespace=namespace)
+                        self._models[namespace] = model
+                        logger.info("Saved TF-IDF vectorizer for namespace '%s'", namespace)
+                        embeddings = self._finalize(embeddings, sparse)
+                        logger.info("Generated embeddings with shape %s (namespace='%s')", embeddings.shape, namespace)
+                        return embeddings
             
-            if not hasattr(vectorizer, 'vocabulary_') or len(vectorizer.vocabulary_) == 0:
-                embeddings = vectorizer.fit_transform(texts).toarray()
-                self._save_vectorizer(namespace)
-            else:
-                embeddings = vectorizer.transform(texts).toarray()
-            
+            embeddings = self._finalize(model.transform(texts), sparse)
             logger.info("Generated embeddings with shape %s (namespace='%s')", embeddings.shape, namespace)
             return embeddings
             
         except Exception as e:
             raise Exception(f"Error generating embeddings for namespace '{namespace}': {str(e)}")
     
-    def generate_single_embedding(self, text: str, namespace: str = "chunks") -> np.ndarray:
+    @staticmethod
+    def _finalize(embeddings, sparse: bool):
+        if sparse:
+            return sp.csr_matrix(embeddings, dtype=np.float32)
+        return embeddings.toarray()
+    
+    def generate_single_embedding(self, text: str, namespace: str = "chunks", sparse: bool = False,
+                                  topic_id: Optional[str] = None):
+        """
+        Generate embedding for a single text using the topic's vectorizer,
+        falling back to the namespace vectorizer for legacy topics.
+        Sparse embeddings are returned as a 1 x n_features CSR matrix.
+        """
+        embedding = self.generate_query_embeddings([text], namespace=namespace, sparse=sparse, topic_id=topic_id)
+        return embedding if sparse else embedding[0]
+    
+    def generate_query_embeddings(self, texts: list, namespace: str = "chunks", sparse: bool = False,
+                                  topic_id: Optional[str] = None):
         """
-        Generate embedding for a single text using the namespace vectorizer.
+        Embed query texts in one transform with an already fitted vectorizer.
+        Unlike `generate_embeddings`, this never fits a new vocabulary.
         """
         try:
-            vectorizer = self._get_or_create_vectorizer(namespace)
-            if not hasattr(vectorizer, 'vocabulary_') or len(vectorizer.vocabulary_) == 0:
+            model = self._resolve_model(namespace, topic_id)
+            if model is None:
                 raise Exception(f"Vectorizer for namespace '{namespace}' is not initialized. "
                                 "Please index some content first.")
             
-            embedding = vectorizer.transform([text]).toarray()
-            return embedding[0]
+            return self._finalize(model.transform(texts), sparse)
             
         except Exception as e:
-            raise Exception(f"Error generating single embedding for namespace '{namespace}': {str(e)}")
+            raise Exception(f"Error generating query embeddings for namespace '{namespace}': {str(e)}")
     
     def get_vocabulary_size(self, namespace: str = "chunks") -> int:
         """Get the vocabulary size for a namespace."""
-        vectorizer = self._get_or_create_vectorizer(namespace)
-        if vectorizer and hasattr(vectorizer, 'vocabulary_'):
-            return len(vectorizer.vocabulary_)
-        return 0
\ No newline at end of file
+        model = self._get_model(namespace)
+        return model.vocabulary_size if model else 0
@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.services.metrics import run_traced
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerLane:
+    """
+    A named, bounded pool that blocking work is pushed onto from async handlers.
+    Concurrency is capped by the pool size; anything beyond it waits in the
+    pool's queue and is reported as queue depth.
+    """
+    def __init__(self, name: str, max_workers: int, use_processes: bool = False):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+    
+    @property
+    def executor(self) -> Executor:
+        # Created lazily so importing the app never forks or spawns workers
+        with self._lock:
+            if self._executor is None:
+                if self.use_processes:
+                    context = multiprocessing.get_context(settings.PROCESS_START_METHOD)
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=f"{self.name}-worker"
+                    )
+                logger.info(
+                    "Started %s lane with %s %s",
+                    self.name,
+                    self.max_workers,
+                    "processes" if self.use_processes else "threads",
+                )
+            return self._executor
+    
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule `func` on this lane and return a concurrent future."""
+        executor = self.executor
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.use_processes:
+                future = executor.submit(func, *args, **kwargs)
+            else:
+                # Threads run in a copy of the caller's context, so request
+                # traces (see app.services.metrics) follow the work here
+                future = executor.submit(contextvars.copy_context().run, run_traced, func, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+    
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `func` on this lane without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+    
+    def _on_done(self, future: Future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+    
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = min(self.in_flight, self.max_workers)
+            return {
+                "kind": "process" if self.use_processes else "thread",
+                "max_workers": self.max_workers,
+                "active": active,
+                "queue_depth": self.in_flight - active,
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+class ExecutorService:
+    """
+    Worker lanes that keep blocking work off the asyncio event loop:
+    `query` threads for chat retrieval (FAISS/NumPy release the GIL),
+    `retrieval` threads for the keyword search that runs next to a query's
+    vector search, `ingest` threads for embedding and indexing uploads, and
+    a `pdf` process pool for GIL-bound PyPDF2 parsing. Chat and ingest use
+    separate lanes so a large upload never queues ahead of a question.
+    `retrieval` tasks never wait on other tasks, so `query` workers can
+    block on them without deadlocking.
+    """
+    def __init__(self):
+        self.query = WorkerLane("query", settings.QUERY_THREAD_WORKERS)
+        self.retrieval = WorkerLane("retrieval", settings.RETRIEVAL_THREAD_WORKERS)
+        self.ingest = WorkerLane("ingest", settings.INGEST_THREAD_WORKERS)
+        self.pdf = WorkerLane("pdf", settings.PDF_PROCESS_WORKERS, use_processes=True)
+    
+    @property
+    def lanes(self) -> Dict[str, WorkerLane]:
+        return {lane.name: lane for lane in (self.query, self.retrieval, self.ingest, self.pdf)}
+    
+    def shutdown(self, wait: bool = True):
+        for lane in self.lanes.values():
+            lane.shutdown(wait=wait)
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+executor_service = ExecutorService()
@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+# One fused hit: (chunk row, fused score, vector similarity, BM25 score)
+FusedHit = Tuple[int, float, float, float]
+
+
+def _ranked(scores: np.ndarray, rows: np.ndarray) -> Dict[int, Tuple[int, float]]:
+    """Row -> (rank from 1, score) for one retriever's padded result row."""
+    ranked = {}
+    for rank, (row, score) in enumerate(zip(rows.tolist(), scores.tolist()), start=1):
+        if row >= 0 and row not in ranked:
+            ranked[row] = (rank, score)
+    return ranked
+
+
+def fuse(vector_scores: np.ndarray, vector_rows: np.ndarray,
+         keyword_scores: np.ndarray, keyword_rows: np.ndarray, k: int,
+         method: Optional[str] = None, vector_weight: Optional[float] = None) -> List[List[FusedHit]]:
+    """
+    Merge the vector and BM25 result lists of each query into one top-k list.
+    
+    `rrf` (reciprocal rank fusion) scores a chunk `w / (HYBRID_RRF_K + rank)`
+    summed over the lists it appears in, which needs no score calibration.
+    `weighted` adds the cosine similarity and the BM25 score divided by the
+    query's best BM25 score, weighted `w` and `1 - w`. `w` is the vector
+    weight (HYBRID_VECTOR_WEIGHT). Ties go to the better vector rank.
+    """
+    method = method or settings.HYBRID_FUSION
+    vector_weight = settings.HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight
+    keyword_weight = 1.0 - vector_weight
+    if method not in ("rrf", "weighted"):
+        raise ValueError(f"Unknown fusion method '{method}', expected 'rrf' or 'weighted'")
+    
+    fused = []
+    for query in range(len(vector_rows)):
+        vector_hits = _ranked(vector_scores[query], vector_rows[query])
+        keyword_hits = _ranked(keyword_scores[query], keyword_rows[query])
+        best_keyword = max((score for _, score in keyword_hits.values()), default=0.0) or 1.0
+        
+        candidates = []
+        for row in vector_hits.keys() | keyword_hits.keys():
+            vector_rank, similarity = vector_hits.get(row, (None, 0.0))
+            keyword_rank, keyword_score = keyword_hits.get(row, (None, 0.0))
+            if method == "rrf":
+                score = sum(
+                    weight / (settings.HYBRID_RRF_K + rank)
+                    for weight, rank in ((vector_weight, vector_rank), (keyword_weight, keyword_rank))
+                    if rank is not None
+                )
+            else:
+                score = vector_weight * similarity + keyword_weight * keyword_score / best_keyword
+            tie_break = vector_rank if vector_rank is not None else len(vector_rows[query]) + keyword_rank
+            candidates.append((-score, tie_break, row, similarity, keyword_score))
+        candidates.sort()
+        fused.append([(row, -negative, similarity, keyword_score)
+                      for negative, _, row, similarity, keyword_score in candidates[:k]])
+    return fused
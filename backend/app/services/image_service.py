@@ -1,19 +1,116 @@
 import logging
 import os
 import json
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Any, NamedTuple, Optional, Sequence, Tuple
 import numpy as np
 from app.core.config import settings
+from app.services.cache import LRUCache
 from app.services.embedding_service import EmbeddingService
 
 logger = logging.getLogger(__name__)
 
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalise rows; all-zero rows stay zero so they score 0."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros(matrix.shape, dtype=np.float32), where=norms != 0)
+
+
+class ImageRecord(NamedTuple):
+    """One diagram's metadata, as stored in the topic's image metadata JSON."""
+    id: str
+    filename: str
+    title: str
+    keywords: Tuple[str, ...]
+    description: str
+    
+    @classmethod
+    def from_dict(cls, image: Dict[str, Any]) -> "ImageRecord":
+        return cls(
+            id=image["id"],
+            filename=image["filename"],
+            title=image["title"],
+            keywords=tuple(image.get("keywords", ())),
+            description=image.get("description", ""),
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "title": self.title,
+            "keywords": list(self.keywords),
+            "description": self.description,
+        }
+
+
+class ImageMatch(NamedTuple):
+    """A ranked image: the catalog's record (shared, not copied) and its score."""
+    image: ImageRecord
+    similarity_score: float
+    
+    @property
+    def id(self) -> str:
+        return self.image.id
+    
+    @property
+    def filename(self) -> str:
+        return self.image.filename
+    
+    @property
+    def title(self) -> str:
+        return self.image.title
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.image.to_dict(), "similarity_score": self.similarity_score}
+
+
+@dataclass(frozen=True)
+class ImageCatalog:
+    """
+    One topic's diagrams and their L2-normalised embedding matrix. Built once
+    per metadata file version and never mutated, so it is shared between
+    threads without locks, and rankings refer to its records directly.
+    """
+    topic_id: str
+    images: Tuple[ImageRecord, ...]
+    matrix: np.ndarray
+    mtime: int
+    
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+    
+    def rank(self, query_embeddings: np.ndarray, top_k: int) -> List[List[ImageMatch]]:
+        """Top `top_k` images per query row, best first, with `similarity_score`."""
+        similarities = _normalize_rows(query_embeddings) @ self.matrix.T
+        k = min(top_k, len(self.images))
+        if k <= 0:
+            return [[] for _ in range(similarities.shape[0])]
+        
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            scores = similarities[row, candidates]
+            # Ties keep catalogue order
+            order = np.lexsort((candidates, -scores))
+            results.append([
+                ImageMatch(self.images[idx], float(similarities[row, idx])) for idx in candidates[order]
+            ])
+        return results
+
+
+# Image catalogs keyed by topic_id, validated against the metadata file mtime.
+image_catalog_cache = LRUCache("image_catalog", max_entries=settings.IMAGE_CATALOG_CACHE_MAX_ENTRIES)
+
 class ImageService:
+    """
+    Stateless front end to the per-topic image catalogs. All topic data
+    lives in `image_catalog_cache`, so one instance serves concurrent
+    requests for different topics.
+    """
     def __init__(self):
         self.embedding_service = EmbeddingService()
-        self.images_metadata: List[Dict[str, Any]] = []
-        self.image_embeddings_cache: Dict[str, np.ndarray] = {}
-        self.current_topic_id: Optional[str] = None
     
     def create_sample_images(self, topic_id: str) -> List[Dict[str, Any]]:
         """
@@ -64,124 +161,123 @@ class ImageService:
             }
         ]
         
-        self.images_metadata = sample_images
-        self.current_topic_id = topic_id
-        self._save_metadata(topic_id)
-        self._generate_image_embeddings(topic_id)
+        self._save_metadata(topic_id, sample_images)
+        self._load_catalog(topic_id)
         return sample_images
     
-    def _save_metadata(self, topic_id: str):
-        metadata_path = os.path.join(settings.METADATA_DIR, f"{topic_id}_images.json")
+    def _metadata_path(self, topic_id: str) -> str:
+        return os.path.join(settings.METADATA_DIR, f"{topic_id}_images.json")
+    
+    def _save_metadata(self, topic_id: str, images: List[Dict[str, Any]]):
+        metadata_path = self._metadata_path(topic_id)
         os.makedirs(settings.METADATA_DIR, exist_ok=True)
         metadata = {
             "topic_id": topic_id,
-            "images": self.images_metadata,
-            "total_images": len(self.images_metadata)
+            "images": images,
+            "total_images": len(images)
         }
-        with open(metadata_path, 'w') as f:
+        tmp_path = f"{metadata_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(metadata, f, indent=2)
+        os.replace(tmp_path, metadata_path)
         logger.info("Saved image metadata for topic %s", topic_id)
     
-    def _generate_image_embeddings(self, topic_id: str):
+    def _generate_image_embeddings(self, images: Sequence[ImageRecord]) -> np.ndarray:
         """
-        Generate embeddings for the currently loaded topic images and cache them.
+        Embed image titles, descriptions and keywords in the shared `images` namespace.
         """
-        if not self.images_metadata:
-            self.image_embeddings_cache.pop(topic_id, None)
-            return
+        image_texts = [
+            f"{image.title}. {image.description}. Keywords: {', '.join(image.keywords)}"
+            for image in images
+        ]
+        return self.embedding_service.generate_embeddings(image_texts, namespace="images")
+    
+    def _load_catalog(self, topic_id: str) -> Optional[ImageCatalog]:
+        try:
+            mtime = os.stat(self._metadata_path(topic_id)).st_mtime_ns
+        except OSError:
+            logger.warning("No image metadata found for topic %s", topic_id)
+            return None
+        
+        catalog = image_catalog_cache.get(topic_id, is_valid=lambda entry: entry.mtime == mtime)
+        if catalog is not None:
+            return catalog
         
         try:
-            image_texts = [
-                f"{image['title']}. {image['description']}. Keywords: {', '.join(image['keywords'])}"
-                for image in self.images_metadata
-            ]
-            embeddings = self.embedding_service.generate_embeddings(image_texts, namespace="images")
-            self.image_embeddings_cache[topic_id] = embeddings
-            logger.info("Generated embeddings for %s images (topic=%s)", len(image_texts), topic_id)
+            with open(self._metadata_path(topic_id), 'r') as f:
+                images = tuple(ImageRecord.from_dict(image) for image in json.load(f)["images"])
+            
+            if images:
+                matrix = _normalize_rows(self._generate_image_embeddings(images))
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            matrix.setflags(write=False)
+            catalog = ImageCatalog(topic_id=topic_id, images=images, matrix=matrix, mtime=mtime)
+            image_catalog_cache.put(topic_id, catalog, nbytes=catalog.nbytes)
+            logger.info("Loaded %s images for topic %s", len(images), topic_id)
+            return catalog
         except Exception as e:
-            logger.exception("Error generating image embeddings for topic %s: %s", topic_id, e)
-            self.image_embeddings_cache.pop(topic_id, None)
+            logger.exception("Error loading images for topic %s: %s", topic_id, e)
+            return None
     
-    def ensure_topic_images(self, topic_id: str) -> bool:
+    def get_catalog(self, topic_id: str) -> Optional[ImageCatalog]:
         """
-        Ensure metadata and embeddings exist for a topic. Creates sample metadata if needed.
+        Return the topic's image catalog, creating sample metadata if needed.
         """
-        if self.current_topic_id == topic_id and topic_id in self.image_embeddings_cache:
-            return True
-        
         if not self.image_exists(topic_id):
             self.create_sample_images(topic_id)
-            return True
-        
-        return self.load_images(topic_id)
+        return self._load_catalog(topic_id)
+    
+    def ensure_topic_images(self, topic_id: str) -> bool:
+        """
+        Ensure metadata and embeddings exist for a topic. Creates sample metadata if needed.
+        """
+        return self.get_catalog(topic_id) is not None
     
     def load_images(self, topic_id: str) -> bool:
-        try:
-            metadata_path = os.path.join(settings.METADATA_DIR, f"{topic_id}_images.json")
-            if not os.path.exists(metadata_path):
-                logger.warning("No image metadata found for topic %s", topic_id)
-                return False
-            
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-                self.images_metadata = metadata["images"]
-            
-            self.current_topic_id = topic_id
-            self._generate_image_embeddings(topic_id)
-            logger.info("Loaded %s images for topic %s", len(self.images_metadata), topic_id)
-            return True
-        except Exception as e:
-            logger.exception("Error loading images for topic %s: %s", topic_id, e)
-            return False
+        return self._load_catalog(topic_id) is not None
     
-    def find_relevant_image(self, topic_id: str, query: str, top_k: int = 1) -> List[Dict[str, Any]]:
+    def find_relevant_image(self, topic_id: str, query: str, top_k: int = 1) -> List[ImageMatch]:
         """
         Find the most relevant image for a query using embedding similarity.
         """
-        if not self.ensure_topic_images(topic_id):
+        logger.info("Finding relevant image for query '%s' (topic=%s)", query, topic_id)
+        return self.find_relevant_images(topic_id, [query], top_k=top_k)[0]
+    
+    def find_relevant_images(self, topic_id: str, queries: List[str], top_k: int = 1) -> List[List[ImageMatch]]:
+        """
+        Rank the topic's images for many queries at once: one embedding
+        transform and one (queries x images) product against the catalog's
+        pre-normalised matrix.
+        """
+        empty = [[] for _ in queries]
+        if not queries:
+            return empty
+        catalog = self.get_catalog(topic_id)
+        if catalog is None:
             logger.error("Unable to prepare images for topic %s", topic_id)
-            return []
-        
-        embeddings = self.image_embeddings_cache.get(topic_id)
-        if embeddings is None or embeddings.size == 0:
-            logger.warning("No cached image embeddings available for topic %s", topic_id)
-            return []
+            return empty
+        if not catalog.images:
+            logger.warning("No image embeddings available for topic %s", topic_id)
+            return empty
         
         try:
-            logger.info("Finding relevant image for query '%s' (topic=%s)", query, topic_id)
-            query_embedding = self.embedding_service.generate_single_embedding(query, namespace="images")
-            
-            similarities = []
-            for i, image_embedding in enumerate(embeddings):
-                query_norm = np.linalg.norm(query_embedding)
-                image_norm = np.linalg.norm(image_embedding)
-                similarity = 0.0
-                if query_norm != 0 and image_norm != 0:
-                    similarity = float(np.dot(query_embedding, image_embedding) / (query_norm * image_norm))
-                similarities.append((similarity, i))
-            
-            similarities.sort(key=lambda x: x[0], reverse=True)
-            results = []
-            for similarity, idx in similarities[:top_k]:
-                if idx < len(self.images_metadata):
-                    image_data = self.images_metadata[idx].copy()
-                    image_data["similarity_score"] = similarity
-                    results.append(image_data)
-            
-            logger.info("Found %s relevant images for topic %s", len(results), topic_id)
+            query_embeddings = self.embedding_service.generate_query_embeddings(queries, namespace="images")
+            results = catalog.rank(query_embeddings, top_k)
+            logger.info("Ranked images for %s queries (topic=%s)", len(queries), topic_id)
             return results
         except Exception as e:
             logger.exception("Error finding relevant image for topic %s: %s", topic_id, e)
-            return []
+            return empty
     
     def get_all_images(self, topic_id: str) -> List[Dict[str, Any]]:
         """
-        Return the cached image metadata for a topic, ensuring it is loaded.
+        Return the image metadata for a topic, ensuring it is loaded.
         """
-        if not self.ensure_topic_images(topic_id):
+        catalog = self.get_catalog(topic_id)
+        if catalog is None:
             return []
-        return self.images_metadata
+        return [image.to_dict() for image in catalog.images]
     
     def image_exists(self, topic_id: str) -> bool:
-        metadata_path = os.path.join(settings.METADATA_DIR, f"{topic_id}_images.json")
-        return os.path.exists(metadata_path)
\ No newline at end of file
+        return os.path.exists(self._metadata_path(topic_id))
\ No newline at end of file
@@ -0,0 +1,146 @@
+import logging
+import math
+import os
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import faiss
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# flat_l2 is the original brute-force L2 index and is kept for old topics
+INDEX_TYPES = ("flat_l2", "flat_ip", "ivf_flat", "hnsw_flat")
+COSINE_INDEX_TYPES = {"flat_ip", "ivf_flat", "hnsw_flat"}
+LEGACY_INDEX_TYPES = {"FlatL2": "flat_l2", "SparseInvertedIP": "sparse_ip"}
+# Zero-copy mapping of flat codes, IVF lists and HNSW storage (faiss >= 1.9; older releases map IVF lists only)
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def normalize_index_type(index_type: str) -> str:
+    return LEGACY_INDEX_TYPES.get(index_type, index_type)
+
+
+def is_cosine(index_type: str) -> bool:
+    return normalize_index_type(index_type) in COSINE_INDEX_TYPES
+
+
+def choose_index_type(num_vectors: int, requested: str = "auto") -> str:
+    """
+    Resolve the configured index type. `auto` uses exact cosine search for
+    normal chapters and an IVF index once a topic is large enough for
+    approximate search to pay off.
+    """
+    if requested != "auto":
+        index_type = normalize_index_type(requested)
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{requested}'. Expected one of {INDEX_TYPES} or 'auto'.")
+        return index_type
+    return "ivf_flat" if num_vectors >= settings.FAISS_ANN_MIN_VECTORS else "flat_ip"
+
+
+def prepare_vectors(vectors: np.ndarray, index_type: str) -> np.ndarray:
+    """Return a float32 copy, L2-normalised when the index scores by inner product."""
+    vectors = np.array(vectors, dtype=np.float32, order="C", copy=True)
+    if is_cosine(index_type):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(embeddings: np.ndarray, requested: str = "auto",
+                ids: Optional[np.ndarray] = None) -> Tuple[faiss.Index, str, Dict[str, Any]]:
+    """
+    Build and fill a FAISS index for dense embeddings.
+    Returns `(index, index_type, params)`; `params` holds the search-time
+    settings that must be re-applied after loading.
+    Vectors are stored under `ids` (default: their row numbers). Flat
+    indexes are wrapped in an ID map and IVF lists carry ids natively, so
+    both can later be updated with `remove_ids`/`add_with_ids`.
+    """
+    num_vectors, dimension = embeddings.shape
+    index_type = choose_index_type(num_vectors, requested)
+    vectors = prepare_vectors(embeddings, index_type)
+    params: Dict[str, Any] = {}
+    
+    if index_type == "flat_l2":
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    elif index_type == "flat_ip":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    elif index_type == "ivf_flat":
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        params = {"nlist": nlist, "nprobe": ivf_nprobe(nlist)}
+    else:
+        index = faiss.IndexHNSWFlat(dimension, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = max(40, 2 * settings.FAISS_HNSW_M)
+        params = {"M": settings.FAISS_HNSW_M, "efSearch": settings.FAISS_HNSW_EF_SEARCH}
+    
+    apply_search_params(index, params)
+    if supports_updates(index):
+        index.add_with_ids(vectors, ids if ids is not None else np.arange(num_vectors, dtype=np.int64))
+    else:
+        index.add(vectors)
+    logger.info("Built %s index for %s vectors (dimension=%s, params=%s)", index_type, num_vectors, dimension, params)
+    return index, index_type, params
+
+
+def supports_updates(index: faiss.Index) -> bool:
+    """
+    True if vectors can be removed and added by id. Plain flat indexes from
+    older releases and HNSW graphs cannot remove vectors and are rebuilt.
+    """
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF))
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Read a saved index. With `mmap` the vectors stay in the file's pages
+    instead of being copied to the heap, so every process serving the file
+    shares one copy in the page cache. A mapped index is read-only: adding or
+    removing vectors aborts the process, so it must never be updated.
+    """
+    if mmap:
+        return faiss.read_index(path, _MMAP_FLAGS)
+    return faiss.read_index(path)
+
+
+def write_index(index: faiss.Index, path: str):
+    """
+    Write through a temporary file and rename, so processes that have the
+    old file mapped keep reading it instead of a half-written one.
+    """
+    faiss.write_index(index, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def ivf_nprobe(nlist: int) -> int:
+    """
+    Lists probed per IVF query: FAISS_IVF_NPROBE, or a quarter of them.
+    TF-IDF vectors cluster loosely; at nlist/16, top-3 recall against exact
+    search was 0.62 for a 6k-chunk topic, and nlist/4 brings it to 0.87-0.95.
+    """
+    return min(nlist, settings.FAISS_IVF_NPROBE or max(1, nlist // 4))
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]):
+    if "nprobe" in params and hasattr(index, "nprobe"):
+        # Follows the current settings, so topics indexed earlier need no rebuild
+        index.nprobe = ivf_nprobe(params["nlist"]) if "nlist" in params else params["nprobe"]
+    if "efSearch" in params and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = params["efSearch"]
+
+
+def search(index: faiss.Index, index_type: str, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return `(cosine_similarities, indices)` for a batch of queries.
+    TF-IDF rows are unit length, so for legacy L2 indexes the squared
+    distance converts exactly: cos = 1 - d / 2. Zero queries score 0.
+    """
+    vectors = prepare_vectors(queries, index_type)
+    scores, indices = index.search(vectors, k)
+    if not is_cosine(index_type):
+        scores = 1.0 - scores / 2.0
+        scores[np.linalg.norm(vectors, axis=1) == 0] = 0.0
+    return np.clip(scores, -1.0, 1.0), indices
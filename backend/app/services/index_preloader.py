@@ -0,0 +1,169 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.image_service import ImageService
+from app.services.library_index import library_index
+from app.services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per call while pulling files into the page cache
+_READ_BLOCK = 1 << 20
+
+
+class IndexPreloader:
+    """
+    Loads the most recently indexed topics (index, chunk store, vectorizer
+    and image catalog) and the library index into this process's caches at
+    startup, so the first questions do not pay for loading them.
+    
+    Under INDEX_MMAP those are views of their files, and what is worth doing
+    once is reading the files into the page cache that every worker maps.
+    Workers take a file lock in turn; the first one of a server run reads
+    the files and leaves a stamp naming the run (the parent process that
+    started the workers) and the files' sizes and mtimes. The others find
+    the stamp and only map pages that are already warm.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.VECTOR_DIR
+        self.lock_path = os.path.join(self.directory, ".preload.lock")
+        self.stamp_path = os.path.join(self.directory, ".preload.json")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "state": "idle",
+            "topics": 0,
+            "failed": 0,
+            "warmed_bytes": 0,
+            "warmed_here": False,
+            "seconds": None,
+        }
+    
+    def recent_topics(self, limit: int) -> List[str]:
+        """Up to `limit` topic ids, most recently indexed first."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith("_metadata.json")]
+        except OSError:
+            return []
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        return [entry.name[:-len("_metadata.json")] for entry in entries[:limit]]
+    
+    def files(self, topic_ids: List[str]) -> List[str]:
+        """Files the topics are served from, plus the shared vectorizers and library shards."""
+        prefixes = tuple(f"{topic_id}{sep}" for topic_id in topic_ids for sep in (".", "_")) + ("tfidf_",)
+        paths = [
+            os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory))
+            if name.startswith(prefixes) and not name.endswith(".tmp")
+        ]
+        if os.path.isdir(settings.LIBRARY_DIR):
+            paths.extend(
+                os.path.join(settings.LIBRARY_DIR, name) for name in sorted(os.listdir(settings.LIBRARY_DIR))
+                if name.endswith(".npy")
+            )
+        return [path for path in paths if os.path.isfile(path)]
+    
+    @staticmethod
+    def _signature(paths: List[str]) -> str:
+        digest = hashlib.sha1()
+        for path in paths:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _read_through(paths: List[str]) -> int:
+        total = 0
+        buffer = bytearray(_READ_BLOCK)
+        for path in paths:
+            try:
+                with open(path, "rb", buffering=0) as f:
+                    while True:
+                        read = f.readinto(buffer)
+                        if not read:
+                            break
+                        total += read
+            except OSError as e:
+                # Replaced or removed meanwhile; the loads below read the current files
+                logger.debug("Could not warm %s: %s", path, e)
+        return total
+    
+    def warm_once(self, paths: List[str]) -> int:
+        """
+        Read `paths` into the page cache unless another worker of this server
+        run already has. Returns the bytes read here.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = {"server": os.getppid(), "signature": self._signature(paths)}
+        with open(self.lock_path, "w") as lock_file:
+            # Blocks while another worker warms, so nobody maps cold pages meanwhile
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.stamp_path, "r") as f:
+                        previous = json.load(f)
+                except (OSError, ValueError):
+                    previous = {}
+                if all(previous.get(key) == value for key, value in stamp.items()):
+                    return 0
+                
+                warmed = self._read_through(paths)
+                stamp.update(bytes=warmed, pid=os.getpid(), warmed_at=time.time())
+                tmp_path = f"{self.stamp_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(stamp, f)
+                os.replace(tmp_path, self.stamp_path)
+                return warmed
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def run(self) -> Dict[str, Any]:
+        """Preload up to INDEX_PRELOAD_MAX_TOPICS topics (default: what the index cache holds)."""
+        started = time.perf_counter()
+        self._update(state="running")
+        topic_ids = self.recent_topics(settings.INDEX_PRELOAD_MAX_TOPICS or settings.INDEX_CACHE_MAX_ENTRIES)
+        
+        warmed = 0
+        if settings.INDEX_MMAP:
+            try:
+                warmed = self.warm_once(self.files(topic_ids))
+            except Exception as e:
+                logger.warning("Could not warm the page cache: %s", e)
+        
+        loaded = failed = 0
+        image_service = ImageService()
+        for topic_id in topic_ids:
+            try:
+                # Also loads the topic's vectorizer into its cache
+                VectorStore(topic_id).load_index()
+                image_service.load_images(topic_id)
+                loaded += 1
+            except Exception as e:
+                failed += 1
+                logger.warning("Could not preload topic %s: %s", topic_id, e)
+        try:
+            library_index.topics()
+        except Exception as e:
+            logger.warning("Could not preload the library index: %s", e)
+        
+        seconds = round(time.perf_counter() - started, 3)
+        self._update(state="done", topics=loaded, failed=failed, warmed_bytes=warmed, warmed_here=warmed > 0,
+                     seconds=seconds)
+        logger.info("Preloaded %s topics in %.2fs (%s bytes read into the page cache by this worker)",
+                    loaded, seconds, warmed)
+        return self.stats()
+    
+    def _update(self, **fields: Any):
+        with self._lock:
+            self._stats.update(fields)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": settings.INDEX_PRELOAD, "mmap": settings.INDEX_MMAP, **self._stats}
+
+
+index_preloader = IndexPreloader()
@@ -0,0 +1,359 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.content_registry import content_registry
+from app.services.embedding_service import EmbeddingService
+from app.services.executor import executor_service
+from app.services.image_service import ImageService
+from app.services.library_index import library_index
+from app.services import metrics
+from app.services.pdf_processor import PDFProcessor
+from app.services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestionJobManager:
+    """
+    Runs PDF ingestion (match -> extract -> embed -> index -> library -> images) in the background.
+    Each job is persisted as `{job_id}.json` under JOB_DIR so any uvicorn worker
+    can answer status polls and unfinished jobs are resumed after a restart.
+    Concurrency is bounded by the executor's `ingest` lane.
+    
+    Uploads are matched against the content registry first. Pages an
+    earlier topic already has are not extracted again, and when that
+    topic's index can be updated in place only the chunks whose text
+    changed are embedded; the rest of its index is copied.
+    """
+    def __init__(self):
+        self.job_dir = settings.JOB_DIR
+        self.pdf_processor = PDFProcessor()
+        self.embedding_service = EmbeddingService()
+        self.image_service = ImageService()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.job_dir, exist_ok=True)
+    
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+    
+    def _persist(self, job: Dict[str, Any]):
+        path = self._job_path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def _update(self, job_id: str, **fields) -> Dict[str, Any]:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job["updated_at"] = time.time()
+            snapshot = dict(job, stage_timings=dict(job["stage_timings"]))
+        self._persist(snapshot)
+        return snapshot
+    
+    def _new_job(self, topic_id: str, pdf_path: Optional[str], filename: str,
+                 file_hash: Optional[str]) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "job_id": str(uuid.uuid4()),
+            "topic_id": topic_id,
+            "filename": filename,
+            "pdf_path": pdf_path,
+            "file_hash": file_hash,
+            "status": "queued",
+            "stage": "queued",
+            "pages_total": None,
+            "pages_processed": 0,
+            "pages_reused": 0,
+            "chunks_processed": 0,
+            "chunks_reused": 0,
+            "base_topic_id": None,
+            "deduplicated": False,
+            "error": None,
+            "stage_timings": {},
+            "owner_pid": os.getpid(),
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now,
+        }
+    
+    def find_indexed_topic(self, file_hash: str) -> Optional[str]:
+        """An existing topic built from the same file bytes, if it is still indexed."""
+        for topic_id in content_registry.topics_for_file(file_hash):
+            if VectorStore(topic_id).exists():
+                return topic_id
+            content_registry.forget(topic_id)
+        return None
+    
+    def record_duplicate(self, topic_id: str, filename: str, file_hash: str) -> Dict[str, Any]:
+        """Record an upload answered by an existing topic as an already completed job."""
+        job = self._new_job(topic_id, None, filename, file_hash)
+        job.update(status="completed", stage="completed", deduplicated=True,
+                   started_at=job["created_at"], finished_at=job["created_at"])
+        self._persist(job)
+        metrics.registry.inc("ingest_jobs_total", status="deduplicated")
+        logger.info("Upload of %s matches topic %s; skipping ingestion", filename, topic_id)
+        return job
+    
+    def submit(self, topic_id: str, pdf_path: str, filename: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Register a job for an already saved PDF and schedule it."""
+        job = self._new_job(topic_id, pdf_path, filename, file_hash)
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+        self._persist(job)
+        self._schedule(job["job_id"])
+        logger.info("Queued ingestion job %s for topic %s", job["job_id"], topic_id)
+        return dict(job)
+    
+    def _schedule(self, job_id: str):
+        executor_service.ingest.submit(self._run, job_id)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job snapshot, falling back to disk for jobs owned by other workers."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job, stage_timings=dict(job["stage_timings"]))
+        
+        path = self._job_path(job_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable job state %s: %s", path, e)
+            return None
+    
+    def _run_stage(self, job_id: str, stage: str, func, *args):
+        self._update(job_id, stage=stage)
+        started = time.perf_counter()
+        result = func(*args)
+        self._record_timing(job_id, stage, time.perf_counter() - started)
+        return result
+    
+    def _record_timing(self, job_id: str, stage: str, seconds: float):
+        metrics.record(stage, seconds, family="ingest_stage_seconds")
+        with self._lock:
+            self._jobs[job_id]["stage_timings"][stage] = round(seconds, 4)
+    
+    def _embed_chunks(self, topic_id: str, chunk_texts: List[str]):
+        """Return `(embeddings, vectorizer_version)` using the configured vectorizer scope."""
+        use_sparse = settings.VECTOR_BACKEND == "sparse"
+        if settings.VECTORIZER_SCOPE == "topic":
+            return self.embedding_service.fit_topic_embeddings(topic_id, chunk_texts, sparse=use_sparse)
+        embeddings = self.embedding_service.generate_embeddings(chunk_texts, namespace="chunks", sparse=use_sparse)
+        return embeddings, None
+    
+    def _find_base(self, fingerprints: List[str]) -> Tuple[Optional[str], Dict[int, str]]:
+        """
+        The indexed topic sharing the most pages with the upload, and the
+        text it already has for each of the upload's pages (by page number).
+        Returns `(None, {})` if no topic shares INCREMENTAL_MIN_SHARED_PAGES.
+        """
+        for topic_id in content_registry.candidate_bases(fingerprints):
+            if not VectorStore(topic_id).exists():
+                content_registry.forget(topic_id)
+                continue
+            texts = content_registry.page_texts(topic_id)
+            known_pages = {
+                page_num: texts[fingerprint]
+                for page_num, fingerprint in enumerate(fingerprints)
+                if fingerprint in texts
+            }
+            if len(known_pages) >= settings.INCREMENTAL_MIN_SHARED_PAGES * len(fingerprints):
+                return topic_id, known_pages
+        return None, {}
+    
+    def _plan_update(self, base_topic_id: str, topic_id: str, chunks: List[Dict[str, Any]]):
+        """
+        Load a copy of the base topic's index and match the new chunks to its
+        rows by text. Returns `(vector_store, base_rows)`, or None when the
+        index should be rebuilt: it cannot be updated in place, or more than
+        INCREMENTAL_MAX_NEW_CHUNKS of the chunks are new (the vectorizer,
+        fitted on the base text, would no longer describe the topic well).
+        """
+        try:
+            vector_store = VectorStore.derive(base_topic_id, topic_id)
+        except Exception as e:
+            logger.warning("Cannot reuse the index of topic %s: %s", base_topic_id, e)
+            return None
+        if not vector_store.supports_updates():
+            return None
+        
+        rows_by_text = defaultdict(deque)
+        for row, chunk in enumerate(vector_store.chunks):
+            rows_by_text[chunk["text"]].append(row)
+        base_rows = [
+            rows_by_text[chunk["text"]].popleft() if rows_by_text.get(chunk["text"]) else None
+            for chunk in chunks
+        ]
+        new_chunks = sum(row is None for row in base_rows)
+        if new_chunks > settings.INCREMENTAL_MAX_NEW_CHUNKS * len(chunks):
+            logger.info("%s of %s chunks changed since topic %s; rebuilding the index",
+                        new_chunks, len(chunks), base_topic_id)
+            return None
+        return vector_store, base_rows
+    
+    def _embed_new_chunks(self, base_topic_id: str, vector_store: VectorStore, chunk_texts: List[str]):
+        """Embed changed chunks with (a copy of) the base topic's vectorizer."""
+        topic_id = vector_store.topic_id
+        if vector_store.vectorizer_version is not None:
+            self.embedding_service.copy_topic_vectorizer(base_topic_id, topic_id)
+        if not chunk_texts:
+            return None
+        return self.embedding_service.generate_query_embeddings(
+            chunk_texts, namespace="chunks", sparse=vector_store.is_sparse, topic_id=topic_id
+        )
+    
+    def _run(self, job_id: str):
+        job = self._update(job_id, status="running", started_at=time.time())
+        topic_id = job["topic_id"]
+        pdf_path = job["pdf_path"]
+        try:
+            fingerprints = self.pdf_processor.page_fingerprints(pdf_path)
+            self._update(job_id, pages_total=len(fingerprints))
+            
+            base_topic_id, known_pages = self._run_stage(job_id, "matching", self._find_base, fingerprints)
+            self._update(job_id, base_topic_id=base_topic_id, pages_reused=len(known_pages),
+                         pages_processed=len(known_pages))
+            
+            # PyPDF2 holds the GIL, so page ranges are parsed in the process
+            # pool and chunked here as they arrive
+            result = self._run_stage(
+                job_id,
+                "extracting",
+                self.pdf_processor.process_pdf_from_path,
+                pdf_path,
+                topic_id,
+                executor_service.pdf,
+                lambda pages_done, _: self._update(job_id, pages_processed=len(known_pages) + pages_done),
+                known_pages,
+            )
+            # "extracting" split into waiting on PyPDF2 and chunking the pages
+            self._record_timing(job_id, "extract", result["extract_seconds"])
+            self._record_timing(job_id, "chunk", result["chunk_seconds"])
+            chunks = result["chunks"]
+            if not chunks:
+                raise Exception("No readable text found in PDF.")
+            self._update(job_id, chunks_processed=len(chunks))
+            chunk_texts = [chunk["text"] for chunk in chunks]
+            
+            update = self._plan_update(base_topic_id, topic_id, chunks) if base_topic_id else None
+            if update is not None:
+                vector_store, base_rows = update
+                new_texts = [chunk["text"] for chunk, row in zip(chunks, base_rows) if row is None]
+                new_embeddings = self._run_stage(
+                    job_id, "embedding", self._embed_new_chunks, base_topic_id, vector_store, new_texts
+                )
+                
+                def update_index():
+                    vector_store.update_index(chunks, base_rows, new_embeddings)
+                    vector_store.save_index()
+                self._run_stage(job_id, "indexing", update_index)
+                self._update(job_id, chunks_reused=len(chunks) - len(new_texts))
+            else:
+                embeddings, vectorizer_version = self._run_stage(
+                    job_id, "embedding", self._embed_chunks, topic_id, chunk_texts
+                )
+                
+                def build_index():
+                    vector_store = VectorStore(topic_id)
+                    vector_store.create_index(embeddings, chunks, vectorizer_version=vectorizer_version)
+                    vector_store.save_index()
+                self._run_stage(job_id, "indexing", build_index)
+            
+            # The topic's own index is already usable; a library failure
+            # only hides it from cross-topic search
+            try:
+                self._run_stage(job_id, "library", library_index.add_topic, topic_id, chunk_texts)
+            except Exception as e:
+                logger.exception("Could not add topic %s to the library index: %s", topic_id, e)
+            
+            self._run_stage(job_id, "images", self.image_service.create_sample_images, topic_id)
+            
+            if job.get("file_hash"):
+                content_registry.register(topic_id, job["file_hash"], fingerprints, result["pages"])
+            
+            self._update(job_id, status="completed", stage="completed", pages_processed=len(fingerprints),
+                         finished_at=time.time())
+            metrics.registry.inc("ingest_jobs_total", status="completed")
+            logger.info("Ingestion job %s complete | topic=%s chunks=%s", job_id, topic_id, len(chunks))
+        except Exception as e:
+            logger.exception("Ingestion job %s failed: %s", job_id, e)
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            metrics.registry.inc("ingest_jobs_total", status="failed")
+        finally:
+            self._release_claims(job_id)
+    
+    def _release_claims(self, job_id: str):
+        for claim_path in glob.glob(os.path.join(self.job_dir, f"{job_id}.*.claim")):
+            try:
+                os.remove(claim_path)
+            except OSError:
+                pass
+    
+    def resume_pending(self) -> List[str]:
+        """
+        Re-queue unfinished jobs whose owning process is gone (e.g. after a
+        restart). A claim file per (job, dead owner) makes sure only one worker
+        picks each job up. Jobs whose PDF no longer exists are marked failed.
+        """
+        resumed = []
+        for filename in sorted(os.listdir(self.job_dir)):
+            if not filename.endswith(".json"):
+                continue
+            job_id = filename[:-len(".json")]
+            job = self.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES or _pid_alive(job.get("owner_pid")):
+                continue
+            
+            claim_path = os.path.join(self.job_dir, f"{job_id}.{job.get('owner_pid')}.claim")
+            try:
+                os.close(os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            
+            job.update(owner_pid=os.getpid(), stage_timings={})
+            with self._lock:
+                self._jobs[job_id] = job
+            if not os.path.exists(job["pdf_path"]):
+                self._update(job_id, status="failed", error="Uploaded PDF is missing; please upload again.",
+                             finished_at=time.time())
+                self._release_claims(job_id)
+                continue
+            
+            self._update(job_id, status="queued", stage="queued", pages_processed=0, error=None)
+            self._schedule(job_id)
+            resumed.append(job_id)
+        
+        if resumed:
+            logger.info("Resumed %s unfinished ingestion jobs", len(resumed))
+        return resumed
+
+
+ingestion_job_manager = IngestionJobManager()
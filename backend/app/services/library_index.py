@@ -0,0 +1,307 @@
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SHARD_PARTS = ("data", "indices", "indptr", "topics", "rows")
+
+
+class _Shard:
+    """
+    One block of library rows: raw term counts stored column-major (term ->
+    rows) plus the topic code and chunk row of every vector.
+    
+    Searches read shards without holding the index lock, so a shard is not
+    changed once it is published: updates build a new shard and swap it in.
+    """
+    def __init__(self, name: str, postings: sparse.csc_matrix, topics: np.ndarray, rows: np.ndarray,
+                 version: int = 0, doc_norms: Optional[np.ndarray] = None):
+        self.name = name
+        self.version = version
+        self.postings = postings
+        self.topics = topics
+        self.rows = rows
+        self.doc_norms = doc_norms
+    
+    def __len__(self) -> int:
+        return self.postings.shape[0]
+    
+    def with_norms(self, idf_squared: np.ndarray) -> "_Shard":
+        # ||d * idf|| for every row, recomputed whenever the library idf changes
+        squared = self.postings.copy()
+        squared.data **= 2
+        return _Shard(self.name, self.postings, self.topics, self.rows, self.version,
+                      np.sqrt(squared @ idf_squared))
+    
+    def save(self, directory: str):
+        arrays = {
+            "data": self.postings.data, "indices": self.postings.indices, "indptr": self.postings.indptr,
+            "topics": self.topics, "rows": self.rows,
+        }
+        for part, array in arrays.items():
+            # Renamed into place: readers in other workers may have the old file mapped
+            path = os.path.join(directory, f"{self.name}_{part}.npy")
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+    
+    @classmethod
+    def load(cls, directory: str, name: str, n_features: int, version: int) -> "_Shard":
+        # Shards are replaced, never changed in place, so they can be served from read-only maps
+        mmap_mode = "r" if settings.INDEX_MMAP else None
+        data, indices, indptr, topics, rows = (
+            np.load(os.path.join(directory, f"{name}_{part}.npy"), mmap_mode=mmap_mode) for part in _SHARD_PARTS
+        )
+        postings = sparse.csc_matrix((data, indices, indptr), shape=(len(topics), n_features))
+        return cls(name, postings, topics, rows, version)
+    
+    @classmethod
+    def empty(cls, name: str, n_features: int) -> "_Shard":
+        return cls(
+            name,
+            sparse.csc_matrix((0, n_features), dtype=np.float32),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+        )
+
+
+class LibraryIndex:
+    """
+    Cross-topic chunk index used to search one topic, a set of topics or the
+    whole library in a single pass.
+    
+    Topics each have their own TF-IDF vocabulary, so library vectors live in
+    a shared hashed term space instead and topics can be added without
+    refitting anything. Rows keep raw term counts; idf comes from
+    library-wide document frequencies that are updated incrementally, and
+    scoring is TF-IDF cosine. Rows are grouped into shards of at most
+    LIBRARY_SHARD_SIZE vectors, and every row carries a topic code for
+    filtering. An update rewrites only the shard that changed. Writers from
+    any worker serialise on a file lock, and readers reload when the
+    manifest changes. Writers stage changes on copies of the manifest, df
+    and shards and publish them together, so a search always sees one
+    consistent version of the library.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.LIBRARY_DIR
+        self.n_features = settings.LIBRARY_HASH_FEATURES
+        self.vectorizer = HashingVectorizer(
+            n_features=self.n_features,
+            stop_words='english',
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32,
+        )
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.df_path = os.path.join(self.directory, "df.npy")
+        self._lock = threading.RLock()
+        self._manifest_mtime: Optional[int] = None
+        self._manifest: Dict[str, Any] = self._empty_manifest()
+        self._shards: Dict[str, _Shard] = {}
+        self._df = np.zeros(self.n_features, dtype=np.float64)
+        self._idf_squared = np.ones(self.n_features, dtype=np.float64)
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @staticmethod
+    def _empty_manifest() -> Dict[str, Any]:
+        return {"topics": {}, "shards": [], "next_code": 0, "num_docs": 0}
+    
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh(force=True)
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _refresh(self, force: bool = False):
+        """Reload manifest, df and shards if another process changed them."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return
+        if not force and mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            shards = {}
+            for shard_info in manifest["shards"]:
+                shard = self._shards.get(shard_info["name"])
+                if shard is None or shard.version != shard_info["version"]:
+                    shard = _Shard.load(self.directory, shard_info["name"], self.n_features, shard_info["version"])
+                shards[shard.name] = shard
+            df = np.load(self.df_path) if os.path.exists(self.df_path) else np.zeros(self.n_features)
+            self._publish(manifest, shards, df)
+            self._manifest_mtime = mtime
+    
+    def _publish(self, manifest: Dict[str, Any], shards: Dict[str, _Shard], df: np.ndarray):
+        """Make a staged library current, with norms for the idf its df implies."""
+        # Smoothed idf, as in TfidfVectorizer
+        idf = np.log((1.0 + manifest["num_docs"]) / (1.0 + df)) + 1.0
+        idf_squared = idf ** 2
+        shards = {name: shard.with_norms(idf_squared) for name, shard in shards.items()}
+        with self._lock:
+            self._manifest, self._shards, self._df, self._idf_squared = manifest, shards, df, idf_squared
+    
+    def _stage(self):
+        """Copies of the current manifest, shards and df for a writer to change."""
+        return copy.deepcopy(self._manifest), dict(self._shards), self._df.copy()
+    
+    def _persist(self, manifest: Dict[str, Any], shards: Dict[str, _Shard], df: np.ndarray, changed: Sequence[str]):
+        for name in changed:
+            shard_info = self._shard_info(manifest, name)
+            # Changed shards are new objects nobody reads yet, so their version can still be set
+            shard = shards[name]
+            shard_info["rows"] = len(shard)
+            shard_info["version"] = shard.version = shard_info["version"] + 1
+            shard.save(self.directory)
+        np.save(self.df_path, df)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+    
+    @staticmethod
+    def _shard_info(manifest: Dict[str, Any], name: str) -> Dict[str, Any]:
+        return next(info for info in manifest["shards"] if info["name"] == name)
+    
+    @staticmethod
+    def _remove_rows(manifest: Dict[str, Any], shards: Dict[str, _Shard], df: np.ndarray,
+                     topic_id: str) -> Optional[str]:
+        """Drop a topic's rows from staged state. Returns the name of the shard that held them."""
+        topic = manifest["topics"].pop(topic_id, None)
+        if topic is None:
+            return None
+        shard = shards[topic["shard"]]
+        keep = shard.topics != topic["code"]
+        removed = shard.postings[~keep]
+        df -= np.asarray((removed > 0).sum(axis=0)).ravel()
+        manifest["num_docs"] -= removed.shape[0]
+        
+        shards[shard.name] = _Shard(
+            shard.name, sparse.csc_matrix(shard.postings[keep]), shard.topics[keep], shard.rows[keep], shard.version
+        )
+        return shard.name
+    
+    def add_topic(self, topic_id: str, chunk_texts: List[str]):
+        """Add (or replace) a topic's chunks. Row `i` refers to the topic's chunk `i`."""
+        if not chunk_texts:
+            return
+        counts = sparse.csr_matrix(self.vectorizer.transform(chunk_texts), dtype=np.float32)
+        
+        with self._write_lock():
+            manifest, shards, df = self._stage()
+            changed = []
+            replaced = self._remove_rows(manifest, shards, df, topic_id)
+            if replaced is not None:
+                changed.append(replaced)
+            
+            shard_infos = manifest["shards"]
+            if shard_infos and len(shards[shard_infos[-1]["name"]]) + counts.shape[0] <= settings.LIBRARY_SHARD_SIZE:
+                shard = shards[shard_infos[-1]["name"]]
+            else:
+                shard = _Shard.empty(f"shard_{len(shard_infos):05d}", self.n_features)
+                shard_infos.append({"name": shard.name, "rows": 0, "version": 0})
+            
+            code = manifest["next_code"]
+            manifest["next_code"] += 1
+            shards[shard.name] = _Shard(
+                shard.name,
+                sparse.vstack([shard.postings.tocsr(), counts]).tocsc(),
+                np.concatenate([shard.topics, np.full(counts.shape[0], code, dtype=np.int32)]),
+                np.concatenate([shard.rows, np.arange(counts.shape[0], dtype=np.int32)]),
+                shard.version,
+            )
+            if shard.name not in changed:
+                changed.append(shard.name)
+            
+            df += np.asarray((counts > 0).sum(axis=0)).ravel()
+            manifest["num_docs"] += counts.shape[0]
+            manifest["topics"][topic_id] = {"code": code, "shard": shard.name, "chunks": counts.shape[0]}
+            
+            self._persist(manifest, shards, df, changed)
+            self._publish(manifest, shards, df)
+        logger.info("Added topic %s to library index (%s chunks)", topic_id, counts.shape[0])
+    
+    def remove_topic(self, topic_id: str) -> bool:
+        with self._write_lock():
+            manifest, shards, df = self._stage()
+            shard_name = self._remove_rows(manifest, shards, df, topic_id)
+            if shard_name is None:
+                return False
+            self._persist(manifest, shards, df, [shard_name])
+            self._publish(manifest, shards, df)
+        logger.info("Removed topic %s from library index", topic_id)
+        return True
+    
+    def has_topic(self, topic_id: str) -> bool:
+        self._refresh()
+        return topic_id in self._manifest["topics"]
+    
+    def topics(self) -> List[str]:
+        self._refresh()
+        return list(self._manifest["topics"])
+    
+    def search(self, question: str, k: int = 3, topic_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Return up to `k` hits `{"topic_id", "row", "similarity_score"}` ranked
+        by TF-IDF cosine, restricted to `topic_ids` when given.
+        """
+        self._refresh()
+        with self._lock:
+            manifest, shards = self._manifest, list(self._shards.values())
+            idf_squared = self._idf_squared
+        
+        codes_to_topics = {info["code"]: topic for topic, info in manifest["topics"].items()}
+        wanted_codes = None
+        if topic_ids is not None:
+            wanted_codes = np.array(
+                [manifest["topics"][topic]["code"] for topic in topic_ids if topic in manifest["topics"]],
+                dtype=np.int32,
+            )
+            if len(wanted_codes) == 0:
+                return []
+        
+        query = sparse.csr_matrix(self.vectorizer.transform([question]))
+        terms = query.indices
+        weights = query.data.astype(np.float64) * idf_squared[terms]
+        query_norm = np.sqrt(np.dot(query.data ** 2, idf_squared[terms]))
+        if query_norm == 0:
+            return []
+        
+        candidates = []
+        for shard in shards:
+            if len(shard) == 0:
+                continue
+            scores = shard.postings[:, terms] @ weights
+            scores = scores / (np.maximum(shard.doc_norms, 1e-12) * query_norm)
+            if wanted_codes is not None:
+                scores[~np.isin(shard.topics, wanted_codes)] = -1.0
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            candidates.extend(
+                (float(scores[i]), codes_to_topics[int(shard.topics[i])], int(shard.rows[i]))
+                for i in top if scores[i] > 0
+            )
+        
+        candidates.sort(key=lambda hit: hit[0], reverse=True)
+        return [
+            {"topic_id": topic_id, "row": row, "similarity_score": score}
+            for score, topic_id, row in candidates[:k]
+        ]
+
+
+library_index = LibraryIndex()
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "You are a patient tutor. Answer the student's question using only the numbered "
+    "excerpts from their textbook. If the excerpts do not contain the answer, say so. "
+    "Cite excerpts as [Source N]."
+)
+
+# Gemini serves an OpenAI-compatible API, so both use the same provider class
+DEFAULT_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "gemini": "https://generativelanguage.googleapis.com/v1beta/openai",
+}
+
+
+class LLMError(Exception):
+    """A remote provider failed; callers fall back to the extractive answer."""
+
+
+def build_messages(question: str, context_chunks: List[str]) -> List[Dict[str, str]]:
+    excerpts = "\n\n".join(f"[Source {i}]\n{chunk}" for i, chunk in enumerate(context_chunks, start=1))
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Excerpts:\n\n{excerpts}\n\nQuestion: {question}"},
+    ]
+
+
+class OpenAICompatibleProvider:
+    """
+    Chat-completions client for OpenAI-style APIs (OpenAI, Gemini's
+    compatibility endpoint, vLLM, the bundled mock server, ...).
+    
+    One pooled `httpx.AsyncClient` keeps connections alive across requests,
+    a semaphore caps concurrent calls at LLM_MAX_CONCURRENCY, and identical
+    in-flight requests are coalesced into a single upstream call. Must be
+    used from a single event loop (see `LLMRunner`).
+    """
+    def __init__(self, base_url: str, api_key: str, model: str):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+    
+    def _payload(self, question: str, context_chunks: List[str], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": build_messages(question, context_chunks),
+            "max_tokens": settings.LLM_MAX_TOKENS,
+            "temperature": settings.LLM_TEMPERATURE,
+            "stream": stream,
+        }
+    
+    async def generate(self, question: str, context_chunks: List[str]) -> str:
+        payload = self._payload(question, context_chunks, stream=False)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            answer = await self._complete(payload)
+            future.set_result(answer)
+            return answer
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else LLMError("Request cancelled"))
+            # Mark retrieved so a future with no waiters does not warn
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+    
+    async def _complete(self, payload: Dict[str, Any]) -> str:
+        async with self.semaphore:
+            self.requests += 1
+            try:
+                response = await self.client.post("/chat/completions", json=payload)
+                response.raise_for_status()
+                return response.json()["choices"][0]["message"]["content"].strip()
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+                self.errors += 1
+                raise LLMError(f"LLM request failed: {e}") from e
+    
+    async def stream(self, question: str, context_chunks: List[str]) -> AsyncIterator[str]:
+        """Yield content deltas from a streamed chat completion."""
+        payload = self._payload(question, context_chunks, stream=True)
+        async with self.semaphore:
+            self.requests += 1
+            try:
+                async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            return
+                        delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            yield delta
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+                self.errors += 1
+                raise LLMError(f"LLM stream failed: {e}") from e
+    
+    async def aclose(self):
+        await self.client.aclose()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+        }
+
+
+class LLMRunner:
+    """
+    Owns the event loop the LLM provider runs on. Pipeline code runs on
+    executor threads, so it hands coroutines to this loop and waits on its
+    own thread; async handlers can await the same calls with `run_async`.
+    All network I/O is non-blocking on one loop, which keeps one connection
+    pool and one concurrency limit per process.
+    """
+    def __init__(self, provider_name: str):
+        self.provider_name = provider_name
+        self.provider: Optional[OpenAICompatibleProvider] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.provider_name != "extractive"
+    
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        # Started lazily so importing the app never opens sockets or threads
+        with self._lock:
+            if self._loop is None:
+                base_url = settings.LLM_BASE_URL or DEFAULT_BASE_URLS.get(self.provider_name, "")
+                if not base_url:
+                    raise LLMError(f"LLM_BASE_URL is required for LLM_PROVIDER={self.provider_name}")
+                api_key = settings.LLM_API_KEY or (
+                    settings.GEMINI_API_KEY if self.provider_name == "gemini" else settings.OPENAI_API_KEY
+                )
+                
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+                
+                async def create_provider():
+                    # The client and semaphore must be created on the loop that uses them
+                    return OpenAICompatibleProvider(base_url, api_key, settings.LLM_MODEL)
+                self.provider = asyncio.run_coroutine_threadsafe(create_provider(), loop).result()
+                self._loop = loop
+                logger.info("Started LLM provider %s (%s)", self.provider_name, self.provider.base_url)
+            return self._loop
+    
+    def generate(self, question: str, context_chunks: List[str]) -> str:
+        """Blocking call for executor threads; never call from an event loop."""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(self.provider.generate(question, context_chunks), settings.LLM_TIMEOUT_SECONDS),
+            loop,
+        )
+        try:
+            return future.result()
+        except asyncio.TimeoutError as e:
+            raise LLMError("LLM request timed out") from e
+    
+    def generate_many(self, requests: List[Tuple[str, List[str]]]) -> List[Any]:
+        """
+        Run many requests concurrently (bounded by the provider's semaphore)
+        and wait for all of them. Failed items come back as exceptions.
+        """
+        loop = self._ensure_started()
+        
+        async def gather():
+            return await asyncio.gather(
+                *(asyncio.wait_for(self.provider.generate(question, chunks), settings.LLM_TIMEOUT_SECONDS)
+                  for question, chunks in requests),
+                return_exceptions=True,
+            )
+        return asyncio.run_coroutine_threadsafe(gather(), loop).result()
+    
+    async def run_async(self, question: str, context_chunks: List[str]) -> str:
+        """Awaitable from any event loop without blocking it."""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(self.provider.generate(question, context_chunks), settings.LLM_TIMEOUT_SECONDS),
+            loop,
+        )
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.TimeoutError as e:
+            raise LLMError("LLM request timed out") from e
+    
+    def stream(self, question: str, context_chunks: List[str]) -> Iterator[str]:
+        """Blocking iterator over streamed deltas for executor threads."""
+        loop = self._ensure_started()
+        deltas: "queue.Queue" = queue.Queue()
+        done = object()
+        
+        async def pump():
+            try:
+                async for delta in self.provider.stream(question, context_chunks):
+                    deltas.put(delta)
+                deltas.put(done)
+            except asyncio.CancelledError:
+                deltas.put(LLMError("LLM stream timed out"))
+                raise
+            except Exception as e:
+                deltas.put(e)
+        
+        asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(pump(), settings.LLM_TIMEOUT_SECONDS), loop
+        )
+        while True:
+            try:
+                item = deltas.get(timeout=settings.LLM_TIMEOUT_SECONDS)
+            except queue.Empty as e:
+                raise LLMError("LLM stream timed out") from e
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    
+    def record_fallback(self, error: Exception):
+        with self._lock:
+            self.fallbacks += 1
+        logger.warning("LLM provider %s failed, using extractive answer: %s", self.provider_name, error)
+    
+    def shutdown(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.provider.aclose(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.warning("Error closing LLM client: %s", e)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = {"provider": self.provider_name, "started": self._loop is not None, "fallbacks": self.fallbacks}
+        if self.provider is not None:
+            stats.update(self.provider.stats())
+        return stats
+
+
+llm_runner = LLMRunner(settings.LLM_PROVIDER)
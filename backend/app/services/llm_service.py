@@ -1,16 +1,40 @@
-from typing import List
+import logging
+from typing import Any, Dict, Generator, Iterator, List, NamedTuple, Optional, Tuple, Union
 import re
 from textwrap import shorten
 from app.core.config import settings
+from app.services.llm_providers import llm_runner
+from app.services import sentence_index
+from app.services.chunk_store import ChunkHit
+
+logger = logging.getLogger(__name__)
+
+# Retrieved context: chunk texts, or chunk dicts / search hits carrying precomputed sentences
+Context = List[Union[str, Dict[str, Any], ChunkHit]]
+
+class Answer(NamedTuple):
+    """
+    An answer and whether it is final: False when the configured model
+    failed and the extractive answer stood in, or its stream broke off.
+    Such answers are served but not cached, so the next ask retries.
+    """
+    text: str
+    final: bool = True
+
+def _texts(context_chunks: Context) -> List[str]:
+    return [chunk if isinstance(chunk, str) else chunk["text"] for chunk in context_chunks]
 
 class LLMService:
     """
-    Lightweight, deterministic response generator that grounds answers
-    directly in the retrieved PDF chunks. This is not a real LLM but
-    it keeps the pipeline functional without requiring API keys.
+    Answers questions from the retrieved PDF chunks. With LLM_PROVIDER set,
+    answers come from a remote chat model (see `llm_providers`); otherwise,
+    and whenever that model fails or times out, a lightweight deterministic
+    generator quotes the supporting sentences directly, which keeps the
+    pipeline functional without API keys.
     """
     def __init__(self):
         self.model_name = settings.LLM_MODEL
+        self.runner = llm_runner
     
     def _extract_supporting_sentences(self, question: str, chunk: str) -> List[str]:
         keywords = [word.lower() for word in re.findall(r"\b\w{4,}\b", question)]
@@ -24,43 +48,141 @@ class LLMService:
             matches = sentences[:2]
         return [shorten(sentence, width=260, placeholder="...") for sentence in matches if sentence]
     
-    def generate_answer(self, question: str, context_chunks: List[str]) -> str:
+    def generate_answer(self, question: str, context_chunks: Context,
+                        sentence_idf: Optional[sentence_index.Weights] = None) -> Answer:
+        """
+        Answer with the configured model, falling back to the extractive answer.
+        Blocks the calling (executor) thread, never an event loop.
+        """
+        if self.runner.enabled and context_chunks:
+            try:
+                return Answer(self.runner.generate(question, _texts(context_chunks)))
+            except Exception as e:
+                self.runner.record_fallback(e)
+                return Answer(self.extractive_answer(question, context_chunks, sentence_idf), final=False)
+        return Answer(self.extractive_answer(question, context_chunks, sentence_idf))
+    
+    def generate_answers(self, requests: List[Tuple[str, Context]],
+                         sentence_idf: Optional[sentence_index.Weights] = None) -> List[Answer]:
+        """
+        `generate_answer` for many `(question, context_chunks)` pairs. Remote
+        calls run concurrently; each failure falls back on its own.
+        """
+        if not self.runner.enabled:
+            return [Answer(self.extractive_answer(question, chunks, sentence_idf)) for question, chunks in requests]
+        try:
+            answers = self.runner.generate_many([(question, _texts(chunks)) for question, chunks in requests])
+        except Exception as e:
+            answers = [e] * len(requests)
+        results = []
+        for (question, chunks), answer in zip(requests, answers):
+            if isinstance(answer, BaseException):
+                self.runner.record_fallback(answer)
+                results.append(Answer(self.extractive_answer(question, chunks, sentence_idf), final=False))
+            else:
+                results.append(Answer(answer))
+        return results
+    
+    async def agenerate_answer(self, question: str, context_chunks: Context,
+                               sentence_idf: Optional[sentence_index.Weights] = None) -> Answer:
+        """`generate_answer` for async callers."""
+        if self.runner.enabled and context_chunks:
+            try:
+                return Answer(await self.runner.run_async(question, _texts(context_chunks)))
+            except Exception as e:
+                self.runner.record_fallback(e)
+                return Answer(self.extractive_answer(question, context_chunks, sentence_idf), final=False)
+        return Answer(self.extractive_answer(question, context_chunks, sentence_idf))
+    
+    def iter_answer(self, question: str, context_chunks: Context,
+                    sentence_idf: Optional[sentence_index.Weights] = None) -> Generator[str, None, bool]:
+        """
+        Yield the answer in pieces: model deltas when a provider is set,
+        otherwise the extractive answer sentence by sentence. If the model
+        fails before sending anything, the extractive answer is streamed.
+        Returns whether the answer is final (see `Answer`): False after a
+        fallback or when the model's stream broke off part way.
+        """
+        if self.runner.enabled and context_chunks:
+            started = False
+            try:
+                for delta in self.runner.stream(question, _texts(context_chunks)):
+                    started = True
+                    yield delta
+                return True
+            except Exception as e:
+                if started:
+                    logger.warning("LLM stream interrupted: %s", e)
+                    return False
+                self.runner.record_fallback(e)
+            yield from self.iter_extractive_answer(question, context_chunks, sentence_idf)
+            return False
+        yield from self.iter_extractive_answer(question, context_chunks, sentence_idf)
+        return True
+    
+    def extractive_answer(self, question: str, context_chunks: Context,
+                          sentence_idf: Optional[sentence_index.Weights] = None) -> str:
         """
         Compose a grounded explanation pulled only from the retrieved PDF text.
         """
+        return "".join(self.iter_extractive_answer(question, context_chunks, sentence_idf))
+    
+    def iter_extractive_answer(self, question: str, context_chunks: Context,
+                               sentence_idf: Optional[sentence_index.Weights] = None) -> Iterator[str]:
+        """
+        Yield the extractive answer in pieces as it is composed: the heading,
+        then each supporting sentence as soon as it is found, then the
+        citations. Joined, the pieces are exactly `extractive_answer`'s text.
+        
+        Chunks annotated at ingest (`sentences`/`sentence_tokens`) are
+        answered by token-set overlap scored with the topic's sentence idf;
+        plain texts fall back to splitting and substring matching.
+        """
         if not context_chunks:
-            return "I could not find relevant information about that in the uploaded chapter."
+            yield "I could not find relevant information about that in the uploaded chapter."
+            return
         
+        yield f'Here’s a summary from the uploaded chapter about "{question}":\n\n'
+        
+        if all(sentence_index.is_annotated(chunk) for chunk in context_chunks):
+            collected_sentences = []
+            for source_id, sentence in sentence_index.select_sentences(
+                question, context_chunks, sentence_idf or {}, limit=6
+            ):
+                sentence = shorten(sentence, width=260, placeholder="...")
+                if sentence:
+                    yield f" {sentence}" if collected_sentences else sentence
+                    collected_sentences.append((source_id, sentence))
+            yield from self._finish_answer(_texts(context_chunks), collected_sentences)
+            return
+        
+        context_chunks = _texts(context_chunks)
         collected_sentences = []
         for idx, chunk in enumerate(context_chunks):
             sentences = self._extract_supporting_sentences(question, chunk)
             for sentence in sentences:
+                yield f" {sentence}" if collected_sentences else sentence
                 collected_sentences.append((idx + 1, sentence))
                 if len(collected_sentences) >= 6:
                     break
             if len(collected_sentences) >= 6:
                 break
         
+        yield from self._finish_answer(context_chunks, collected_sentences)
+    
+    @staticmethod
+    def _finish_answer(context_texts: List[str], collected_sentences: List[Tuple[int, str]]) -> Iterator[str]:
         if not collected_sentences:
-            collected_sentences.append((1, shorten(context_chunks[0], width=260, placeholder="...")))
-        
-        plain_sentences = [sentence for _, sentence in collected_sentences]
-        explanation = " ".join(plain_sentences).strip()
-        if not explanation:
-            explanation = shorten(context_chunks[0], width=260, placeholder="...")
+            fallback = shorten(context_texts[0], width=260, placeholder="...")
+            collected_sentences.append((1, fallback))
+            yield fallback
         
         citations = "\n".join(
             f"- Source {source_id}: {sentence}"
             for source_id, sentence in collected_sentences[:4]
         )
-        
-        answer = (
-            f'Here’s a summary from the uploaded chapter about "{question}":\n\n'
-            f"{explanation}\n\n"
-            "Supporting excerpts from the PDF:\n"
-            f"{citations}"
-        )
-        return answer
+        yield "\n\nSupporting excerpts from the PDF:\n" + citations
     
     def is_available(self) -> bool:
-        return False
\ No newline at end of file
+        """True when a remote model is configured."""
+        return self.runner.enabled
\ No newline at end of file
@@ -0,0 +1,319 @@
+import bisect
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the histogram buckets, Prometheus `le` labels
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    "rag_stage_seconds": "Time spent in each chat pipeline stage",
+    "ingest_stage_seconds": "Time spent in each ingestion stage",
+    "http_request_seconds": "HTTP request latency until the response starts",
+    "http_requests_total": "HTTP requests by route and status code",
+    "rag_answers_total": "Chat answers by where they came from",
+    "ingest_jobs_total": "Finished ingestion jobs by outcome",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, help, type, labels, value) rows produced by collectors at scrape time
+Sample = Tuple[str, str, str, Dict[str, Any], float]
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for Prometheus, plus a ring of the most recent
+    observations from which p50/p95/p99 are computed at scrape time.
+    """
+    def __init__(self, window: int):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = np.zeros(max(1, window), dtype=np.float64)
+    
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.recent[self.count % len(self.recent)] = value
+        self.count += 1
+        self.sum += value
+    
+    def quantiles(self) -> Dict[float, float]:
+        if not self.count:
+            return {q: 0.0 for q in QUANTILES}
+        recent = self.recent[:min(self.count, len(self.recent))]
+        return dict(zip(QUANTILES, np.quantile(recent, QUANTILES).tolist()))
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency histograms, rendered in the Prometheus
+    text format by `GET /metrics`. Gauges (cache sizes, lane queue depths)
+    are read from collectors when scraped rather than tracked here.
+    """
+    def __init__(self):
+        self.enabled = settings.METRICS_ENABLED
+        self.window = settings.METRICS_QUANTILE_WINDOW
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+    
+    def inc(self, name: str, amount: float = 1.0, **labels: Any):
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            family[key] = family.get(key, 0.0) + amount
+    
+    def observe(self, name: str, seconds: float, **labels: Any):
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            family = self._histograms.setdefault(name, {})
+            histogram = family.get(key)
+            if histogram is None:
+                histogram = family[key] = Histogram(self.window)
+            histogram.observe(seconds)
+    
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+    
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Count, mean and p50/p95/p99 (seconds) of every histogram series."""
+        with self._lock:
+            return {
+                name: {
+                    ",".join(f"{label}={value}" for label, value in key) or "all": {
+                        "count": histogram.count,
+                        "mean": round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                        **{f"p{int(q * 100)}": round(value, 6) for q, value in histogram.quantiles().items()},
+                    }
+                    for key, histogram in family.items()
+                }
+                for name, family in self._histograms.items()
+            }
+    
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, family in sorted(self._counters.items()):
+                lines += _header(name, HELP.get(name, name), "counter")
+                lines += [f"{name}{_format_labels(key)} {_number(value)}" for key, value in family.items()]
+            for name, family in sorted(self._histograms.items()):
+                lines += _header(name, HELP.get(name, name), "histogram")
+                quantile_lines = []
+                for key, histogram in family.items():
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + (float("inf"),), histogram.bucket_counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+                    for q, value in histogram.quantiles().items():
+                        quantile_lines.append(
+                            f"{name}_recent{_format_labels(key + (('quantile', _number(q)),))} {_number(value)}"
+                        )
+                lines += _header(f"{name}_recent", f"{HELP.get(name, name)}, quantiles of the last "
+                                 f"{self.window} observations", "gauge")
+                lines += quantile_lines
+        
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+                continue
+            for name, help_text, kind, labels, value in samples:
+                family = families.setdefault(name, (help_text, kind, []))
+                family[2].append(f"{name}{_format_labels(_labels(labels))} {_number(value)}")
+        for name, (help_text, kind, samples) in sorted(families.items()):
+            lines += _header(name, help_text, kind)
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), "")}"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _header(name: str, help_text: str, kind: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of the threads working on one request every
+    `interval_ms` and counts identical stacks. Only threads registered with
+    `add_thread` (the executor threads running the request) are sampled, so
+    other requests do not show up.
+    """
+    def __init__(self, interval_ms: float):
+        self.interval = max(interval_ms, 0.5) / 1000.0
+        self.samples = 0
+        self._threads: set = set()
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+    
+    def add_thread(self, ident: int):
+        with self._lock:
+            self._threads.add(ident)
+    
+    def remove_thread(self, ident: int):
+        with self._lock:
+            self._threads.discard(ident)
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in self._threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks[_fold(frame)] += 1
+                        self.samples += 1
+    
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        """Most frequent stacks (root first, `;`-separated) and leaf functions."""
+        with self._lock:
+            stacks = self._stacks.most_common(top)
+            leaves = Counter()
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in stacks],
+            "functions": [{"function": function, "count": count} for function, count in leaves.most_common(top)],
+        }
+
+
+def _fold(frame, max_depth: int = 64) -> str:
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class RequestTrace:
+    """
+    Per-request timing breakdown. While `activate`d, `stage()` blocks add
+    their time here as well as to the process histograms, including blocks
+    that run on executor threads (WorkerLane copies the request context).
+    """
+    def __init__(self, profile: bool = False):
+        self._lock = threading.Lock()
+        self.timings: Dict[str, float] = {}
+        self.profiler = SamplingProfiler(settings.PROFILER_INTERVAL_MS) if profile and settings.PROFILER_ENABLED else None
+    
+    def add(self, stage_name: str, seconds: float):
+        with self._lock:
+            self.timings[stage_name] = self.timings.get(stage_name, 0.0) + seconds
+    
+    @contextmanager
+    def activate(self) -> Iterator["RequestTrace"]:
+        token = _current_trace.set(self)
+        if self.profiler is not None:
+            self.profiler.start()
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add("total", time.perf_counter() - started)
+            if self.profiler is not None:
+                self.profiler.stop()
+            _current_trace.reset(token)
+    
+    def timings_ms(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage_name: round(seconds * 1000, 3) for stage_name, seconds in self.timings.items()}
+    
+    def profile_report(self) -> Optional[Dict[str, Any]]:
+        return self.profiler.report() if self.profiler is not None else None
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record(name: str, seconds: float, family: str = "rag_stage_seconds"):
+    """Add time spent in stage `name` to `family{stage=name}` and the active request trace."""
+    registry.observe(family, seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str, family: str = "rag_stage_seconds"):
+    """Time a block with `record`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started, family)
+
+
+def run_traced(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run `func` on the calling executor thread inside a copied request
+    context, registering the thread with the request's profiler if any.
+    """
+    trace = _current_trace.get()
+    profiler = trace.profiler if trace is not None else None
+    if profiler is None:
+        return func(*args, **kwargs)
+    ident = threading.get_ident()
+    profiler.add_thread(ident)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.remove_thread(ident)
+
+
+registry = MetricsRegistry()
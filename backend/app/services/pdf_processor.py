@@ -1,81 +1,218 @@
+import hashlib
 import logging
 import os
-import uuid
-from typing import List, Dict, Any
+import time
+from collections import deque
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 import PyPDF2
 from app.core.config import settings
+from app.services.chunking import Chunker
 
 logger = logging.getLogger(__name__)
 
+ProgressCallback = Callable[[int, int], None]
+
+def _extract_pages(pdf_path: str, page_numbers: List[int]) -> List[Tuple[int, str]]:
+    """
+    Extract the given pages of a PDF. Module level so it can run in a process pool.
+    """
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(page_num, pdf_reader.pages[page_num].extract_text() or "") for page_num in page_numbers]
+
+def _hash_pdf_object(obj: Any, digest, seen: Dict[Tuple[int, int], int],
+                     stream_digests: Dict[Tuple[int, int], bytes]):
+    """
+    Feed a PDF object and everything it references into `digest`. Indirect
+    objects are hashed where first reached and by visit order afterwards,
+    so cycles end and the result does not depend on object numbering.
+    Streams reached by reference are hashed once per document.
+    """
+    if isinstance(obj, PyPDF2.generic.IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            digest.update(f"@{seen[ref]};".encode())
+            return
+        seen[ref] = len(seen)
+        resolved = obj.get_object()
+        if isinstance(resolved, PyPDF2.generic.StreamObject):
+            if ref not in stream_digests:
+                # Placeholder while hashing, for forms that (indirectly) draw themselves
+                stream_digests[ref] = b""
+                stream_digest = hashlib.sha256()
+                _hash_pdf_object(resolved, stream_digest, {ref: 0}, stream_digests)
+                stream_digests[ref] = stream_digest.digest()
+            digest.update(b"S" + stream_digests[ref])
+            return
+        obj = resolved
+    if isinstance(obj, PyPDF2.generic.StreamObject):
+        # The stored (still encoded) bytes: identical images need no decoding to compare
+        digest.update(b"stream" + bytes(getattr(obj, "_data", b"") or b""))
+    if isinstance(obj, PyPDF2.generic.DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj.keys()):
+            if key in ("/Parent", "/Length"):
+                continue
+            digest.update(key.encode())
+            _hash_pdf_object(obj.raw_get(key), digest, seen, stream_digests)
+        digest.update(b">>")
+    elif isinstance(obj, PyPDF2.generic.ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _hash_pdf_object(item, digest, seen, stream_digests)
+        digest.update(b"]")
+    elif obj is not None:
+        digest.update(f"{type(obj).__name__}:{obj!r};".encode())
+
 class PDFProcessor:
     def __init__(self):
+        self.chunk_strategy = settings.CHUNK_STRATEGY
+        self.chunk_unit = settings.CHUNK_UNIT
         self.chunk_size = settings.CHUNK_SIZE
         self.chunk_overlap = settings.CHUNK_OVERLAP
+        self.page_batch_size = settings.PDF_PAGE_BATCH_SIZE
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def iter_pages(
+        self,
+        pdf_path: str,
+        pool=None,
+        on_progress: Optional[ProgressCallback] = None,
+        page_numbers: Optional[List[int]] = None,
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Yield `(page_number, text)` in page order as pages are extracted.
+        With a process `pool` (an executor WorkerLane), batches of pages are parsed
+        in parallel; only a bounded window of batches is in flight so memory
+        stays flat for very large books. `page_numbers` limits extraction to
+        those pages (e.g. the pages that changed since an earlier upload).
+        """
+        page_count = self.count_pages(pdf_path)
+        if page_count == 0:
+            raise Exception("PDF has no pages")
+        if page_numbers is None:
+            page_numbers = list(range(page_count))
+        total = len(page_numbers)
+        
+        if pool is None:
+            with open(pdf_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                for done, page_num in enumerate(page_numbers, start=1):
+                    yield page_num, pdf_reader.pages[page_num].extract_text() or ""
+                    if on_progress:
+                        on_progress(done, total)
+            return
+        
+        batches = iter(
+            page_numbers[start:start + self.page_batch_size]
+            for start in range(0, total, self.page_batch_size)
+        )
+        pending = deque()
+        
+        def submit_next():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append(pool.submit(_extract_pages, pdf_path, batch))
+        
+        try:
+            for _ in range(pool.max_workers * 2):
+                submit_next()
+            pages_done = 0
+            while pending:
+                pages = pending.popleft().result()
+                submit_next()
+                for page in pages:
+                    yield page
+                pages_done += len(pages)
+                if on_progress:
+                    on_progress(pages_done, total)
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def page_fingerprints(self, pdf_path: str) -> List[str]:
+        """
+        SHA-256 of each page's decoded content stream and the resources it
+        draws (fonts, images and form XObjects, followed recursively), in
+        page order. The content stream alone only names its resources, and
+        generated PDFs often draw every page as an identical `/Fm0 Do`, so
+        without them pages of unrelated documents would match. This reads
+        no text and costs a small fraction of extraction, so it is used to
+        find pages whose text can be reused from an earlier upload.
+        """
+        try:
+            with open(pdf_path, 'rb') as file:
+                fingerprints = []
+                stream_digests: Dict[Tuple[int, int], bytes] = {}
+                for page in PyPDF2.PdfReader(file).pages:
+                    digest = hashlib.sha256()
+                    contents = page.get_contents()
+                    digest.update(contents.get_data() if contents is not None else b"")
+                    _hash_pdf_object(page.raw_get("/Resources") if "/Resources" in page else None,
+                                     digest, {}, stream_digests)
+                    fingerprints.append(digest.hexdigest())
+                return fingerprints
+        except Exception as e:
+            raise Exception(f"Error reading PDF: {str(e)}")
+    
+    def extract_text_from_pdf(self, pdf_path: str, pool=None) -> str:
         """
         Extract all text from a PDF file
         """
         try:
             logger.info("Extracting text from %s", pdf_path)
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Check if PDF has pages
-                if len(pdf_reader.pages) == 0:
-                    raise Exception("PDF has no pages")
-                
-                text = ""
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                
-                if not text.strip():
-                    raise Exception("No text could be extracted from the PDF")
-                
-                logger.info("Extracted %s characters from PDF", len(text))
-                return text.strip()
-                
+            text = "\n".join(
+                page_text for _, page_text in self.iter_pages(pdf_path, pool) if page_text
+            ).strip()
+            
+            if not text:
+                raise Exception("No text could be extracted from the PDF")
+            
+            logger.info("Extracted %s characters from PDF", len(text))
+            return text
+        
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
     
+    def count_pages(self, pdf_path: str) -> int:
+        """
+        Return the number of pages without extracting any text
+        """
+        try:
+            with open(pdf_path, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            raise Exception(f"Error reading PDF: {str(e)}")
+    
     def chunk_text(self, text: str) -> List[Dict[str, Any]]:
         """
         Split text into overlapping chunks for better retrieval
         """
-        words = text.split()
-        chunks = []
-        chunk_id = 0
-        
-        i = 0
-        while i < len(words):
-            # Create chunk
-            chunk_words = words[i:i + self.chunk_size]
-            chunk_text = " ".join(chunk_words)
-            
-            # Create chunk metadata
-            chunk_data = {
-                "id": str(uuid.uuid4()),
-                "chunk_id": chunk_id,
-                "text": chunk_text,
-                "word_count": len(chunk_words),
-                "start_index": i,
-                "end_index": min(i + self.chunk_size, len(words))
-            }
-            
-            chunks.append(chunk_data)
-            chunk_id += 1
-            
-            # Move forward, considering overlap
-            i += (self.chunk_size - self.chunk_overlap)
-        
-        return chunks
+        return list(self.iter_chunks([text]))
+    
+    def iter_chunks(self, texts: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Stream overlapping chunks over a sequence of texts (e.g. pages) with
+        the configured strategy (see `chunking.Chunker`). Each chunk is
+        yielded as soon as its window is complete, and text no later window
+        needs is dropped, so only about one window is buffered.
+        """
+        chunker = Chunker(self.chunk_strategy, self.chunk_size, self.chunk_overlap, unit=self.chunk_unit)
+        return chunker.iter_chunks(texts)
     
-    def process_pdf_from_path(self, pdf_path: str, topic_id: str) -> Dict[str, Any]:
+    def process_pdf_from_path(
+        self,
+        pdf_path: str,
+        topic_id: str,
+        pool=None,
+        on_progress: Optional[ProgressCallback] = None,
+        known_pages: Optional[Dict[int, str]] = None,
+    ) -> Dict[str, Any]:
         """
-        Process PDF from file path: extract text and chunk it
+        Process PDF from file path: extract text and chunk it.
+        Pages are chunked as they are extracted instead of building the
+        whole book text first. Pages in `known_pages` (page number -> text,
+        e.g. unchanged pages of an earlier upload) are not extracted again.
+        The text of every page is returned under `pages`.
         """
         try:
             # Verify file exists and has content
@@ -86,20 +223,51 @@ class PDFProcessor:
             if file_size == 0:
                 raise Exception("PDF file is empty")
             
-            # Extract text
-            text = self.extract_text_from_pdf(pdf_path)
+            # Extract and chunk text page by page
+            known_pages = known_pages or {}
+            page_count = self.count_pages(pdf_path)
+            missing = [page_num for page_num in range(page_count) if page_num not in known_pages]
+            text_length = 0
+            extract_seconds = 0.0
+            pages: List[str] = []
             
-            # Chunk text
-            chunks = self.chunk_text(text)
+            def page_texts():
+                nonlocal text_length, extract_seconds
+                extracted = self.iter_pages(pdf_path, pool, on_progress, page_numbers=missing)
+                for page_num in range(page_count):
+                    if page_num in known_pages:
+                        page_text = known_pages[page_num]
+                    else:
+                        started = time.perf_counter()
+                        page_text = next(extracted)[1]
+                        extract_seconds += time.perf_counter() - started
+                    pages.append(page_text)
+                    if page_text:
+                        text_length += len(page_text) + 1
+                        yield page_text
+                # Resume the generator past the last page so it reports the final batch's progress
+                for _ in extracted:
+                    pass
+            
+            started = time.perf_counter()
+            chunks = list(self.iter_chunks(page_texts()))
+            # Time not spent waiting on page extraction went to chunking
+            chunk_seconds = time.perf_counter() - started - extract_seconds
+            if not chunks:
+                raise Exception("No text could be extracted from the PDF")
             
             return {
                 "topic_id": topic_id,
                 "pdf_path": pdf_path,
-                "text_length": len(text),
+                "text_length": text_length,
                 "chunks": chunks,
-                "chunk_count": len(chunks)
+                "chunk_count": len(chunks),
+                "pages": pages,
+                "pages_extracted": len(missing),
+                "extract_seconds": extract_seconds,
+                "chunk_seconds": chunk_seconds,
             }
-            
+        
         except Exception as e:
             # Clean up file if processing failed
             if os.path.exists(pdf_path):
@@ -122,7 +290,7 @@ class PDFProcessor:
             
             # Process from saved path
             return self.process_pdf_from_path(pdf_path, topic_id)
-            
+        
         except Exception as e:
             # Clean up file if processing failed
             if os.path.exists(pdf_path):
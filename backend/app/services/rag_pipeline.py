@@ -1,19 +1,29 @@
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
 from app.services.embedding_service import EmbeddingService
 from app.services.vector_store import VectorStore
+from app.services.chunk_store import ChunkHit
 from app.services.llm_service import LLMService
-from app.services.image_service import ImageService
+from app.services.image_service import ImageMatch, ImageService
+from app.services.library_index import library_index
+from app.services.response_cache import response_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.executor import executor_service
+from app.services import hybrid_search, metrics
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+NO_RESULTS_ANSWER = "I couldn't find relevant information in the learning material to answer your question."
+
 class RAGPipeline:
     def __init__(self):
         self.embedding_service = EmbeddingService()
         self.llm_service = LLMService()
         self.image_service = ImageService()
+        self.library_index = library_index
     
     def process_query(self, topic_id: str, question: str) -> Dict[str, Any]:
         """
@@ -28,63 +38,398 @@ class RAGPipeline:
                 raise Exception(f"No vector store found for topic: {topic_id}")
             
             logger.debug("Vector store exists, loading index...")
-            vector_store.load_index()
+            with metrics.stage("index_load"):
+                vector_store.load_index()
+            
+            # Repeated questions against the same index version reuse the answer
+            cache_key = response_cache.make_key(topic_id, question, vector_store.index_version)
+            with metrics.stage("cache_lookup"):
+                cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Serving cached answer for topic %s", topic_id)
+                metrics.registry.inc("rag_answers_total", source="response_cache")
+                return cached
             
             # Generate embedding for the question
             logger.debug("Generating question embedding")
-            question_embedding = self.embedding_service.generate_single_embedding(question, namespace="chunks")
+            with metrics.stage("query_embedding"):
+                question_embedding = self.embedding_service.generate_single_embedding(
+                    question, namespace="chunks", sparse=vector_store.is_sparse, topic_id=topic_id
+                )
             logger.debug("Question embedding generated with shape %s", question_embedding.shape)
             
+            result, final = self._answer(vector_store, question, question_embedding)
+            if final:
+                response_cache.put(cache_key, result)
+            return result
+        
+        except Exception as e:
+            logger.exception("RAG pipeline error: %s", e)
+            raise Exception(f"RAG pipeline error: {str(e)}")
+    
+    def _answer(self, vector_store: VectorStore, question: str, question_embedding) -> Tuple[Dict[str, Any], bool]:
+        """The response, and whether it is final enough to cache (see `Answer`)."""
+        relevant_chunks, image_data = self._cached_retrieval(vector_store, question_embedding)
+        if relevant_chunks is None:
             # Retrieve relevant chunks
             logger.debug("Searching for relevant chunks")
-            relevant_chunks = vector_store.search(question_embedding, k=settings.TOP_K_CHUNKS)
-            logger.info("Found %s relevant chunks", len(relevant_chunks))
-            
-            if not relevant_chunks:
-                return {
-                    "answer": "I couldn't find relevant information in the learning material to answer your question.",
-                    "relevant_chunks": [],
-                    "image_id": None,
-                    "image_filename": None,
-                    "image_title": None
-                }
-            
-            # Extract chunk texts for LLM context
+            relevant_chunks = self._retrieve(vector_store, [question], question_embedding, k=settings.TOP_K_CHUNKS)[0]
+            image_data = self._select_image(vector_store.topic_id, question) if relevant_chunks else None
+            self._remember_retrieval(vector_store, question_embedding, relevant_chunks, image_data)
+        logger.info("Found %s relevant chunks", len(relevant_chunks))
+        
+        if not relevant_chunks:
+            return self._build_response(NO_RESULTS_ANSWER, [], None), True
+        
+        # Extract chunk texts for LLM context
+        chunk_texts = [chunk["text"] for chunk in relevant_chunks]
+        logger.debug("Chunk lengths: %s", [len(text) for text in chunk_texts])
+        
+        # Generate answer using LLM
+        logger.debug("Generating answer with LLM")
+        with metrics.stage("answer"):
+            answer = self.llm_service.generate_answer(question, list(relevant_chunks), vector_store.sentence_idf)
+        logger.info("LLM answer generated (%s characters)", len(answer.text))
+        
+        return self._build_response(answer.text, chunk_texts, image_data), answer.final
+    
+    @staticmethod
+    def _cached_retrieval(vector_store: VectorStore,
+                          question_embedding) -> Tuple[Optional[Sequence[ChunkHit]], Optional[ImageMatch]]:
+        """
+        Chunks and image retrieved for a recent near-duplicate question, or
+        `(None, None)`. The answer is always composed for the question asked.
+        """
+        with metrics.stage("semantic_cache"):
+            retrieval = semantic_cache.lookup(vector_store.topic_id, vector_store.index_version, question_embedding)[0]
+        if retrieval is None:
+            metrics.registry.inc("rag_answers_total", source="computed")
+            return None, None
+        logger.info("Reusing the retrieval of a near-duplicate question for topic %s", vector_store.topic_id)
+        metrics.registry.inc("rag_answers_total", source="semantic_cache")
+        return retrieval
+    
+    @staticmethod
+    def _remember_retrieval(vector_store: VectorStore, question_embedding, relevant_chunks: Sequence[ChunkHit],
+                            image_data: Optional[ImageMatch]):
+        semantic_cache.add(vector_store.topic_id, vector_store.index_version, question_embedding,
+                           (tuple(relevant_chunks), image_data))
+    
+    def _retrieve(self, vector_store: VectorStore, questions: List[str], question_embeddings,
+                  k: int) -> List[List[ChunkHit]]:
+        """
+        Top-k chunks per question. With hybrid search on, the topic's BM25
+        index is searched on the retrieval lane while the vector index is
+        searched here, `HYBRID_CANDIDATES` deep each, and the two lists are
+        fused (see `hybrid_search.fuse`).
+        """
+        if len(question_embeddings.shape) == 1:
+            question_embeddings = question_embeddings.reshape(1, -1)
+        if not settings.HYBRID_SEARCH_ENABLED or vector_store.keyword_index is None:
+            with metrics.stage("vector_search"):
+                return vector_store.search_batch(question_embeddings, k)
+        
+        depth = max(k, settings.HYBRID_CANDIDATES)
+        keyword_search = executor_service.retrieval.submit(
+            self._keyword_search, vector_store.keyword_index, questions, depth
+        )
+        try:
+            with metrics.stage("vector_search"):
+                vector_scores, vector_rows = vector_store.search_rows(question_embeddings, depth)
+        except Exception:
+            keyword_search.cancel()
+            raise
+        keyword_scores, keyword_rows = keyword_search.result()
+        with metrics.stage("fusion"):
+            fused = hybrid_search.fuse(vector_scores, vector_rows, keyword_scores, keyword_rows, k)
+        return [
+            [vector_store.chunk_result(row, similarity, keyword_score=keyword_score, fused_score=score)
+             for row, score, similarity, keyword_score in hits]
+            for hits in fused
+        ]
+    
+    @staticmethod
+    def _keyword_search(keyword_index, questions: List[str], depth: int):
+        with metrics.stage("keyword_search"):
+            return keyword_index.search_batch(questions, depth)
+    
+    def stream_query(self, topic_id: str, question: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        `process_query` as a sequence of `(event, data)` stages: `chunks` once
+        retrieval is done, `answer` for each piece of the answer as it is
+        composed, `image` once the diagram is picked, and `done` with the
+        full response. Cached answers are replayed through the same events.
+        """
+        try:
+            logger.info("Starting streaming RAG pipeline for topic %s", topic_id)
+            
+            vector_store = VectorStore(topic_id)
+            if not vector_store.exists():
+                raise Exception(f"No vector store found for topic: {topic_id}")
+            with metrics.stage("index_load"):
+                vector_store.load_index()
+            
+            cache_key = response_cache.make_key(topic_id, question, vector_store.index_version)
+            with metrics.stage("cache_lookup"):
+                cached = response_cache.get(cache_key)
+            if cached is not None:
+                metrics.registry.inc("rag_answers_total", source="response_cache")
+                yield from self._replay(cached)
+                return
+            
+            with metrics.stage("query_embedding"):
+                question_embedding = self.embedding_service.generate_single_embedding(
+                    question, namespace="chunks", sparse=vector_store.is_sparse, topic_id=topic_id
+                )
+            relevant_chunks, image_data = self._cached_retrieval(vector_store, question_embedding)
+            retrieved = relevant_chunks is None
+            if retrieved:
+                relevant_chunks = self._retrieve(
+                    vector_store, [question], question_embedding, k=settings.TOP_K_CHUNKS
+                )[0]
             chunk_texts = [chunk["text"] for chunk in relevant_chunks]
-            logger.debug("Chunk lengths: %s", [len(text) for text in chunk_texts])
+            yield "chunks", {"relevant_chunks": chunk_texts}
             
-            # Generate answer using LLM
-            logger.debug("Generating answer with LLM")
-            answer = self.llm_service.generate_answer(question, chunk_texts)
-            logger.info("LLM answer generated (%s characters)", len(answer))
+            final = True
+            if not chunk_texts:
+                answer, image_data = NO_RESULTS_ANSWER, None
+                yield "answer", {"delta": answer}
+            else:
+                # Time spent composing, not waiting for the client to take each piece
+                pieces, composing = [], 0.0
+                answer_pieces = self.llm_service.iter_answer(question, list(relevant_chunks), vector_store.sentence_idf)
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        piece = next(answer_pieces)
+                    except StopIteration as stop:
+                        final = stop.value
+                        break
+                    finally:
+                        composing += time.perf_counter() - started
+                    pieces.append(piece)
+                    yield "answer", {"delta": piece}
+                metrics.record("answer", composing)
+                answer = "".join(pieces)
+                if retrieved:
+                    image_data = self._select_image(topic_id, question)
+            if retrieved:
+                self._remember_retrieval(vector_store, question_embedding, relevant_chunks, image_data)
             
-            # Ensure image metadata is ready and find the best match
-            logger.debug("Finding relevant image")
-            relevant_images = self.image_service.find_relevant_image(topic_id, question, top_k=1)
-            image_data = relevant_images[0] if relevant_images else None
-
-            if image_data and image_data.get("similarity_score", 0) < settings.IMAGE_SIMILARITY_THRESHOLD:
-                logger.debug(
-                    "Discarding low-similarity image (score=%.3f, threshold=%.3f)",
-                    image_data["similarity_score"],
-                    settings.IMAGE_SIMILARITY_THRESHOLD,
+            result = self._build_response(answer, chunk_texts, image_data)
+            yield "image", self._image_event(result)
+            
+            if final:
+                response_cache.put(cache_key, result)
+            yield "done", result
+        
+        except Exception as e:
+            logger.exception("Streaming RAG pipeline error: %s", e)
+            raise Exception(f"RAG pipeline error: {str(e)}")
+    
+    def stream_library_query(self, question: str, topic_ids: Optional[List[str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """`process_library_query` delivered through the `stream_query` events."""
+        yield from self._replay(self.process_library_query(question, topic_ids))
+    
+    @classmethod
+    def _replay(cls, result: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Emit a finished response as stream events."""
+        yield "chunks", {"relevant_chunks": result["relevant_chunks"]}
+        yield "answer", {"delta": result["answer"]}
+        yield "image", cls._image_event(result)
+        yield "done", result
+    
+    @staticmethod
+    def _image_event(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: result[key] for key in ("image_id", "image_filename", "image_title")}
+    
+    def process_queries(self, topic_id: str, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Answer many questions about one topic. Questions are embedded in one
+        transform, searched with one index call and matched to images with
+        one similarity matrix; results come back in question order.
+        Cached answers are reused and only the misses are computed.
+        """
+        if not questions:
+            return []
+        try:
+            logger.info("Starting batch RAG pipeline for topic %s (%s questions)", topic_id, len(questions))
+            
+            vector_store = VectorStore(topic_id)
+            if not vector_store.exists():
+                raise Exception(f"No vector store found for topic: {topic_id}")
+            with metrics.stage("index_load"):
+                vector_store.load_index()
+            
+            cache_keys = [response_cache.make_key(topic_id, question, vector_store.index_version)
+                          for question in questions]
+            with metrics.stage("cache_lookup"):
+                results = [response_cache.get(key) for key in cache_keys]
+            misses = [i for i, result in enumerate(results) if result is None]
+            metrics.registry.inc("rag_answers_total", len(questions) - len(misses), source="response_cache")
+            if not misses:
+                return results
+            
+            with metrics.stage("query_embedding"):
+                question_embeddings = self.embedding_service.generate_query_embeddings(
+                    [questions[i] for i in misses], namespace="chunks", sparse=vector_store.is_sparse,
+                    topic_id=topic_id
                 )
-                image_data = None
-
-            logger.info("Selected image: %s", image_data["title"] if image_data else "None")
+            # Near-duplicates of recent questions reuse their chunks and image
+            with metrics.stage("semantic_cache"):
+                retrievals = semantic_cache.lookup(topic_id, vector_store.index_version, question_embeddings)
+            rows = [row for row, retrieval in enumerate(retrievals) if retrieval is None]
+            metrics.registry.inc("rag_answers_total", len(misses) - len(rows), source="semantic_cache")
+            metrics.registry.inc("rag_answers_total", len(rows), source="computed")
+            if rows:
+                missed_questions = [questions[misses[row]] for row in rows]
+                batch_chunks = self._retrieve(
+                    vector_store, missed_questions, question_embeddings[rows], k=settings.TOP_K_CHUNKS
+                )
+                with metrics.stage("image_match"):
+                    batch_images = self.image_service.find_relevant_images(topic_id, missed_questions, top_k=1)
+                for row, relevant_chunks, relevant_images in zip(rows, batch_chunks, batch_images):
+                    image_data = self._apply_image_threshold(relevant_images) if relevant_chunks else None
+                    self._remember_retrieval(vector_store, question_embeddings[row], relevant_chunks, image_data)
+                    retrievals[row] = (relevant_chunks, image_data)
             
-            return {
-                "answer": answer,
-                "relevant_chunks": chunk_texts,
-                "image_id": image_data["id"] if image_data else None,
-                "image_filename": image_data["filename"] if image_data else None,
-                "image_title": image_data["title"] if image_data else None
-            }
+            # Answers for the whole batch are composed together (concurrently for remote models)
+            batch_texts = [[chunk["text"] for chunk in relevant_chunks] for relevant_chunks, _ in retrievals]
+            answerable = [row for row, chunk_texts in enumerate(batch_texts) if chunk_texts]
+            with metrics.stage("answer"):
+                answers = self.llm_service.generate_answers(
+                    [(questions[misses[row]], list(retrievals[row][0])) for row in answerable],
+                    vector_store.sentence_idf,
+                )
+            answers_by_row = dict(zip(answerable, answers))
             
+            for row, i in enumerate(misses):
+                if row not in answers_by_row:
+                    result, final = self._build_response(NO_RESULTS_ANSWER, [], None), True
+                else:
+                    answer = answers_by_row[row]
+                    result, final = self._build_response(answer.text, batch_texts[row], retrievals[row][1]), answer.final
+                if final:
+                    response_cache.put(cache_keys[i], result)
+                results[i] = result
+            
+            logger.info("Batch RAG pipeline answered %s questions for topic %s (%s retrieved, the rest cached)",
+                        len(results), topic_id, len(rows))
+            return results
+        
         except Exception as e:
-            logger.exception("RAG pipeline error: %s", e)
+            logger.exception("Batch RAG pipeline error: %s", e)
+            raise Exception(f"RAG pipeline error: {str(e)}")
+    
+    def process_library_query(self, question: str, topic_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Answer from the cross-topic library index: one search over `topic_ids`
+        (or every topic) instead of loading each topic's index in turn.
+        """
+        try:
+            logger.info("Starting library RAG pipeline (topics=%s)", topic_ids or "all")
+            
+            with metrics.stage("library_search"):
+                hits = self.library_index.search(question, k=settings.TOP_K_CHUNKS, topic_ids=topic_ids)
+            logger.info("Found %s relevant chunks across the library", len(hits))
+            if not hits:
+                return self._build_response(NO_RESULTS_ANSWER, [], None, source_topic_ids=[])
+            
+            # Chunk text stays in each topic's store; only the hit topics are opened
+            relevant_chunks = []
+            with metrics.stage("index_load"):
+                for hit in hits:
+                    vector_store = VectorStore(hit["topic_id"])
+                    vector_store.load_index()
+                    relevant_chunks.append(ChunkHit(vector_store.chunks, hit["row"], hit["similarity_score"]))
+            chunk_texts = [chunk["text"] for chunk in relevant_chunks]
+            
+            # Sentence idf is per topic, so mixed-topic answers score by plain word overlap
+            with metrics.stage("answer"):
+                answer = self.llm_service.generate_answer(question, relevant_chunks).text
+            logger.info("LLM answer generated (%s characters)", len(answer))
+            
+            # Diagrams are per topic: use the topic of the best passage
+            image_data = self._select_image(hits[0]["topic_id"], question)
+            source_topic_ids = list(dict.fromkeys(hit["topic_id"] for hit in hits))
+            metrics.registry.inc("rag_answers_total", source="library")
+            return self._build_response(answer, chunk_texts, image_data, source_topic_ids=source_topic_ids)
+        
+        except Exception as e:
+            logger.exception("Library RAG pipeline error: %s", e)
             raise Exception(f"RAG pipeline error: {str(e)}")
     
+    def _select_image(self, topic_id: str, question: str) -> Optional[ImageMatch]:
+        # Ensure image metadata is ready and find the best match
+        logger.debug("Finding relevant image")
+        with metrics.stage("image_match"):
+            relevant_images = self.image_service.find_relevant_image(topic_id, question, top_k=1)
+        return self._apply_image_threshold(relevant_images)
+    
+    @staticmethod
+    def _apply_image_threshold(relevant_images: List[ImageMatch]) -> Optional[ImageMatch]:
+        image_data = relevant_images[0] if relevant_images else None
+        
+        if image_data and image_data.similarity_score < settings.IMAGE_SIMILARITY_THRESHOLD:
+            logger.debug(
+                "Discarding low-similarity image (score=%.3f, threshold=%.3f)",
+                image_data.similarity_score,
+                settings.IMAGE_SIMILARITY_THRESHOLD,
+            )
+            image_data = None
+        
+        logger.info("Selected image: %s", image_data.title if image_data else "None")
+        return image_data
+    
+    @staticmethod
+    def _build_response(answer: str, chunk_texts: List[str], image_data: Optional[ImageMatch],
+                        source_topic_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        # Plain values only: this is what the caches keep and the API returns
+        return {
+            "answer": answer,
+            "relevant_chunks": chunk_texts,
+            "image_id": image_data.id if image_data else None,
+            "image_filename": image_data.filename if image_data else None,
+            "image_title": image_data.title if image_data else None,
+            "source_topic_ids": source_topic_ids,
+        }
+    
+    def sync_library(self) -> int:
+        """
+        Add indexed topics that are missing from the library index (e.g.
+        topics uploaded before it existed). Returns the number added.
+        """
+        added = 0
+        for topic_id in self.get_available_topics():
+            if self.library_index.has_topic(topic_id):
+                continue
+            try:
+                vector_store = VectorStore(topic_id)
+                vector_store.load_index()
+                self.library_index.add_topic(topic_id, [chunk["text"] for chunk in vector_store.chunks])
+                added += 1
+            except Exception as e:
+                logger.warning("Could not add topic %s to the library index: %s", topic_id, e)
+        if added:
+            logger.info("Added %s existing topics to the library index", added)
+        return added
+    
+    def migrate_chunk_stores(self) -> int:
+        """
+        Move topics whose chunks still live in the metadata JSON to the
+        columnar chunk store, and write BM25 indexes for topics saved
+        without one. Returns the number migrated.
+        """
+        migrated = 0
+        for topic_id in self.get_available_topics():
+            try:
+                migrated += VectorStore(topic_id).migrate_chunks()
+            except Exception as e:
+                logger.warning("Could not migrate chunks of topic %s: %s", topic_id, e)
+        if migrated:
+            logger.info("Migrated %s topics to the current chunk store format", migrated)
+        return migrated
+    
     def get_available_topics(self) -> List[str]:
         """
         Get list of available topics (for debugging)
@@ -94,8 +439,8 @@ class RAGPipeline:
         
         if os.path.exists(vector_dir):
             for filename in os.listdir(vector_dir):
-                if filename.endswith(".faiss"):
-                    topic_id = filename.replace(".faiss", "")
+                if filename.endswith("_metadata.json"):
+                    topic_id = filename[:-len("_metadata.json")]
                     topics.append(topic_id)
         
-        return topics
\ No newline at end of file
+        return topics
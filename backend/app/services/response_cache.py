@@ -0,0 +1,147 @@
+import copy
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n?!.,;:'\""
+
+CacheKey = Tuple[str, str, str]
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and end-punctuation-insensitive form of a question."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+class ResponseCache:
+    """
+    Cache of finished chat responses keyed by `(topic_id, normalized
+    question, index_version)`. A re-indexed topic gets a new index version,
+    so stale answers are never served even by other processes.
+    
+    Entries live in an in-memory LRU with a TTL and, when
+    RESPONSE_CACHE_PERSIST is on, in a SQLite file that survives restarts
+    and is shared by every worker process.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.ttl = settings.RESPONSE_CACHE_TTL_SECONDS
+        self.memory = LRUCache("response", max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+        self.disk_hits = 0
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.enabled and settings.RESPONSE_CACHE_PERSIST:
+            self._open_db(db_path or settings.RESPONSE_CACHE_DB_PATH)
+    
+    def _open_db(self, db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " topic_id TEXT NOT NULL, question TEXT NOT NULL, index_version TEXT NOT NULL,"
+                " response TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (topic_id, question, index_version))"
+            )
+            db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            db.commit()
+            self._db = db
+        except sqlite3.Error as e:
+            logger.warning("Response cache database %s unavailable, using memory only: %s", db_path, e)
+    
+    @staticmethod
+    def make_key(topic_id: str, question: str, index_version: Optional[str]) -> Optional[CacheKey]:
+        if not index_version:
+            return None
+        return topic_id, normalize_question(question), index_version
+    
+    def get(self, key: Optional[CacheKey]) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached response, or None on a miss or expiry."""
+        if not self.enabled or key is None:
+            return None
+        now = time.time()
+        entry = self.memory.get(key, is_valid=lambda entry: entry[0] > now)
+        if entry is not None:
+            return copy.deepcopy(entry[1])
+        
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM responses"
+                    " WHERE topic_id = ? AND question = ? AND index_version = ? AND expires_at > ?",
+                    key + (now,),
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+        except sqlite3.Error as e:
+            logger.warning("Response cache read failed: %s", e)
+            return None
+        if row is None:
+            return None
+        
+        response = json.loads(row[0])
+        self.memory.put(key, (row[1], response))
+        return copy.deepcopy(response)
+    
+    def put(self, key: Optional[CacheKey], response: Dict[str, Any]):
+        if not self.enabled or key is None:
+            return
+        expires_at = time.time() + self.ttl
+        response = copy.deepcopy(response)
+        self.memory.put(key, (expires_at, response))
+        
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    key + (json.dumps(response), expires_at),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Response cache write failed: %s", e)
+    
+    def invalidate_topic(self, topic_id: str):
+        """Drop every cached response for a topic (all index versions)."""
+        self.memory.invalidate_where(lambda key: key[0] == topic_id)
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses WHERE topic_id = ?", (topic_id,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Response cache invalidation failed for topic %s: %s", topic_id, e)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        lookups = stats["hits"] + stats["misses"]
+        # Memory misses answered from SQLite still count as hits overall
+        stats.update(
+            enabled=self.enabled,
+            ttl_seconds=self.ttl,
+            persistent=self._db is not None,
+            memory_hit_rate=stats["hit_rate"],
+            disk_hits=self.disk_hits,
+            hit_rate=round((stats["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        )
+        return stats
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,141 @@
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from scipy import sparse
+from app.core.config import settings
+from app.services.cache import LRUCache
+
+
+class _TopicQuestions:
+    """
+    Recent question vectors for one topic and index version. Rows are
+    L2-normalised, so one matrix product gives cosine similarity to every
+    cached question; at this size exact search beats any ANN structure.
+    Full slots are reused least-recently-hit first.
+    """
+    def __init__(self, index_version: str, dimension: int, capacity: int):
+        self.index_version = index_version
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.entries: List[Any] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.clock = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+    
+    def match(self, queries: np.ndarray, threshold: float) -> List[Any]:
+        with self.lock:
+            if self.size == 0:
+                return [None] * queries.shape[0]
+            similarities = queries @ self.vectors[:self.size].T
+            best = similarities.argmax(axis=1)
+            matches = []
+            for row, slot in enumerate(best):
+                if similarities[row, slot] >= threshold:
+                    self.clock += 1
+                    self.last_used[slot] = self.clock
+                    matches.append(self.entries[slot])
+                else:
+                    matches.append(None)
+            return matches
+    
+    def add(self, vector: np.ndarray, entry: Any):
+        with self.lock:
+            if self.size < len(self.entries):
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(self.last_used.argmin())
+            self.clock += 1
+            self.vectors[slot] = vector
+            self.entries[slot] = entry
+            self.last_used[slot] = self.clock
+
+
+def _as_unit_rows(embeddings) -> np.ndarray:
+    if sparse.issparse(embeddings):
+        embeddings = embeddings.toarray()
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+
+
+class SemanticCache:
+    """
+    Per-topic cache of retrieval results keyed by question vector rather
+    than text. A question whose TF-IDF vector is within
+    SEMANTIC_CACHE_THRESHOLD cosine of a recently answered one reuses its
+    chunks and image, skipping the index searches; the answer itself is
+    still composed for the new question. Whole answers are not reused
+    because stop words (what, why, not, no) are not in the vectors, so
+    "Is sound a wave?" and "Is sound not a wave?" match exactly. Entries
+    belong to one index version and are dropped when the topic is
+    re-indexed.
+    """
+    def __init__(self):
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        self.capacity = settings.SEMANTIC_CACHE_MAX_PER_TOPIC
+        self.topics = LRUCache("semantic_topics", max_entries=settings.SEMANTIC_CACHE_MAX_TOPICS)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _topic(self, topic_id: str, index_version: str, dimension: int, create: bool) -> Optional[_TopicQuestions]:
+        entries = self.topics.get(
+            topic_id,
+            is_valid=lambda entry: entry.index_version == index_version and entry.vectors.shape[1] == dimension,
+        )
+        if entries is None and create:
+            entries = _TopicQuestions(index_version, dimension, self.capacity)
+            self.topics.put(topic_id, entries, nbytes=entries.nbytes)
+        return entries
+    
+    def lookup(self, topic_id: str, index_version: Optional[str], embeddings) -> List[Any]:
+        """
+        Cached entry for each query row (None where nothing is close
+        enough). Entries are shared between callers and must not be changed.
+        """
+        count = embeddings.shape[0] if len(embeddings.shape) == 2 else 1
+        if not self.enabled or not index_version or self.capacity <= 0:
+            return [None] * count
+        
+        queries = _as_unit_rows(embeddings)
+        entries = self._topic(topic_id, index_version, queries.shape[1], create=False)
+        matches = entries.match(queries, self.threshold) if entries is not None else [None] * count
+        hits = sum(match is not None for match in matches)
+        with self._lock:
+            self.hits += hits
+            self.misses += count - hits
+        return matches
+    
+    def add(self, topic_id: str, index_version: Optional[str], embedding, entry: Any):
+        if not self.enabled or not index_version or self.capacity <= 0:
+            return
+        vector = _as_unit_rows(embedding)[0]
+        if not vector.any():
+            # Questions made only of stop words match nothing
+            return
+        entries = self._topic(topic_id, index_version, vector.shape[0], create=True)
+        entries.add(vector, entry)
+    
+    def invalidate_topic(self, topic_id: str):
+        self.topics.invalidate(topic_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "topics": len(self.topics),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,144 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Mapping, Sequence, Tuple, Union
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+# Same boundaries LLMService has always used: split after . ! ? and whitespace
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+KEYWORD_PATTERN = re.compile(r"\b\w{4,}\b")
+
+
+def normalize_token(token: str) -> str:
+    # Fold simple plurals so "compressions" matches "compression"
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Sorted, de-duplicated content words (4+ characters, no stop words)."""
+    return sorted({
+        normalize_token(token)
+        for token in KEYWORD_PATTERN.findall(text.lower())
+        if token not in ENGLISH_STOP_WORDS
+    })
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """`[start, end)` offsets into `text` of each sentence, whitespace-trimmed."""
+    stripped = text.strip()
+    if not stripped:
+        return []
+    offset = len(text) - len(text.lstrip())
+    spans, start = [], 0
+    for match in SENTENCE_BREAK.finditer(stripped):
+        spans.append((offset + start, offset + match.start()))
+        start = match.end()
+    spans.append((offset + start, offset + len(stripped)))
+    return spans
+
+
+def annotate_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Add `sentences` (offsets) and `sentence_tokens` to each chunk in place and
+    return the smoothed idf of every token over all sentences of the topic.
+    Chunks that are already annotated are only counted.
+    """
+    document_frequency: Counter = Counter()
+    total = 0
+    for chunk in chunks:
+        if not is_annotated(chunk):
+            text = chunk["text"]
+            spans = split_sentences(text)
+            chunk["sentences"] = [list(span) for span in spans]
+            chunk["sentence_tokens"] = [tokenize(text[start:end]) for start, end in spans]
+        tokens = chunk["sentence_tokens"]
+        total += len(tokens)
+        for sentence_tokens in tokens:
+            document_frequency.update(sentence_tokens)
+    return {
+        token: round(math.log((1 + total) / (1 + df)) + 1.0, 4)
+        for token, df in document_frequency.items()
+    }
+
+
+def is_annotated(chunk: Any) -> bool:
+    if isinstance(chunk, dict):
+        return "sentences" in chunk and "sentence_tokens" in chunk
+    # Search result views (chunk_store.ChunkHit) say whether their row has them
+    return getattr(chunk, "annotated", False)
+
+
+class TermWeights:
+    """
+    Read-only token -> weight table over two parallel arrays: sorted `terms`
+    (e.g. a chunk store's memory-mapped vocabulary) and their `weights`.
+    Answers `get` like the dict it replaces, for the eight bytes of a weight
+    per term instead of a Python string and float each.
+    """
+    __slots__ = ("terms", "weights")
+    
+    def __init__(self, terms: np.ndarray, weights: np.ndarray):
+        self.terms = terms
+        self.weights = weights
+    
+    @classmethod
+    def from_dict(cls, weights: Mapping[str, float]) -> "TermWeights":
+        terms = sorted(weights)
+        return cls(
+            np.array(terms, dtype=f"<U{max(map(len, terms), default=1)}"),
+            np.array([weights[term] for term in terms], dtype=np.float64),
+        )
+    
+    def get(self, token: str, default: float = 1.0) -> float:
+        position = int(np.searchsorted(self.terms, token))
+        if position < len(self.terms) and self.terms[position] == token:
+            return float(self.weights[position])
+        return default
+    
+    def __len__(self) -> int:
+        return len(self.terms)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.terms.nbytes + self.weights.nbytes
+
+
+# Sentence idf as built at ingest (dict) or as held by a loaded topic
+Weights = Union[Mapping[str, float], TermWeights]
+
+
+def select_sentences(
+    question: str,
+    chunks: Sequence[Any],
+    idf: Weights,
+    limit: int,
+) -> List[Tuple[int, str]]:
+    """
+    Pick up to `limit` sentences sharing words with the question, scored by
+    the summed idf of the shared words. Returns `(chunk_number, sentence)`
+    in reading order. With no overlap anywhere, falls back to the opening
+    sentences of the best-ranked chunk.
+    """
+    question_tokens = set(tokenize(question))
+    candidates = []
+    if question_tokens:
+        for chunk_idx, chunk in enumerate(chunks):
+            for sentence_idx, tokens in enumerate(chunk["sentence_tokens"]):
+                shared = question_tokens.intersection(tokens)
+                if shared:
+                    score = sum(idf.get(token, 1.0) for token in shared)
+                    candidates.append((-score, chunk_idx, sentence_idx))
+
+    if candidates:
+        picked = sorted(sorted(candidates)[:limit], key=lambda item: (item[1], item[2]))
+    else:
+        picked = [(0.0, 0, sentence_idx) for sentence_idx in range(min(2, len(chunks[0]["sentences"])))]
+
+    selected = []
+    for _, chunk_idx, sentence_idx in picked:
+        start, end = chunks[chunk_idx]["sentences"][sentence_idx]
+        selected.append((chunk_idx + 1, chunks[chunk_idx]["text"][start:end]))
+    return selected
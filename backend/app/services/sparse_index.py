@@ -0,0 +1,87 @@
+import logging
+import os
+from typing import Tuple
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+_PARTS = ("data", "indices", "indptr")
+# Dense score cells materialised per query block (~16 MB of float32)
+_SCORE_BLOCK_CELLS = 1 << 22
+
+
+class SparseIndex:
+    """
+    Exact inner-product search over sparse, L2-normalised TF-IDF rows.
+    Vectors are kept column-major (CSC), i.e. as an inverted index from term
+    to the chunks containing it, so a query only touches the postings of its
+    own non-zero terms. Memory and query time scale with non-zeros rather
+    than `max_features x chunks`. Mirrors the parts of the FAISS index API
+    that VectorStore uses (`d`, `ntotal`, `search`).
+    """
+    def __init__(self, matrix):
+        self.postings = sparse.csc_matrix(matrix, dtype=np.float32)
+        self.postings.sort_indices()
+    
+    @property
+    def d(self) -> int:
+        return self.postings.shape[1]
+    
+    @property
+    def ntotal(self) -> int:
+        return self.postings.shape[0]
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self.postings, part).nbytes for part in _PARTS)
+    
+    def search(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return `(scores, indices)` of shape (n_queries, k), best first.
+        Missing results are padded with score 0 and index -1 like FAISS.
+        """
+        queries = sparse.csr_matrix(queries, dtype=np.float32)
+        k_eff = min(k, self.ntotal)
+        scores = np.zeros((queries.shape[0], k), dtype=np.float32)
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        if k_eff == 0:
+            return scores, indices
+        
+        # One sparse product per block of queries; blocks bound the dense
+        # (queries x chunks) score matrix
+        block = max(1, _SCORE_BLOCK_CELLS // max(self.ntotal, 1))
+        for start in range(0, queries.shape[0], block):
+            block_scores = (queries[start:start + block] @ self.postings.T).toarray()
+            top = np.argpartition(-block_scores, k_eff - 1, axis=1)[:, :k_eff]
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            rows = slice(start, start + block_scores.shape[0])
+            scores[rows, :k_eff] = np.take_along_axis(top_scores, order, axis=1)
+            indices[rows, :k_eff] = np.take_along_axis(top, order, axis=1)
+        return scores, indices
+    
+    def save(self, prefix: str):
+        """
+        Write the CSC arrays as `{prefix}_{part}.npy` so they can be
+        memory-mapped. Each file is renamed into place, so a process that has
+        the old one mapped keeps reading it.
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        for part in _PARTS:
+            path = f"{prefix}_{part}.npy"
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, getattr(self.postings, part))
+            os.replace(f"{path}.tmp", path)
+    
+    @classmethod
+    def load(cls, prefix: str, shape: Tuple[int, int], mmap: bool = False) -> "SparseIndex":
+        mmap_mode = "r" if mmap else None
+        arrays = [np.load(f"{prefix}_{part}.npy", mmap_mode=mmap_mode) for part in _PARTS]
+        index = cls.__new__(cls)
+        index.postings = sparse.csc_matrix(tuple(arrays), shape=tuple(shape))
+        return index
+    
+    @staticmethod
+    def files(prefix: str):
+        return [f"{prefix}_{part}.npy" for part in _PARTS]
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from typing import Iterable, Optional
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+# Same defaults as TfidfVectorizer(stop_words='english')
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+FORMAT_VERSION = "npy-v1"
+
+
+class TfidfModel:
+    """
+    Read-only TF-IDF transform backed by two flat arrays: the vocabulary as a
+    sorted fixed-width string array and the matching idf weights. Both are
+    saved as `.npy` and memory-mapped on load, so every worker process shares
+    the same pages and nothing has to be unpickled. `transform` reproduces
+    `TfidfVectorizer(stop_words='english').transform` (lowercase, default
+    token pattern, raw counts, L2 row norm).
+    """
+    def __init__(self, terms: np.ndarray, idf: np.ndarray, version: Optional[str] = None):
+        self.terms = terms
+        self.idf = idf
+        self.version = version or self.compute_version(terms, idf)
+    
+    @classmethod
+    def from_vectorizer(cls, vectorizer: TfidfVectorizer) -> "TfidfModel":
+        # sklearn assigns feature indices in sorted term order, so the sorted
+        # term array lines up with both idf_ and existing index columns
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        if terms != sorted(terms):
+            raise ValueError("Vectorizer vocabulary is not in sorted order")
+        return cls(np.array(terms, dtype=str), np.asarray(vectorizer.idf_, dtype=np.float64))
+    
+    @staticmethod
+    def compute_version(terms: np.ndarray, idf: np.ndarray) -> str:
+        """Hash of the vocabulary and idf weights."""
+        digest = hashlib.sha256()
+        digest.update("\n".join(terms.tolist()).encode("utf-8"))
+        digest.update(np.ascontiguousarray(idf, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+    
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.terms)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.terms.nbytes + self.idf.nbytes
+    
+    def transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        """Return L2-normalised TF-IDF rows as a float32 CSR matrix."""
+        indptr = [0]
+        indices = []
+        data = []
+        for text in texts:
+            counts = Counter(
+                token for token in TOKEN_PATTERN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS
+            )
+            if not counts:
+                indptr.append(indptr[-1])
+                continue
+            
+            tokens = np.array(list(counts), dtype=str)
+            positions = np.searchsorted(self.terms, tokens)
+            positions[positions == len(self.terms)] = 0
+            known = self.terms[positions] == tokens
+            columns = positions[known]
+            weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))[known]
+            weights *= self.idf[columns]
+            norm = np.sqrt(np.dot(weights, weights))
+            if norm > 0:
+                weights /= norm
+            order = np.argsort(columns)
+            indices.append(columns[order])
+            data.append(weights[order])
+            indptr.append(indptr[-1] + len(columns))
+        
+        return sparse.csr_matrix(
+            (
+                np.concatenate(data).astype(np.float32) if data else np.zeros(0, dtype=np.float32),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                np.array(indptr, dtype=np.int64),
+            ),
+            shape=(len(indptr) - 1, len(self.terms)),
+        )
+    
+    @staticmethod
+    def paths(prefix: str):
+        return f"{prefix}_terms.npy", f"{prefix}_idf.npy", f"{prefix}.json"
+    
+    def save(self, prefix: str, **info):
+        """
+        Write `{prefix}_terms.npy`, `{prefix}_idf.npy` and `{prefix}.json`.
+        The JSON file is written last and atomically, marking a complete model.
+        """
+        terms_path, idf_path, info_path = self.paths(prefix)
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        # Renamed into place: other processes may have the old arrays mapped
+        for path, array in ((terms_path, self.terms), (idf_path, self.idf)):
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{path}.tmp", path)
+        info.update(format=FORMAT_VERSION, version=self.version, vocabulary_size=self.vocabulary_size)
+        with open(f"{info_path}.tmp", 'w') as f:
+            json.dump(info, f)
+        os.replace(f"{info_path}.tmp", info_path)
+    
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> "TfidfModel":
+        terms_path, idf_path, info_path = cls.paths(prefix)
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        if info.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vectorizer format at {prefix}: {info.get('format')}")
+        mmap_mode = "r" if mmap else None
+        return cls(np.load(terms_path, mmap_mode=mmap_mode), np.load(idf_path, mmap_mode=mmap_mode), info["version"])
+    
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return all(os.path.exists(path) for path in cls.paths(prefix))
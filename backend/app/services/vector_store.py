@@ -2,107 +2,412 @@ import logging
 import os
 import json
 import pickle
+import uuid
 import numpy as np
-import faiss
-from typing import List, Dict, Any
+from scipy import sparse
+from typing import List, Dict, Any, Optional, Tuple
 from app.core.config import settings
+from app.services.cache import LRUCache
+from app.services.embedding_service import EmbeddingService
+from app.services.sparse_index import SparseIndex
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkHit, ChunkStore, FORMAT_VERSION as CHUNK_FORMAT
+from app.services.response_cache import response_cache
+from app.services.semantic_cache import semantic_cache
+from app.services import index_factory
+from app.services import sentence_index
+from app.services.sentence_index import TermWeights
 
 logger = logging.getLogger(__name__)
 
+# Loaded indexes shared by every VectorStore in this process, keyed by topic_id.
+index_cache = LRUCache(
+    "vector_index",
+    max_entries=settings.INDEX_CACHE_MAX_ENTRIES,
+    max_bytes=settings.INDEX_CACHE_MAX_BYTES,
+)
+
 class VectorStore:
+    # Loaded state shared through `index_cache`
+    _CACHED_FIELDS = ("backend", "index", "index_type", "index_params", "index_mapped", "chunks", "keyword_index",
+                      "vectorizer_version", "index_version", "sentence_idf")
+    
     def __init__(self, topic_id: str):
         self.topic_id = topic_id
         self.index = None
         self.chunks = []
+        # BM25 over the chunk texts, searched alongside `index` (see hybrid_search)
+        self.keyword_index: Optional[BM25Index] = None
+        self.backend = settings.VECTOR_BACKEND
+        self.index_type: Optional[str] = None
+        self.index_params: Dict[str, Any] = {}
+        # True when `index` was read as a read-only memory map (INDEX_MMAP)
+        self.index_mapped = False
+        self.vectorizer_version: Optional[str] = None
+        # Changes every time the topic is re-indexed; keys cached answers
+        self.index_version: Optional[str] = None
+        # Sentence-level idf used to score answer sentences (see sentence_index)
+        self.sentence_idf: Optional[sentence_index.Weights] = None
         self.index_path = os.path.join(settings.VECTOR_DIR, f"{topic_id}.faiss")
+        self.sparse_prefix = os.path.join(settings.VECTOR_DIR, f"{topic_id}_sparse")
+        self.chunks_prefix = os.path.join(settings.VECTOR_DIR, f"{topic_id}_chunks")
+        self.keyword_prefix = os.path.join(settings.VECTOR_DIR, f"{topic_id}_bm25")
         self.metadata_path = os.path.join(settings.VECTOR_DIR, f"{topic_id}_metadata.json")
+        self.vectorizer_info_path = os.path.join(settings.VECTOR_DIR, f"{topic_id}_vectorizer.json")
+    
+    @property
+    def is_sparse(self) -> bool:
+        return self.backend == "sparse"
     
-    def create_index(self, embeddings: np.ndarray, chunks: List[Dict[str, Any]]):
+    def create_index(self, embeddings, chunks: List[Dict[str, Any]], vectorizer_version: Optional[str] = None):
         """
-        Create FAISS index from embeddings and store chunks metadata
+        Create the search index from embeddings and store chunks metadata.
+        Sparse (scipy) embeddings build a SparseIndex; dense ones a FAISS index
+        of type FAISS_INDEX_TYPE (see index_factory). A BM25 index of the
+        chunk texts is built with it.
+        `vectorizer_version` identifies the topic vectorizer that produced them.
         """
         try:
             # Validate embeddings
-            if len(embeddings) == 0:
+            if embeddings.shape[0] == 0:
                 raise Exception("No embeddings provided")
             
             dimension = embeddings.shape[1]
-            logger.info("Creating FAISS index with dimension %s", dimension)
+            self.backend = "sparse" if sparse.issparse(embeddings) else "faiss"
+            logger.info("Creating %s index with dimension %s", self.backend, dimension)
+            
+            if self.is_sparse:
+                self.index = SparseIndex(embeddings)
+                self.index_type, self.index_params = "sparse_ip", {}
+            else:
+                self.index, self.index_type, self.index_params = index_factory.build_index(
+                    embeddings, settings.FAISS_INDEX_TYPE
+                )
+            self.index_mapped = False
+            self.chunks = ChunkStore.from_chunks(chunks, idf=sentence_index.annotate_chunks(chunks))
+            self.sentence_idf = self.chunks.term_weights()
+            self.keyword_index = BM25Index.from_texts(chunk["text"] for chunk in chunks)
+            self.vectorizer_version = vectorizer_version
+            self.index_version = uuid.uuid4().hex
+            
+            logger.info("Created %s index with %s chunks, dimension %s", self.backend, len(chunks), dimension)
+            
+        except Exception as e:
+            raise Exception(f"Error creating index: {str(e)}")
+    
+    @classmethod
+    def derive(cls, base_topic_id: str, topic_id: str) -> "VectorStore":
+        """
+        A private, in-memory copy of another topic's index that will be saved
+        as `topic_id`; the base topic itself is left untouched. The new topic
+        needs a copy of the base vectorizer before it is saved.
+        """
+        base = cls(base_topic_id)
+        # Read into memory: the copy is updated in place, which a mapped index cannot be
+        base.load_index(use_cache=False, mmap=False)
+        store = cls(topic_id)
+        for field in cls._CACHED_FIELDS:
+            setattr(store, field, getattr(base, field))
+        return store
+    
+    def supports_updates(self) -> bool:
+        """True if `update_index` can change this index in place."""
+        if self.index is None or self.index_mapped:
+            return False
+        return self.is_sparse or index_factory.supports_updates(self.index)
+    
+    def update_index(self, chunks: List[Dict[str, Any]], base_rows: List[Optional[int]], new_embeddings):
+        """
+        Turn the loaded index into the index of a revised document without
+        re-embedding unchanged chunks. `chunks` are the revision's chunks in
+        order; `base_rows[i]` is the row of an identical chunk in the current
+        index, or None for a new chunk. New chunks' vectors are the rows of
+        `new_embeddings` (None if there are none), in order. Vectors of chunks that are gone are
+        removed with `remove_ids` and new ones added with `add_with_ids`.
+        """
+        try:
+            if not self.supports_updates():
+                raise Exception(f"Index type {self.index_type} cannot be updated in place")
+            
+            if new_embeddings is None:
+                new_embeddings = sparse.csr_matrix((0, self.index.d), dtype=np.float32)
+            old_chunks = self.chunks
+            old_keys = old_chunks.keys if isinstance(old_chunks, ChunkStore) else np.arange(len(old_chunks))
+            reused = [row for row in base_rows if row is not None]
+            new_count = len(base_rows) - len(reused)
+            if new_count != new_embeddings.shape[0]:
+                raise Exception(f"Expected {new_count} new embeddings, got {new_embeddings.shape[0]}")
+            
+            for chunk, row in zip(chunks, base_rows):
+                if row is not None:
+                    # Same text, so the stored sentence annotations still apply
+                    old_chunk = old_chunks[row]
+                    chunk["sentences"] = old_chunk["sentences"]
+                    chunk["sentence_tokens"] = old_chunk["sentence_tokens"]
             
-            # Create FAISS index (L2 distance)
-            self.index = faiss.IndexFlatL2(dimension)
+            if self.is_sparse:
+                # Rows are positional, so the postings are reassembled in the new order
+                combined = sparse.vstack([self.index.postings.tocsr(), sparse.csr_matrix(new_embeddings)]).tocsr()
+                new_rows = iter(range(len(old_keys), len(old_keys) + new_count))
+                order = [row if row is not None else next(new_rows) for row in base_rows]
+                self.index = SparseIndex(combined[order])
+                keys = None
+            else:
+                removed = np.setdiff1d(old_keys, old_keys[reused]) if reused else old_keys
+                if len(removed):
+                    self.index.remove_ids(removed.astype(np.int64))
+                next_key = int(old_keys.max(initial=-1)) + 1
+                new_keys = np.arange(next_key, next_key + new_count, dtype=np.int64)
+                if new_count:
+                    if sparse.issparse(new_embeddings):
+                        new_embeddings = new_embeddings.toarray()
+                    vectors = index_factory.prepare_vectors(new_embeddings, self.index_type)
+                    self.index.add_with_ids(vectors, new_keys)
+                added = iter(new_keys)
+                keys = np.array([old_keys[row] if row is not None else next(added) for row in base_rows],
+                                dtype=np.int64)
             
-            # Add embeddings to index
-            self.index.add(embeddings.astype(np.float32))
-            self.chunks = chunks
+            self.chunks = ChunkStore.from_chunks(chunks, keys, idf=sentence_index.annotate_chunks(chunks))
+            self.sentence_idf = self.chunks.term_weights()
+            # BM25 weights depend on every chunk's length, so it is rebuilt (no embedding involved)
+            self.keyword_index = BM25Index.from_texts(chunk["text"] for chunk in chunks)
+            self.index_version = uuid.uuid4().hex
             
-            logger.info("Created FAISS index with %s chunks, dimension %s", len(chunks), dimension)
+            logger.info("Updated %s index: %s chunks reused, %s removed, %s added",
+                        self.backend, len(reused), len(old_keys) - len(reused), new_count)
             
         except Exception as e:
-            raise Exception(f"Error creating FAISS index: {str(e)}")
+            raise Exception(f"Error updating index: {str(e)}")
     
     def save_index(self):
         """
-        Save FAISS index and metadata to disk
+        Save the index and metadata to disk
         """
         try:
             if self.index is None:
                 raise Exception("No index to save")
             
-            # Save FAISS index
-            faiss.write_index(self.index, self.index_path)
+            # Write this backend's files and drop any left by the other one
+            if self.is_sparse:
+                self.index.save(self.sparse_prefix)
+                stale_files = [self.index_path]
+            else:
+                index_factory.write_index(self.index, self.index_path)
+                stale_files = SparseIndex.files(self.sparse_prefix)
+            for path in stale_files:
+                if os.path.exists(path):
+                    os.remove(path)
             
-            # Save metadata
-            metadata = {
-                "topic_id": self.topic_id,
-                "chunks": self.chunks,
-                "index_type": "FlatL2",
-                "total_chunks": len(self.chunks),
-                "dimension": self.index.d
-            }
+            self._write_chunks_and_metadata()
             
-            with open(self.metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            # Drop the stale entry and prime the cache with what we just wrote; when
+            # serving from memory maps the next load maps the files instead
+            index_cache.invalidate(self.topic_id)
+            response_cache.invalidate_topic(self.topic_id)
+            semantic_cache.invalidate_topic(self.topic_id)
+            if not settings.INDEX_MMAP:
+                self._cache_loaded_index()
             
             logger.info("Saved index and metadata for topic %s", self.topic_id)
             
         except Exception as e:
             raise Exception(f"Error saving index: {str(e)}")
     
-    def load_index(self):
+    def _write_chunks_and_metadata(self):
+        # Chunks go to the columnar store; the metadata file is written last
+        # and atomically, so a reader never sees it point at missing chunks
+        if not isinstance(self.chunks, ChunkStore):
+            self.chunks = ChunkStore.from_chunks(self.chunks, idf=self.sentence_idf)
+        elif self.chunks.idf is None:
+            # Stores written while the sentence idf lived in the metadata
+            self.chunks = self.chunks.with_idf(self.sentence_idf)
+        self.sentence_idf = self.chunks.term_weights()
+        self.chunks.save(self.chunks_prefix)
+        if self.keyword_index is None:
+            self.keyword_index = BM25Index.from_texts(self.chunks.texts())
+        self.keyword_index.save(self.keyword_prefix)
+        metadata = {
+            "topic_id": self.topic_id,
+            "chunk_format": CHUNK_FORMAT,
+            "backend": self.backend,
+            "index_type": self.index_type,
+            "metric": "inner_product" if self.is_sparse or index_factory.is_cosine(self.index_type) else "l2",
+            "index_params": self.index_params,
+            "total_chunks": len(self.chunks),
+            "dimension": self.index.d,
+            "vectorizer_version": self.vectorizer_version,
+            "index_version": self.index_version,
+        }
+        with open(f"{self.metadata_path}.tmp", 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(f"{self.metadata_path}.tmp", self.metadata_path)
+    
+    def migrate_chunks(self) -> bool:
         """
-        Load FAISS index and metadata from disk
+        Move chunks still embedded in a legacy metadata JSON into the columnar
+        store, move a sentence idf still in the metadata next to the store's
+        vocabulary, and write the BM25 index of topics saved before it
+        existed. Returns True if the topic was rewritten.
         """
         try:
-            if not os.path.exists(self.index_path):
+            with open(self.metadata_path, 'r') as f:
+                metadata = json.load(f)
+            if "chunks" not in metadata and "sentence_idf" not in metadata and BM25Index.exists(self.keyword_prefix):
+                return False
+            self.load_index(use_cache=False)
+            self._write_chunks_and_metadata()
+            index_cache.invalidate(self.topic_id)
+            logger.info("Migrated chunks of topic %s to the %s store", self.topic_id, CHUNK_FORMAT)
+            return True
+        except Exception as e:
+            raise Exception(f"Error migrating chunks: {str(e)}")
+    
+    def _index_files(self) -> List[str]:
+        """Index files present on disk: the FAISS file or the sparse arrays."""
+        if os.path.exists(self.index_path):
+            return [self.index_path]
+        sparse_files = SparseIndex.files(self.sparse_prefix)
+        if all(os.path.exists(path) for path in sparse_files):
+            return sparse_files
+        return []
+    
+    def _file_signature(self) -> Optional[Tuple[int, ...]]:
+        """
+        Modification times and combined size of the index files, used to detect
+        rewrites by other processes and to size cache entries.
+        """
+        try:
+            stats = [os.stat(path) for path in self._index_files() + [self.metadata_path]]
+        except OSError:
+            return None
+        if len(stats) < 2:
+            return None
+        for store in (ChunkStore.files(self.chunks_prefix), BM25Index.files(self.keyword_prefix)):
+            if all(os.path.exists(path) for path in store):
+                stats.extend(os.stat(path) for path in store)
+        stats.extend(os.stat(path) for path in ChunkStore.optional_files(self.chunks_prefix) if os.path.exists(path))
+        # A refitted vectorizer must also invalidate the cached index
+        if os.path.exists(self.vectorizer_info_path):
+            stats.append(os.stat(self.vectorizer_info_path))
+        return tuple(stat.st_mtime_ns for stat in stats) + (sum(stat.st_size for stat in stats),)
+    
+    def _cache_loaded_index(self, signature: Optional[Tuple[int, ...]] = None):
+        signature = signature or self._file_signature()
+        if signature is None:
+            return
+        state = tuple(getattr(self, field) for field in self._CACHED_FIELDS)
+        index_cache.put(self.topic_id, (signature, state), nbytes=signature[-1])
+    
+    def load_index(self, use_cache: bool = True, mmap: Optional[bool] = None):
+        """
+        Load the index and metadata from disk, reusing the process-wide
+        cache when the files have not changed since they were last read.
+        `mmap` (default INDEX_MMAP) maps the FAISS index or sparse postings
+        read-only instead of reading them into memory.
+        """
+        try:
+            if not self._index_files():
                 raise Exception(f"Index file not found: {self.index_path}")
             
-            # Load FAISS index
-            self.index = faiss.read_index(self.index_path)
+            # Taken before reading so a concurrent rewrite is never cached as current
+            signature = self._file_signature()
+            if use_cache:
+                cached = index_cache.get(self.topic_id, is_valid=lambda entry: entry[0] == signature)
+                if cached is not None:
+                    for field, value in zip(self._CACHED_FIELDS, cached[1]):
+                        setattr(self, field, value)
+                    logger.debug("Using cached index for topic %s", self.topic_id)
+                    return
             
             # Load metadata
             with open(self.metadata_path, 'r') as f:
                 metadata = json.load(f)
+            
+            self.vectorizer_version = metadata.get("vectorizer_version")
+            sentence_idf = metadata.get("sentence_idf")
+            if "chunks" in metadata:
+                # Legacy topics keep their chunks in the JSON until migrate_chunks runs
                 self.chunks = metadata["chunks"]
+                if sentence_idf is None:
+                    # Topics indexed before sentence annotation are annotated in memory
+                    sentence_idf = sentence_index.annotate_chunks(self.chunks)
+            else:
+                self.chunks = ChunkStore.load(self.chunks_prefix)
+            if isinstance(self.chunks, ChunkStore) and self.chunks.idf is not None:
+                self.sentence_idf = self.chunks.term_weights()
+            else:
+                # Topics saved before the idf moved into the chunk store; held as arrays all the same
+                self.sentence_idf = TermWeights.from_dict(sentence_idf or {})
+            if BM25Index.exists(self.keyword_prefix):
+                self.keyword_index = BM25Index.load(self.keyword_prefix, len(self.chunks))
+            else:
+                # Until migrate_chunks writes it, a legacy topic's BM25 index lives in memory
+                texts = self.chunks.texts() if isinstance(self.chunks, ChunkStore) else (c["text"] for c in self.chunks)
+                self.keyword_index = BM25Index.from_texts(texts)
+            # Metadata written before index versions existed is identified by its mtime
+            self.index_version = metadata.get("index_version") or f"mtime-{os.stat(self.metadata_path).st_mtime_ns}"
+            current_version = EmbeddingService().get_vectorizer_version(self.topic_id)
+            if self.vectorizer_version != current_version:
+                raise Exception(
+                    f"Vectorizer version mismatch for topic {self.topic_id}: index was built with "
+                    f"{self.vectorizer_version}, found {current_version}. Re-upload the PDF to rebuild it."
+                )
+            
+            # Indexes written before the sparse backend existed are FAISS FlatL2
+            self.backend = metadata.get("backend", "faiss")
+            self.index_type = index_factory.normalize_index_type(metadata.get("index_type", "flat_l2"))
+            self.index_params = metadata.get("index_params", {})
+            self.index_mapped = settings.INDEX_MMAP if mmap is None else mmap
+            if self.is_sparse:
+                self.index = SparseIndex.load(
+                    self.sparse_prefix, (metadata["total_chunks"], metadata["dimension"]), mmap=self.index_mapped
+                )
+            else:
+                self.index = index_factory.read_index(self.index_path, mmap=self.index_mapped)
+                index_factory.apply_search_params(self.index, self.index_params)
             
-            logger.info("Loaded index with %s chunks, dimension %s", len(self.chunks), self.index.d)
+            logger.info("Loaded %s index with %s chunks, dimension %s", self.backend, len(self.chunks), self.index.d)
+            
+            if use_cache:
+                self._cache_loaded_index(signature)
             
         except Exception as e:
             raise Exception(f"Error loading index: {str(e)}")
     
-    def search(self, query_embedding: np.ndarray, k: int = 3) -> List[Dict[str, Any]]:
+    def search(self, query_embedding, k: int = 3) -> List[ChunkHit]:
+        """
+        Search for similar chunks. Accepts dense or sparse query vectors and
+        converts them to whatever the loaded index needs. `similarity_score`
+        is the cosine similarity between the question and the chunk.
+        """
+        if len(query_embedding.shape) == 1:
+            query_embedding = query_embedding.reshape(1, -1)
+        return self.search_batch(query_embedding, k)[0]
+    
+    def search_batch(self, query_embeddings, k: int = 3) -> List[List[ChunkHit]]:
+        """
+        Search for many queries with one index call. Takes a 2-D dense or
+        sparse matrix with one row per query and returns one result list
+        per row, in order.
+        """
+        similarities, rows = self.search_rows(query_embeddings, k)
+        return [
+            [self.chunk_result(row, similarity) for similarity, row in zip(row_similarities, query_rows) if row >= 0]
+            for row_similarities, query_rows in zip(similarities.tolist(), rows.tolist())
+        ]
+    
+    def search_rows(self, query_embeddings, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Search for similar chunks using FAISS
+        `search_batch` without materialising chunks: `(similarities, rows)`
+        of shape (n_queries, k), where rows index `self.chunks` and missing
+        results are -1.
         """
         if self.index is None:
             self.load_index()
         
         try:
             # Validate query embedding dimensions
-            if len(query_embedding.shape) == 1:
-                query_embedding = query_embedding.reshape(1, -1)
-            
-            query_dim = query_embedding.shape[1]
+            query_dim = query_embeddings.shape[1]
             index_dim = self.index.d
             
             logger.debug("Query dimension: %s, Index dimension: %s", query_dim, index_dim)
@@ -110,25 +415,30 @@ class VectorStore:
             if query_dim != index_dim:
                 raise Exception(f"Dimension mismatch: Query has {query_dim} dimensions, but index has {index_dim} dimensions")
             
-            # Search in FAISS index
-            distances, indices = self.index.search(query_embedding.astype(np.float32), k)
+            if self.is_sparse:
+                # Inner product of L2-normalised TF-IDF rows is cosine similarity
+                similarities, indices = self.index.search(query_embeddings, k)
+            else:
+                if sparse.issparse(query_embeddings):
+                    query_embeddings = query_embeddings.toarray()
+                similarities, indices = index_factory.search(self.index, self.index_type, query_embeddings, k)
+                if isinstance(self.chunks, ChunkStore):
+                    # Updated indexes return vector ids rather than row numbers
+                    indices = self.chunks.rows_for_keys(indices)
             
-            # Get relevant chunks
-            results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx < len(self.chunks):
-                    chunk_data = self.chunks[idx].copy()
-                    chunk_data["similarity_score"] = float(1 / (1 + distance))  # Convert distance to similarity
-                    chunk_data["distance"] = float(distance)
-                    results.append(chunk_data)
-            
-            return results
+            indices = np.where((indices >= 0) & (indices < len(self.chunks)), indices, -1)
+            return similarities, indices
             
         except Exception as e:
             raise Exception(f"Error searching index: {str(e)}")
     
+    def chunk_result(self, row: int, similarity: float, keyword_score: Optional[float] = None,
+                     fused_score: Optional[float] = None) -> ChunkHit:
+        """The chunk at `row` as a search result view, with its scores."""
+        return ChunkHit(self.chunks, row, similarity, keyword_score, fused_score)
+    
     def exists(self) -> bool:
         """
         Check if index exists for this topic
         """
-        return os.path.exists(self.index_path) and os.path.exists(self.metadata_path)
\ No newline at end of file
+        return bool(self._index_files()) and os.path.exists(self.metadata_path)
@@ -0,0 +1,9 @@
+"""
+Offline latency/throughput benchmarks for the ingest and query hot paths.
+
+    cd backend
+    python -m benchmarks.run --json baseline.json
+    python -m benchmarks.run --baseline baseline.json
+
+See `benchmarks.run` for the options and `benchmarks.cases` for what is measured.
+"""
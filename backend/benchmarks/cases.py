@@ -0,0 +1,191 @@
+"""
+The benchmark groups. Each takes a `BenchmarkContext` and returns
+`{benchmark name: result}` (see `harness`). Imported by `run` only after it
+has switched into a scratch working directory, because `app.core.config`
+resolves `data/` against the current directory at import.
+"""
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingService, vectorizer_cache
+from app.services.executor import executor_service
+from app.services.image_service import ImageService
+from app.services.pdf_processor import PDFProcessor
+from app.services.vector_store import VectorStore, index_cache
+from benchmarks.harness import measure, measure_each, summarize
+
+Results = Dict[str, Dict[str, Any]]
+
+
+@dataclass
+class BenchmarkContext:
+    pdf_path: str
+    sound_pdf: str
+    pages: List[str]
+    questions: List[str]
+    repeat: int = 5
+    concurrency: int = 8
+    requests: int = 200
+    # Filled in by the groups that need them
+    shared: Dict[str, Any] = field(default_factory=dict)
+    
+    @property
+    def text(self) -> str:
+        return "\n".join(self.pages)
+    
+    @property
+    def chunks(self) -> List[Dict[str, Any]]:
+        if "chunks" not in self.shared:
+            self.shared["chunks"] = PDFProcessor().chunk_text(self.text)
+        return self.shared["chunks"]
+
+
+def index_topic(chunks: List[Dict[str, Any]]) -> str:
+    """Index chunks as a new topic the way an ingestion job does; returns its id."""
+    topic_id = f"bench-{uuid.uuid4().hex[:8]}"
+    embeddings, version = EmbeddingService().fit_topic_embeddings(
+        topic_id, [chunk["text"] for chunk in chunks], sparse=settings.VECTOR_BACKEND == "sparse"
+    )
+    vector_store = VectorStore(topic_id)
+    vector_store.create_index(embeddings, chunks, vectorizer_version=version)
+    vector_store.save_index()
+    ImageService().create_sample_images(topic_id)
+    return topic_id
+
+
+def bench_extract(ctx: BenchmarkContext) -> Results:
+    processor = PDFProcessor()
+    results = {}
+    for name, path in (("synthetic", ctx.pdf_path), ("sound", ctx.sound_pdf)):
+        if not os.path.exists(path):
+            continue
+        pages = processor.count_pages(path)
+        results[f"extract_text.{name}"] = measure(
+            lambda: processor.extract_text_from_pdf(path), ctx.repeat, items=pages, unit="pages/s"
+        )
+        results[f"extract_text.{name}.pool"] = measure(
+            lambda: processor.extract_text_from_pdf(path, executor_service.pdf), ctx.repeat,
+            items=pages, unit="pages/s"
+        )
+    return results
+
+
+def bench_chunk(ctx: BenchmarkContext) -> Results:
+    processor = PDFProcessor()
+    text = ctx.text
+    words = len(text.split())
+    return {
+        "chunk_text": measure(lambda: processor.chunk_text(text), ctx.repeat, items=words, unit="words/s"),
+        "iter_chunks.pages": measure(lambda: list(processor.iter_chunks(ctx.pages)), ctx.repeat,
+                                     items=words, unit="words/s"),
+    }
+
+
+def bench_embed(ctx: BenchmarkContext) -> Results:
+    service = EmbeddingService()
+    texts = [chunk["text"] for chunk in ctx.chunks]
+    topic_id = f"bench-{uuid.uuid4().hex[:8]}"
+    namespace = f"bench_{uuid.uuid4().hex[:8]}"
+    # The first call fits the namespace vocabulary (warm-up); timed calls transform
+    return {
+        "fit_topic_embeddings": measure(lambda: service.fit_topic_embeddings(topic_id, texts), ctx.repeat,
+                                        items=len(texts), unit="chunks/s"),
+        "generate_embeddings": measure(lambda: service.generate_embeddings(texts, namespace=namespace),
+                                       ctx.repeat, items=len(texts), unit="chunks/s"),
+        "generate_query_embeddings": measure_each(
+            lambda question: service.generate_single_embedding(question, topic_id=topic_id),
+            ctx.questions, unit="queries/s"
+        ),
+    }
+
+
+def bench_vector_store(ctx: BenchmarkContext) -> Results:
+    chunks = ctx.chunks
+    sparse = settings.VECTOR_BACKEND == "sparse"
+    topic_id = f"bench-{uuid.uuid4().hex[:8]}"
+    service = EmbeddingService()
+    embeddings, version = service.fit_topic_embeddings(topic_id, [chunk["text"] for chunk in chunks], sparse=sparse)
+    store = VectorStore(topic_id)
+    
+    results = {
+        "vector_store.create_index": measure(lambda: store.create_index(embeddings, chunks, version), ctx.repeat,
+                                             items=len(chunks), unit="chunks/s"),
+        "vector_store.save_index": measure(store.save_index, ctx.repeat, items=len(chunks), unit="chunks/s"),
+        # Cold: read from disk every time; cached: the index_cache hit path
+        "vector_store.load_index": measure(lambda: VectorStore(topic_id).load_index(use_cache=False), ctx.repeat,
+                                           items=len(chunks), unit="chunks/s"),
+        "vector_store.load_index.cached": measure(lambda: VectorStore(topic_id).load_index(), ctx.repeat),
+    }
+    loaded = VectorStore(topic_id)
+    loaded.load_index()
+    query_embeddings = service.generate_query_embeddings(ctx.questions, topic_id=topic_id, sparse=sparse)
+    rows = [query_embeddings[i:i + 1] for i in range(query_embeddings.shape[0])]
+    results["vector_store.search"] = measure_each(
+        lambda row: loaded.search_batch(row, settings.TOP_K_CHUNKS), rows, unit="queries/s"
+    )
+    results["vector_store.search_batch"] = measure(
+        lambda: loaded.search_batch(query_embeddings, settings.TOP_K_CHUNKS), ctx.repeat,
+        items=len(ctx.questions), unit="queries/s"
+    )
+    return results
+
+
+def bench_image(ctx: BenchmarkContext) -> Results:
+    service = ImageService()
+    topic_id = f"bench-{uuid.uuid4().hex[:8]}"
+    service.create_sample_images(topic_id)
+    return {
+        "find_relevant_image": measure_each(
+            lambda question: service.find_relevant_image(topic_id, question), ctx.questions, unit="queries/s"
+        ),
+    }
+
+
+def _chat_load(client, topic_id: str, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    def ask(question: str) -> float:
+        started = time.perf_counter()
+        response = client.post("/api/v1/chat", json={"topic_id": topic_id, "question": question})
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat returned {response.status_code}: {response.text}")
+        return elapsed
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(ask, questions))
+    return summarize(samples, len(questions), "requests/s", wall_seconds=time.perf_counter() - started)
+
+
+def bench_chat(ctx: BenchmarkContext) -> Results:
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    topic_id = index_topic(ctx.chunks)
+    questions = (ctx.questions * (ctx.requests // len(ctx.questions) + 1))[:ctx.requests]
+    results = {}
+    # The lifespan context runs startup hooks and shares one event loop across client threads
+    with TestClient(app) as client:
+        _chat_load(client, topic_id, ctx.questions[:5], 1)
+        for concurrency in sorted({1, ctx.concurrency}):
+            results[f"chat.e2e.c{concurrency}"] = _chat_load(client, topic_id, questions, concurrency)
+    return results
+
+
+def reset_caches():
+    """Forget loaded indexes and vectorizers so a group does not profit from an earlier one."""
+    for cache in (index_cache, vectorizer_cache):
+        cache.clear()
+
+
+GROUPS: Dict[str, Callable[[BenchmarkContext], Results]] = {
+    "extract": bench_extract,
+    "chunk": bench_chunk,
+    "embed": bench_embed,
+    "vector_store": bench_vector_store,
+    "image": bench_image,
+    "chat": bench_chat,
+}
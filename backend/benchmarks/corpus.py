@@ -0,0 +1,106 @@
+"""
+Deterministic synthetic corpora and PDFs for the benchmarks.
+
+Text is drawn from a fixed science-textbook vocabulary with a seeded RNG,
+so the same `pages`/`seed` always give the same bytes. Pages have numbered
+headings, paragraphs and sentences, so every chunking strategy sees the
+boundaries it looks for. PDFs are written directly (one Helvetica text
+stream per page) so no PDF library beyond PyPDF2 is needed.
+"""
+import os
+import random
+from typing import List
+
+SOUND_PDF = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "docs", "pdf", "Sound.pdf"))
+
+TERMS = (
+    "sound wave vibration compression rarefaction frequency amplitude wavelength pitch loudness "
+    "echo reverberation ultrasound infrasound medium particle density pressure speed hertz "
+    "oscillation crest trough longitudinal transverse reflection stethoscope sonar audible "
+    "eardrum cochlea membrane string drum flute bell instrument tuning fork resonance energy "
+    "air water steel aluminium temperature distance time period decibel intensity timbre"
+).split()
+FILLERS = (
+    "the a of in and to is are by with from when which that as it its this these through "
+    "each an on for into can be so more than how does called produce travel move show"
+).split()
+LINE_CHARS = 90
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(TERMS) if rng.random() < 0.45 else rng.choice(FILLERS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def page_text(rng: random.Random, page_num: int, words_per_page: int) -> str:
+    """One page: a numbered heading followed by paragraphs separated by blank lines."""
+    paragraphs = [f"{page_num + 1}.1 {rng.choice(TERMS).capitalize()} and {rng.choice(TERMS)}"]
+    words = 0
+    while words < words_per_page:
+        paragraph = " ".join(sentence(rng) for _ in range(rng.randint(2, 6)))
+        words += paragraph.count(" ") + 1
+        paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs)
+
+
+def make_pages(pages: int, words_per_page: int = 350, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [page_text(rng, page_num, words_per_page) for page_num in range(pages)]
+
+
+def make_questions(count: int, seed: int = 1) -> List[str]:
+    """Questions built from the corpus vocabulary, all distinct."""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        first, second = rng.sample(TERMS, 2)
+        questions.append(f"How does {first} affect {second} in {rng.choice(TERMS)}? ({i})")
+    return questions
+
+
+def _wrap(paragraph: str) -> List[str]:
+    lines, line = [], ""
+    for word in paragraph.split():
+        if line and len(line) + 1 + len(word) > LINE_CHARS:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines + [line] if line else lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[str]):
+    """Write `pages` (plain ASCII text, paragraphs split by blank lines) as a PDF."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = ["BT /F1 9 Tf 11 TL 50 770 Td"]
+        for paragraph in text.split("\n\n"):
+            lines += [f"({_escape(line)}) Tj T*" for line in _wrap(paragraph)]
+            lines.append("T*")
+        lines.append("ET")
+        stream = "\n".join(lines).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
@@ -0,0 +1,165 @@
+"""
+Timing, result records and baseline comparison shared by the benchmarks.
+
+A result is a flat dict: latency statistics in milliseconds (`min`,
+`median`, `mean`, `p95`, `p99`), the number of timed samples, and
+optionally `throughput` with its `throughput_unit`. Lower latency is
+better; a result regresses when its median or p95 grows by more than the
+threshold over the baseline and by more than a small absolute floor, so
+sub-millisecond jitter is not reported.
+"""
+import gc
+import json
+import os
+import platform
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# Statistics compared against a baseline
+COMPARED = ("median", "p95")
+
+
+def summarize(samples_ms: List[float], items: Optional[float] = None, unit: Optional[str] = None,
+              wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Latency statistics of `samples_ms`. With `items` per sample, throughput
+    is items per second of median sample time, or of `wall_seconds` when
+    the samples ran concurrently.
+    """
+    samples = np.array(samples_ms, dtype=np.float64)
+    result = {
+        "samples": len(samples),
+        "min": round(float(samples.min()), 4),
+        "median": round(float(np.median(samples)), 4),
+        "mean": round(float(samples.mean()), 4),
+        "p95": round(float(np.percentile(samples, 95)), 4),
+        "p99": round(float(np.percentile(samples, 99)), 4),
+    }
+    if items is not None:
+        seconds = wall_seconds if wall_seconds is not None else result["median"] / 1000
+        result["throughput"] = round(items / seconds, 2) if seconds > 0 else None
+        result["throughput_unit"] = unit
+    return result
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, warmup: int = 1, items: Optional[float] = None,
+            unit: Optional[str] = None, setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """
+    Time `func()` `repeat` times after `warmup` untimed calls. `setup` runs
+    untimed before every call (e.g. to clear a cache). GC is collected
+    between calls and disabled inside them so a collection does not land
+    in one sample.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            gc.enable()
+    return summarize(samples, items, unit)
+
+
+def measure_each(func: Callable[[Any], Any], inputs: List[Any], warmup: int = 3,
+                 unit: str = "calls/s") -> Dict[str, Any]:
+    """Time `func(x)` once per input; throughput is calls per second overall."""
+    for x in inputs[:warmup]:
+        func(x)
+    samples = []
+    started = time.perf_counter()
+    for x in inputs:
+        call_started = time.perf_counter()
+        func(x)
+        samples.append((time.perf_counter() - call_started) * 1000)
+    return summarize(samples, len(inputs), unit, wall_seconds=time.perf_counter() - started)
+
+
+def environment() -> Dict[str, Any]:
+    import faiss
+    import sklearn
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", "unknown"),
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.2,
+            min_delta_ms: float = 0.1) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Compare the results of `current` with the same benchmarks in
+    `baseline`. Returns one row per benchmark with the current/baseline
+    ratio of each compared statistic, and whether any statistic got more
+    than `threshold` (0.2 = 20%) and `min_delta_ms` slower.
+    """
+    rows, regressed = [], False
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new"})
+            continue
+        ratios, slower = {}, False
+        for stat in COMPARED:
+            if stat in result and base.get(stat):
+                ratios[stat] = round(result[stat] / base[stat], 3)
+                slower |= ratios[stat] > 1 + threshold and result[stat] - base[stat] > min_delta_ms
+        faster = all(ratio < 1 - threshold for ratio in ratios.values()) and bool(ratios)
+        status = "regression" if slower else "improved" if faster else "ok"
+        regressed |= slower
+        rows.append({"name": name, "status": status, "baseline_median": base["median"],
+                     "median": result["median"], **{f"{stat}_ratio": ratio for stat, ratio in ratios.items()}})
+    return rows, regressed
+
+
+def config_differences(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Parameters and settings that differ between two runs (their timings are not like for like)."""
+    differences = []
+    for section in ("params", "settings"):
+        old, new = baseline.get(section, {}), current.get(section, {})
+        for key in sorted(old.keys() | new.keys()):
+            if key != "groups" and old.get(key) != new.get(key):
+                differences.append(f"{key}: {old.get(key)} -> {new.get(key)}")
+    return differences
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    columns = ("median", "p95", "p99")
+    width = max(len(name) for name in results)
+    print(f"{'benchmark'.ljust(width)}  {'median ms':>10}  {'p95 ms':>10}  {'p99 ms':>10}  throughput")
+    for name, result in results.items():
+        throughput = f"{result['throughput']} {result['throughput_unit']}" if result.get("throughput") else ""
+        values = [f"{result[column]:>10}" for column in columns]
+        print(f"{name.ljust(width)}  {'  '.join(values)}  {throughput}")
+
+
+def print_comparison(rows: List[Dict[str, Any]], threshold: float, differences: List[str]):
+    width = max(len(row["name"]) for row in rows)
+    print(f"\nAgainst baseline (regression = more than {threshold:.0%} slower in median or p95):")
+    if differences:
+        print(f"  note, the runs differ in {'; '.join(differences)}")
+    for row in rows:
+        if "median" not in row:
+            print(f"{row['name'].ljust(width)}  {row['status']}")
+            continue
+        ratios = "  ".join(f"{stat} x{row[f'{stat}_ratio']}" for stat in COMPARED if f"{stat}_ratio" in row)
+        print(f"{row['name'].ljust(width)}  {row['baseline_median']:>10} -> {row['median']:>10} ms  "
+              f"{ratios}  {row['status'].upper() if row['status'] == 'regression' else row['status']}")
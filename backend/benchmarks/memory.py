@@ -0,0 +1,231 @@
+"""
+Resident memory per cached topic.
+
+Indexes `docs/pdf/Sound.pdf` as `--topics` separate topics in a scratch
+directory, then loads each one and answers a question from it, the way a
+long-running server fills its index, vectorizer and image caches (their
+limits are raised so every topic stays cached). Reports RSS growth and
+traced Python heap per cached topic, the largest allocation sites, and
+the heap held by search results.
+
+With `--workers N` the topics are instead preloaded and queried by N
+separate worker processes at once, as under `uvicorn --workers N`, and the
+report gives each worker's private memory and the proportional set size
+(PSS, shared pages split between the processes mapping them) of all of them
+per topic. Compare `INDEX_MMAP=false` with `INDEX_MMAP=true`.
+
+    cd backend
+    python -m benchmarks.memory
+    python -m benchmarks.memory --topics 500 --json memory.json
+    INDEX_MMAP=true python -m benchmarks.memory --workers 4
+
+RSS is read from `/proc/self/statm` and PSS from `/proc/self/smaps_rollup`,
+so both are only reported on Linux.
+"""
+import argparse
+import copy
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+QUESTION = "What is the pitch of a sound?"
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def smaps_kb() -> Dict[str, int]:
+    """`/proc/self/smaps_rollup` totals in KB (Rss, Pss, Private_Dirty, ...), or {} off Linux."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = [line.split() for line in f if line.endswith("kB\n")]
+    except OSError:
+        return {}
+    return {fields[0].rstrip(":"): int(fields[1]) for fields in lines}
+
+
+def serve_worker(workdir: str, topic_ids: List[str], barrier, results):
+    """
+    One server worker: preload the topics the way startup does with
+    INDEX_PRELOAD, answer a question from each, then measure while every
+    other worker is alive too (PSS splits shared pages between them).
+    """
+    os.chdir(workdir)
+    from app.core.logging_config import setup_logging
+    from app.services.index_preloader import index_preloader
+    from app.services.rag_pipeline import RAGPipeline
+    setup_logging()
+    logging.disable(logging.INFO)
+    pipeline = RAGPipeline()
+    gc.collect()
+    before = smaps_kb()
+    preload = index_preloader.run()
+    for topic_id in topic_ids:
+        pipeline.process_query(topic_id, QUESTION)
+    gc.collect()
+    barrier.wait()
+    after = smaps_kb()
+    barrier.wait()
+    private = [key for key in ("Private_Clean", "Private_Dirty") if key in after]
+    results.put({
+        "pid": os.getpid(),
+        "warmed_bytes": preload["warmed_bytes"],
+        "preloaded": preload["topics"],
+        "private_kb": sum(after[key] - before.get(key, 0) for key in private),
+        "pss_kb": after.get("Pss", 0) - before.get("Pss", 0),
+    })
+
+
+def measure_workers(workdir: str, topic_ids: List[str], workers: int) -> Dict[str, Any]:
+    # Spawned like uvicorn workers, so nothing is shared through fork
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=serve_worker, args=(workdir, topic_ids, barrier, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    topics = len(topic_ids)
+    return {
+        "workers": workers,
+        "warmed_by": sum(report["warmed_bytes"] > 0 for report in reports),
+        "private_kb_per_topic_per_worker": round(sum(r["private_kb"] for r in reports) / workers / topics, 1),
+        "pss_kb_per_topic_all_workers": round(sum(r["pss_kb"] for r in reports) / topics, 1),
+        "per_worker": reports,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--topics", type=int, default=200, help="topics to index and keep cached")
+    parser.add_argument("--queries", type=int, default=200, help="search results held for the result-size measurement")
+    parser.add_argument("--top", type=int, default=8, help="allocation sites to list")
+    parser.add_argument("--workers", type=int, default=0, help="measure N worker processes serving the topics instead")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    for name in ("INDEX_CACHE_MAX_ENTRIES", "VECTORIZER_CACHE_MAX_ENTRIES", "IMAGE_CATALOG_CACHE_MAX_ENTRIES"):
+        os.environ.setdefault(name, str(args.topics + 16))
+    os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    os.environ.setdefault("INDEX_PRELOAD_MAX_TOPICS", str(args.topics))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="edulevel-memory-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    
+    from app.core.config import settings
+    from app.core.logging_config import setup_logging
+    from app.services.executor import executor_service
+    from app.services.pdf_processor import PDFProcessor
+    from app.services.rag_pipeline import RAGPipeline
+    from app.services.vector_store import VectorStore
+    from benchmarks import cases, corpus
+    setup_logging()
+    logging.disable(logging.INFO)
+    
+    started = time.perf_counter()
+    pages = [text for _, text in PDFProcessor().iter_pages(corpus.SOUND_PDF)]
+    chunks = list(PDFProcessor().iter_chunks(pages))
+    topic_ids = [cases.index_topic(copy.deepcopy(chunks)) for _ in range(args.topics)]
+    print(f"Indexed {args.topics} topics of {len(chunks)} chunks in {time.perf_counter() - started:.1f}s; "
+          f"workdir {workdir}")
+    
+    if args.workers:
+        executor_service.shutdown()
+        report = measure_workers(workdir, topic_ids, args.workers)
+        report.update(created_at=time.time(), params={"topics": args.topics, "chunks_per_topic": len(chunks),
+                                                       "index_mmap": settings.INDEX_MMAP})
+        print(f"\n{args.workers} workers, INDEX_MMAP={settings.INDEX_MMAP}:")
+        print(f"Private memory:     {report['private_kb_per_topic_per_worker']} KB per topic per worker")
+        print(f"PSS, all workers:   {report['pss_kb_per_topic_all_workers']} KB per topic")
+        print(f"Page cache warmed by {report['warmed_by']} of {args.workers} workers")
+        write_report(report, json_path)
+        return
+    
+    pipeline = RAGPipeline()
+    try:
+        cases.reset_caches()
+        # Warm imports, lanes and the shared image vocabulary outside the measurement
+        pipeline.process_query(topic_ids[0], QUESTION)
+        cases.reset_caches()
+        gc.collect()
+        tracemalloc.start(8)
+        rss_before = rss_bytes()
+        before = tracemalloc.take_snapshot()
+        for topic_id in topic_ids:
+            pipeline.process_query(topic_id, QUESTION)
+        gc.collect()
+        rss_after = rss_bytes()
+        after = tracemalloc.take_snapshot()
+        
+        # Heap held by search results, as the pipeline holds them while answering
+        vector_store = VectorStore(topic_ids[0])
+        vector_store.load_index()
+        embeddings = pipeline.embedding_service.generate_query_embeddings(
+            [QUESTION] * args.queries, topic_id=topic_ids[0], sparse=vector_store.is_sparse
+        )
+        gc.collect()
+        held_before = tracemalloc.get_traced_memory()[0]
+        results = pipeline._retrieve(vector_store, [QUESTION] * args.queries, embeddings, settings.TOP_K_CHUNKS)
+        for hits in results:
+            for hit in hits:
+                hit["text"]
+        held = tracemalloc.get_traced_memory()[0] - held_before
+        hit_count = sum(len(hits) for hits in results)
+        del results
+        tracemalloc.stop()
+    finally:
+        executor_service.shutdown()
+    
+    traced = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    sites = after.compare_to(before, "lineno")[:args.top]
+    report: Dict[str, Any] = {
+        "created_at": time.time(),
+        "params": {"topics": args.topics, "chunks_per_topic": len(chunks), "queries": args.queries},
+        "rss_kb_per_topic": round((rss_after - rss_before) / 1024 / args.topics, 1) if rss_before else None,
+        "traced_kb_per_topic": round(traced / 1024 / args.topics, 1),
+        "result_bytes_per_hit": round(held / hit_count) if hit_count else None,
+        "top_sites": [
+            {"site": str(stat.traceback[0]), "kb_per_topic": round(stat.size_diff / 1024 / args.topics, 2)}
+            for stat in sites
+        ],
+    }
+    print(f"\nRSS growth:         {report['rss_kb_per_topic']} KB per cached topic")
+    print(f"Traced Python heap: {report['traced_kb_per_topic']} KB per cached topic")
+    print(f"Search results:     {report['result_bytes_per_hit']} bytes per hit held "
+          f"({hit_count} hits, texts decoded)")
+    print("\nLargest allocation sites (KB per topic):")
+    for site in report["top_sites"]:
+        print(f"  {site['kb_per_topic']:>8}  {site['site']}")
+    write_report(report, json_path)
+
+
+def write_report(report: Dict[str, Any], json_path: Optional[str]):
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Run the benchmark suite and optionally compare against a baseline.
+
+Everything runs offline in a scratch directory: a synthetic PDF of
+`--pages` pages is generated, indexed and queried, alongside
+`docs/pdf/Sound.pdf`. The response and semantic caches are off unless
+`--with-caches` is given, so repeated questions measure the pipeline.
+
+    cd backend
+    python -m benchmarks.run --json baseline.json
+    python -m benchmarks.run --size medium --only vector_store --only chat --baseline baseline.json
+    python -m benchmarks.run --baseline baseline.json --json current.json --threshold 0.15
+
+With `--baseline`, results whose median or p95 latency grew by more than
+`--threshold` (and `--min-delta-ms`) are flagged and the exit status is 1. Other settings (e.g.
+`VECTOR_BACKEND=sparse`, `FAISS_INDEX_TYPE=hnsw_flat`) are taken from the
+environment and recorded in the output.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+SIZES = {"small": 20, "medium": 200, "large": 1000}
+RECORDED_SETTINGS = (
+    "VECTOR_BACKEND", "VECTORIZER_SCOPE", "FAISS_INDEX_TYPE", "TFIDF_MAX_FEATURES", "CHUNK_STRATEGY",
+    "CHUNK_UNIT", "CHUNK_SIZE", "CHUNK_OVERLAP", "TOP_K_CHUNKS", "HYBRID_SEARCH_ENABLED",
+    "RESPONSE_CACHE_ENABLED", "SEMANTIC_CACHE_ENABLED", "QUERY_THREAD_WORKERS", "LLM_PROVIDER",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=SIZES, default="small", help="synthetic corpus size")
+    parser.add_argument("--pages", type=int, help="synthetic PDF pages (overrides --size)")
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--queries", type=int, default=100, help="distinct questions for the query benchmarks")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /chat clients")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests per concurrency level")
+    parser.add_argument("--only", action="append", help="benchmark group to run (repeatable)")
+    parser.add_argument("--with-caches", action="store_true", help="keep the response and semantic caches on")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore slowdowns smaller than this")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Resolve user paths before leaving the current directory
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    if not args.with_caches:
+        os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+        os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="edulevel-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    
+    from app.core.config import settings
+    from app.core.logging_config import setup_logging
+    from benchmarks import cases, corpus, harness
+    from app.services.executor import executor_service
+    setup_logging()
+    # Survives app.main calling setup_logging() again
+    logging.disable(logging.INFO)
+    
+    groups = args.only or list(cases.GROUPS)
+    unknown = set(groups) - set(cases.GROUPS)
+    if unknown:
+        sys.exit(f"Unknown benchmark group(s): {', '.join(sorted(unknown))}; choose from {', '.join(cases.GROUPS)}")
+    
+    page_count = args.pages or SIZES[args.size]
+    pages = corpus.make_pages(page_count, args.words_per_page, args.seed)
+    pdf_path = os.path.join(workdir, "synthetic.pdf")
+    corpus.write_pdf(pdf_path, pages)
+    ctx = cases.BenchmarkContext(
+        pdf_path=pdf_path,
+        sound_pdf=corpus.SOUND_PDF,
+        pages=pages,
+        questions=corpus.make_questions(args.queries),
+        repeat=args.repeat,
+        concurrency=args.concurrency,
+        requests=args.requests,
+    )
+    print(f"Synthetic corpus: {page_count} pages, {sum(len(page.split()) for page in pages)} words, "
+          f"{len(ctx.chunks)} chunks; workdir {workdir}\n")
+    
+    results = {}
+    try:
+        for group in groups:
+            started = time.perf_counter()
+            cases.reset_caches()
+            results.update(cases.GROUPS[group](ctx))
+            print(f"[{group}] {time.perf_counter() - started:.1f}s")
+    finally:
+        executor_service.shutdown()
+    
+    report = {
+        "created_at": time.time(),
+        "environment": harness.environment(),
+        "params": {
+            "pages": page_count,
+            "words_per_page": args.words_per_page,
+            "seed": args.seed,
+            "chunks": len(ctx.chunks),
+            "repeat": args.repeat,
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "groups": groups,
+        },
+        "settings": {name: getattr(settings, name) for name in RECORDED_SETTINGS},
+        "results": results,
+    }
+    print()
+    harness.print_results(results)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {json_path}")
+    
+    if baseline_path:
+        baseline = harness.load(baseline_path)
+        rows, regressed = harness.compare(baseline, report, args.threshold, args.min_delta_ms)
+        harness.print_comparison(rows, args.threshold, harness.config_differences(baseline, report))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Offline retrieval-quality evaluation.
+
+Scores a labelled question set (see `evaluation.dataset`) against each
+configuration of chunking, vectorizer, index and image threshold settings:
+recall@k, MRR and image-selection accuracy next to query latency and index
+size, reported as a Pareto front.
+
+    cd backend
+    python -m evaluation.run
+    python -m evaluation.run --grid CHUNK_SIZE=100,200,400 --grid FAISS_INDEX_TYPE=flat_ip,hnsw_flat
+"""
@@ -0,0 +1,109 @@
+"""
+Labelled evaluation datasets.
+
+A dataset is a JSON file:
+
+    {
+      "name": "sound-seed",
+      "description": "...",
+      "pdf": "../../../docs/pdf/Sound.pdf",
+      "questions": [
+        {"id": "sound-01", "question": "What are compressions and rarefactions?",
+         "phrases": ["called rarefactions"], "pages": [3], "image_id": "img_002"}
+      ]
+    }
+
+`pdf` is relative to the dataset file. For each question, `phrases` are
+pieces of the answer text (matched case- and whitespace-insensitively
+against chunk text), `pages` are the 1-based PDF pages holding the answer
+and `image_id` is the diagram that should be shown, or null when no image
+should be. Questions without phrases or pages only count towards the image
+metrics.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+DATASET_DIR = os.path.join(os.path.dirname(__file__), "datasets")
+DEFAULT_DATASET = os.path.join(DATASET_DIR, "sound_seed.json")
+
+
+def normalize(text: str) -> str:
+    """Lower-case and collapse whitespace, as phrases are compared with chunk text."""
+    return " ".join(text.lower().split())
+
+
+@dataclass
+class EvalQuestion:
+    id: str
+    question: str
+    phrases: List[str] = field(default_factory=list)
+    pages: List[int] = field(default_factory=list)
+    image_id: Optional[str] = None
+    
+    @property
+    def has_answer(self) -> bool:
+        return bool(self.phrases or self.pages)
+
+
+@dataclass
+class EvalDataset:
+    name: str
+    pdf_path: str
+    questions: List[EvalQuestion]
+    description: str = ""
+    
+    @property
+    def answered(self) -> List[EvalQuestion]:
+        """Questions with chunk/page labels."""
+        return [question for question in self.questions if question.has_answer]
+
+
+def _question(item: dict, position: int) -> EvalQuestion:
+    where = f"question {position + 1}"
+    if not isinstance(item, dict):
+        raise ValueError(f"{where}: expected an object")
+    question_id = item.get("id") or f"q{position + 1}"
+    text = item.get("question")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError(f"{where} ({question_id}): 'question' must be a non-empty string")
+    phrases = item.get("phrases", [])
+    if not isinstance(phrases, list) or not all(isinstance(phrase, str) and phrase.strip() for phrase in phrases):
+        raise ValueError(f"{where} ({question_id}): 'phrases' must be a list of non-empty strings")
+    pages = item.get("pages", [])
+    if not isinstance(pages, list) or not all(isinstance(page, int) and page >= 1 for page in pages):
+        raise ValueError(f"{where} ({question_id}): 'pages' must be a list of 1-based page numbers")
+    image_id = item.get("image_id")
+    if image_id is not None and not isinstance(image_id, str):
+        raise ValueError(f"{where} ({question_id}): 'image_id' must be a string or null")
+    return EvalQuestion(
+        id=str(question_id),
+        question=text.strip(),
+        phrases=[normalize(phrase) for phrase in phrases],
+        pages=sorted(set(pages)),
+        image_id=image_id,
+    )
+
+
+def load_dataset(path: str = DEFAULT_DATASET) -> EvalDataset:
+    """Read and validate a dataset file. Raises ValueError when it is malformed."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("questions"), list) or not data["questions"]:
+        raise ValueError(f"{path}: expected an object with a non-empty 'questions' list")
+    if not data.get("pdf"):
+        raise ValueError(f"{path}: 'pdf' is required")
+    
+    questions = [_question(item, position) for position, item in enumerate(data["questions"])]
+    seen = set()
+    for question in questions:
+        if question.id in seen:
+            raise ValueError(f"{path}: duplicate question id '{question.id}'")
+        seen.add(question.id)
+    return EvalDataset(
+        name=data.get("name") or os.path.splitext(os.path.basename(path))[0],
+        pdf_path=os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(path)), data["pdf"])),
+        questions=questions,
+        description=data.get("description", ""),
+    )
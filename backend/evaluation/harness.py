@@ -0,0 +1,130 @@
+"""
+Index one configuration and score it. Imported by `run` only after it has
+switched into a scratch working directory, because `app.core.config`
+resolves `data/` against the current directory at import.
+"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingService, vectorizer_cache
+from app.services.image_service import image_catalog_cache
+from app.services.pdf_processor import PDFProcessor
+from app.services.rag_pipeline import RAGPipeline
+from app.services.tfidf_model import TfidfModel
+from app.services.vector_store import VectorStore, index_cache
+from benchmarks.harness import summarize
+from evaluation.dataset import EvalDataset
+from evaluation.scoring import chunk_pages, score_images, score_retrieval
+
+Overrides = List[Tuple[str, str]]
+
+
+def _coerce(name: str, value: str) -> Any:
+    if not name.isupper() or not hasattr(settings, name):
+        raise ValueError(f"Unknown setting '{name}'")
+    current = getattr(settings, name)
+    if isinstance(current, bool):
+        return value.lower() == "true"
+    try:
+        return type(current)(value)
+    except ValueError:
+        raise ValueError(f"Invalid value for {name}: '{value}'")
+
+
+def validate(overrides: Overrides):
+    for name, value in overrides:
+        _coerce(name, value)
+
+
+@contextmanager
+def overridden(overrides: Overrides) -> Iterator[None]:
+    """Apply setting overrides for the duration of the block."""
+    previous = {name: getattr(settings, name) for name, _ in overrides}
+    try:
+        for name, value in overrides:
+            setattr(settings, name, _coerce(name, value))
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+def reset_state():
+    """
+    Forget loaded indexes, vectorizers and image catalogs, and drop the
+    shared `images` vocabulary so it is refitted under the current TF-IDF
+    settings.
+    """
+    for cache in (index_cache, vectorizer_cache, image_catalog_cache):
+        cache.clear()
+    service = EmbeddingService()
+    service._models.pop("images", None)
+    for path in TfidfModel.paths(service._get_vectorizer_prefix("images")):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def index_topic(chunks: List[Dict[str, Any]]) -> str:
+    """Index chunks as a new topic the way an ingestion job does; returns its id."""
+    topic_id = f"eval-{uuid.uuid4().hex[:8]}"
+    embeddings, version = EmbeddingService().fit_topic_embeddings(
+        topic_id, [chunk["text"] for chunk in chunks], sparse=settings.VECTOR_BACKEND == "sparse"
+    )
+    vector_store = VectorStore(topic_id)
+    vector_store.create_index(embeddings, chunks, vectorizer_version=version)
+    vector_store.save_index()
+    return topic_id
+
+
+def evaluate(dataset: EvalDataset, pages: List[str], overrides: Overrides, k: int, depth: int,
+             repeat: int) -> Dict[str, Any]:
+    """
+    Chunk and index `pages` under `overrides`, then ask every question
+    `repeat` times (after one untimed pass) through the pipeline's query
+    embedding, retrieval and image selection.
+    """
+    with overridden(overrides):
+        reset_state()
+        chunks = list(PDFProcessor().iter_chunks(pages))
+        topic_id = index_topic(chunks)
+        pipeline = RAGPipeline()
+        pipeline.image_service.create_sample_images(topic_id)
+        vector_store = VectorStore(topic_id)
+        vector_store.load_index()
+        
+        def ask(question: str) -> Tuple[List[int], Optional[str]]:
+            embedding = pipeline.embedding_service.generate_single_embedding(
+                question, namespace="chunks", sparse=vector_store.is_sparse, topic_id=topic_id
+            )
+            hits = pipeline._retrieve(vector_store, [question], embedding, k=depth)[0]
+            image = pipeline._select_image(topic_id, question)
+            return [hit["chunk_id"] for hit in hits], image.id if image else None
+        
+        questions = [question.question for question in dataset.questions]
+        answers = [ask(question) for question in questions]
+        samples = []
+        for _ in range(repeat):
+            for question in questions:
+                started = time.perf_counter()
+                ask(question)
+                samples.append((time.perf_counter() - started) * 1000)
+        latency = summarize(samples)
+        # Bytes the process caches account for the topic: index files and vectorizer
+        index_bytes = index_cache.stats()["bytes"] + vectorizer_cache.stats()["bytes"]
+        
+        answered = [(question, rows) for question, (rows, _) in zip(dataset.questions, answers) if question.has_answer]
+        result = {
+            "overrides": dict(overrides),
+            "chunks": len(chunks),
+            **score_retrieval([question for question, _ in answered], [rows for _, rows in answered],
+                              [chunk["text"] for chunk in chunks], chunk_pages(chunks, pages), k),
+            **score_images(dataset.questions, [image_id for _, image_id in answers]),
+            "latency_p50_ms": round(latency["median"], 3),
+            "latency_p95_ms": round(latency["p95"], 3),
+            "index_kb": round(index_bytes / 1024, 1),
+            "index_type": vector_store.index_type,
+        }
+    return result
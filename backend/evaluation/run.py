@@ -0,0 +1,210 @@
+"""
+Measure retrieval quality, image selection, query latency and index size per configuration.
+
+Each configuration overrides some settings (chunking, `TFIDF_MAX_FEATURES`,
+`FAISS_INDEX_TYPE`, `VECTOR_BACKEND`, `IMAGE_SIMILARITY_THRESHOLD`, ...),
+re-chunks and re-indexes the dataset's PDF the way an ingestion job does in
+a scratch directory, and asks every labelled question through the chat
+pipeline's retrieval and image selection. The first row is always the
+current settings, the reference the others are compared against.
+
+    cd backend
+    python -m evaluation.run
+    python -m evaluation.run --grid CHUNK_SIZE=100,200,400 --grid TFIDF_MAX_FEATURES=500,1000,5000
+    python -m evaluation.run --config FAISS_INDEX_TYPE=hnsw_flat --config CHUNK_SIZE=400,CHUNK_OVERLAP=80 --json eval.json
+
+The report marks the configurations on the Pareto front of quality
+(recall@k, MRR, image accuracy: higher is better) against median latency
+and index bytes (lower is better), and names a dominating configuration
+for the rest, so a speed-up can be shown not to cost quality. Latency is
+embedding, retrieval `--depth` deep and image selection, without answer
+generation; the response and semantic caches are off.
+
+`--filler-pages N` appends N synthetic pages (`benchmarks/corpus.py`) to the
+PDF's pages, so the labelled questions are asked of a topic large enough
+for approximate indexes; about two chunks per page at the default chunking:
+
+    python -m evaluation.run --filler-pages 2600 --grid FAISS_INDEX_TYPE=ivf_flat --grid FAISS_IVF_NPROBE=8,32
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_CONFIGS = [
+    "CHUNK_SIZE=100,CHUNK_OVERLAP=20",
+    "CHUNK_SIZE=400,CHUNK_OVERLAP=80",
+    "TFIDF_MAX_FEATURES=300",
+    "TFIDF_MAX_FEATURES=5000",
+    "FAISS_INDEX_TYPE=hnsw_flat",
+    "VECTOR_BACKEND=sparse",
+    "HYBRID_SEARCH_ENABLED=false",
+    "IMAGE_SIMILARITY_THRESHOLD=0.1",
+    "IMAGE_SIMILARITY_THRESHOLD=0.4",
+]
+QUALITY = ("mrr", "image_accuracy")  # plus recall@k, added once k is known
+COST = ("latency_p50_ms", "index_kb")
+
+Overrides = List[Tuple[str, str]]
+
+
+def parse_config(spec: str) -> Overrides:
+    """`NAME=value,NAME=value` -> [(NAME, value), ...]"""
+    overrides = []
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"Expected NAME=value, got '{part}'")
+        overrides.append((name.strip(), value.strip()))
+    return overrides
+
+
+def expand_grid(grid: List[str]) -> List[Overrides]:
+    """`["A=1,2", "B=x,y"]` -> every combination of the values."""
+    axes = []
+    for spec in grid:
+        name, sep, values = spec.partition("=")
+        if not sep or not values:
+            raise ValueError(f"Expected NAME=value1,value2, got '{spec}'")
+        axes.append([(name.strip(), value.strip()) for value in values.split(",")])
+    return [list(combination) for combination in itertools.product(*axes)]
+
+
+def label(overrides: Overrides) -> str:
+    return ",".join(f"{name}={value}" for name, value in overrides) or "current settings"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="dataset JSON (default: evaluation/datasets/sound_seed.json)")
+    parser.add_argument("--config", action="append", dest="configs", help="NAME=value[,NAME=value] (repeatable)")
+    parser.add_argument("--grid", action="append", help="NAME=value1,value2; configurations are all combinations")
+    parser.add_argument("-k", type=int, help="chunks counted for recall@k (default: TOP_K_CHUNKS)")
+    parser.add_argument("--depth", type=int, default=10, help="chunks retrieved per question, for MRR")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the questions")
+    parser.add_argument("--filler-pages", type=int, default=0,
+                        help="synthetic pages appended to the PDF's, to evaluate large topics")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative latency/size difference treated as noise when comparing configurations")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from evaluation.dataset import DEFAULT_DATASET, load_dataset
+    # Resolve user paths before leaving the current directory
+    dataset_path = os.path.abspath(args.dataset or DEFAULT_DATASET)
+    json_path = os.path.abspath(args.json) if args.json else None
+    try:
+        dataset = load_dataset(dataset_path)
+        configs = [parse_config(spec) for spec in args.configs or []]
+        if args.grid:
+            configs += expand_grid(args.grid)
+    except ValueError as e:
+        sys.exit(str(e))
+    if not args.configs and not args.grid:
+        configs = [parse_config(spec) for spec in DEFAULT_CONFIGS]
+    os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="edulevel-eval-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    
+    from app.core.config import settings
+    from app.core.logging_config import setup_logging
+    from app.services.executor import executor_service
+    from app.services.pdf_processor import PDFProcessor
+    from benchmarks.corpus import make_pages
+    from benchmarks.harness import environment
+    from evaluation import harness, scoring
+    setup_logging()
+    logging.disable(logging.INFO)
+    
+    try:
+        for overrides in configs:
+            harness.validate(overrides)
+    except ValueError as e:
+        sys.exit(str(e))
+    k = args.k or settings.TOP_K_CHUNKS
+    depth = max(args.depth, k)
+    
+    started = time.perf_counter()
+    pages = [text for _, text in PDFProcessor().iter_pages(dataset.pdf_path)]
+    print(f"{dataset.name}: {len(dataset.questions)} questions ({len(dataset.answered)} with answer labels), "
+          f"{os.path.basename(dataset.pdf_path)} {len(pages)} pages extracted in "
+          f"{time.perf_counter() - started:.1f}s; k={k}, depth={depth}; workdir {workdir}")
+    if args.filler_pages:
+        # After the PDF's pages, so the labelled page numbers still hold
+        pages += make_pages(args.filler_pages)
+        print(f"plus {args.filler_pages} synthetic filler pages")
+    print()
+    
+    results = []
+    try:
+        for overrides in [[]] + configs:
+            started = time.perf_counter()
+            result = harness.evaluate(dataset, pages, overrides, k, depth, args.repeat)
+            result["config"] = label(overrides)
+            results.append(result)
+            print(f"[{result['config']}] {time.perf_counter() - started:.1f}s")
+    finally:
+        executor_service.shutdown()
+    
+    quality = (f"recall@{k}",) + QUALITY
+    dominated_by = scoring.pareto(results, quality, COST, args.tolerance)
+    for result, dominator in zip(results, dominated_by):
+        result["dominated_by"] = None if dominator is None else results[dominator]["config"]
+    print()
+    print_report(results, dominated_by, k, quality)
+    
+    if json_path:
+        report = {
+            "created_at": time.time(),
+            "dataset": {"name": dataset.name, "path": dataset_path, "questions": len(dataset.questions)},
+            "environment": environment(),
+            "params": {"k": k, "depth": depth, "repeat": args.repeat, "tolerance": args.tolerance,
+                       "filler_pages": args.filler_pages},
+            "results": results,
+        }
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {json_path}")
+
+
+def print_report(results: List[Dict[str, Any]], dominated_by: List[Optional[int]], k: int, quality: Tuple[str, ...]):
+    columns = ["chunks", "recall@1", f"recall@{k}", f"page_recall@{k}", "mrr", "image_accuracy", "image_recall",
+               "false_image_rate", "latency_p50_ms", "latency_p95_ms", "index_kb"]
+    headers = ["#", "config"] + columns + ["pareto"]
+    rows = [
+        [str(i), result["config"]] + [str(result[column]) for column in columns]
+        + ["front" if dominator is None else f"dominated by #{dominator}"]
+        for i, (result, dominator) in enumerate(zip(results, dominated_by))
+    ]
+    widths = [max(len(header), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    
+    reference = results[0]
+    print(f"\nPareto front: {', '.join(f'#{i}' for i, dominator in enumerate(dominated_by) if dominator is None)} "
+          f"(higher {', '.join(quality)}; lower {', '.join(COST)})")
+    print("Against #0 (current settings):")
+    for i, result in enumerate(results[1:], start=1):
+        drops = [f"{name} {result[name] - reference[name]:+.3f}" for name in quality if result[name] < reference[name]]
+        gains = [f"{name} {result[name] - reference[name]:+.3f}" for name in quality if result[name] > reference[name]]
+        costs = [f"{name} x{result[name] / reference[name]:.2f}" for name in COST if reference[name]]
+        verdict = f"quality LOST: {', '.join(drops)}" if drops else "no quality lost"
+        if gains:
+            verdict += f"; gained {', '.join(gains)}"
+        print(f"  #{i} {result['config']}: {verdict}; {', '.join(costs)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Quality metrics for ranked chunks and selected images, and the Pareto
+front of configurations.
+
+A chunk answers a question when it contains one of the question's phrases;
+it is on the answer page when its words overlap one of the labelled pages.
+recall@k is the fraction of questions answered within the top k chunks and
+MRR the mean reciprocal rank of the first answering chunk (0 when none of
+the retrieved chunks answers). Image accuracy counts a question as right
+when the image shown after the similarity threshold is the labelled one,
+including showing none when none is labelled.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from evaluation.dataset import EvalQuestion, normalize
+
+
+def chunk_pages(chunks: List[Dict[str, Any]], pages: List[str]) -> List[Set[int]]:
+    """
+    1-based pages each chunk's words come from. Chunk `start_index` and
+    `end_index` count words across the pages fed to the chunker, which skips
+    empty pages.
+    """
+    bounds: List[Tuple[int, int, int]] = []
+    position = 0
+    for page_num, text in enumerate(pages, start=1):
+        if not text:
+            continue
+        words = len(text.split())
+        bounds.append((position, position + words, page_num))
+        position += words
+    return [
+        {page_num for start, end, page_num in bounds if start < chunk["end_index"] and chunk["start_index"] < end}
+        for chunk in chunks
+    ]
+
+
+def _first_rank(hits: List[bool]) -> Optional[int]:
+    return next((rank for rank, hit in enumerate(hits, start=1) if hit), None)
+
+
+def score_retrieval(questions: Sequence[EvalQuestion], ranked_rows: List[List[int]], chunk_texts: List[str],
+                    pages_of_chunk: List[Set[int]], k: int) -> Dict[str, float]:
+    """
+    recall@1, recall@k and MRR over the questions with phrases, and page
+    recall@k over the questions with pages. `ranked_rows` holds the
+    retrieved chunk rows of each question, best first.
+    """
+    lowered = [normalize(text) for text in chunk_texts]
+    phrase_ranks, page_hits = [], []
+    for question, rows in zip(questions, ranked_rows):
+        if question.phrases:
+            phrase_ranks.append(_first_rank([any(phrase in lowered[row] for phrase in question.phrases) for row in rows]))
+        if question.pages:
+            labelled = set(question.pages)
+            page_hits.append(any(pages_of_chunk[row] & labelled for row in rows[:k]))
+    
+    count = len(phrase_ranks) or 1
+    return {
+        "recall@1": round(sum(rank == 1 for rank in phrase_ranks) / count, 3),
+        f"recall@{k}": round(sum(rank is not None and rank <= k for rank in phrase_ranks) / count, 3),
+        "mrr": round(sum(1.0 / rank for rank in phrase_ranks if rank) / count, 3),
+        f"page_recall@{k}": round(sum(page_hits) / (len(page_hits) or 1), 3),
+    }
+
+
+def score_images(questions: Sequence[EvalQuestion], selected: List[Optional[str]]) -> Dict[str, float]:
+    """
+    Image accuracy over all questions, the share of labelled images that
+    were shown, and the share of image-less questions that got an image.
+    """
+    correct = sum(question.image_id == image_id for question, image_id in zip(questions, selected))
+    with_image = [(question, image_id) for question, image_id in zip(questions, selected) if question.image_id]
+    without_image = [image_id for question, image_id in zip(questions, selected) if not question.image_id]
+    return {
+        "image_accuracy": round(correct / (len(questions) or 1), 3),
+        "image_recall": round(sum(question.image_id == image_id for question, image_id in with_image)
+                              / (len(with_image) or 1), 3),
+        "false_image_rate": round(sum(image_id is not None for image_id in without_image)
+                                  / (len(without_image) or 1), 3),
+    }
+
+
+def pareto(results: List[Dict[str, Any]], maximize: Sequence[str], minimize: Sequence[str],
+           tolerance: float = 0.1) -> List[Optional[int]]:
+    """
+    For each result, the index of a result that dominates it (at least as
+    good in every objective and better in one), or None when it is on the
+    Pareto front. Minimised objectives (latency, memory) are compared with a
+    relative `tolerance`, so measurement noise alone does not dominate.
+    """
+    def no_worse(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+        return (all(a[name] >= b[name] for name in maximize)
+                and all(a[name] <= b[name] * (1 + tolerance) for name in minimize))
+    
+    def better_somewhere(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+        return (any(a[name] > b[name] for name in maximize)
+                or any(a[name] < b[name] * (1 - tolerance) for name in minimize))
+    
+    return [
+        next((j for j, other in enumerate(results)
+              if j != i and no_worse(other, result) and better_somewhere(other, result)), None)
+        for i, result in enumerate(results)
+    ]
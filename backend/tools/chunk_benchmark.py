@@ -0,0 +1,146 @@
+"""
+Retrieval quality against chunk count for different chunking settings.
+
+Extracts a PDF once, chunks it with each configuration, fits the topic
+TF-IDF vectorizer the pipeline would fit and ranks every chunk for a set of
+questions whose answer contains a known phrase. A question is a hit at k
+when one of its top k chunks contains that phrase. Reports hit@1, hit@k,
+MRR, the number of chunks and how many words the top k chunks add to each
+answer's context.
+
+    cd backend
+    python -m tools.chunk_benchmark
+    python -m tools.chunk_benchmark --config words:words:1000:200 --config sentences:tokens:256:48 --json out.json
+
+A configuration is `strategy:unit:size:overlap` (see `app.services.chunking`).
+The bundled questions are about `docs/pdf/Sound.pdf`; pass `--questions` with
+a JSON list of `{"question": ..., "phrase": ...}` objects for another PDF.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from app.services.chunking import Chunker
+from app.services.embedding_service import EmbeddingService
+from app.services.pdf_processor import PDFProcessor
+
+DEFAULT_PDF = os.path.join(os.path.dirname(__file__), "..", "..", "docs", "pdf", "Sound.pdf")
+
+DEFAULT_CONFIGS = [
+    "words:words:1000:200",  # previous default
+    "words:words:400:80",
+    "words:words:200:40",
+    "words:words:100:20",
+    "sentences:words:400:80",
+    "sentences:words:200:40",
+    "sentences:words:100:20",
+    "paragraphs:words:200:40",
+    "sentences:tokens:256:48",
+    "sentences:chars:1200:240",
+]
+
+# Answer phrases are lower-case and whitespace-normalised, as they appear in chunk text
+SOUND_QUESTIONS = [
+    ("What are compressions and rarefactions?", "called rarefactions"),
+    ("Why are sound waves called longitudinal waves?", "sound waves are longitudinal waves"),
+    ("What is a transverse wave?", "transverse wave is the one"),
+    ("What are the crest and the trough of a wave?", "a peak is called the crest"),
+    ("What is the SI unit of frequency?", "si unit is hertz"),
+    ("What did Heinrich Rudolph Hertz discover?", "photoelectric effect"),
+    ("How are the speed, frequency and wavelength of sound related?", "v = λν"),
+    ("What is the pitch of a sound?", "is called its pitch"),
+    ("How does the amplitude of a sound wave affect loudness?", "louder sound has large amplitude"),
+    ("What is the quality or timbre of a sound?", "quality or timber of sound"),
+    ("What is the difference between loudness and intensity?", "loudness is a physiological response"),
+    ("What does the speed of sound depend on?", "speed of sound depends"),
+    ("What is the speed of sound in aluminium?", "aluminium 6420"),
+    ("How long does the sensation of sound persist in the brain?", "persists in our brain for about 0.1 s"),
+    ("What is reverberation?", "is called reverberation"),
+    ("How does a stethoscope work?", "heartbeat reaches the doctor"),
+    ("Why are the ceilings of concert halls curved?", "ceilings of concert halls"),
+    ("What is the audible range of the human ear?", "20 hz to 20000 hz"),
+    ("Which animals communicate using infrasound?", "rhinoceroses communicate"),
+    ("How does a hearing aid work?", "hearing aid receives sound through a microphone"),
+    ("How is ultrasound used to find defects in metal blocks?", "ultrasound gets reflected back indicating"),
+    ("What is echocardiography?", "form the image of the heart"),
+    ("How is ultrasound used on kidney stones?", "break small"),
+    ("How far is a cliff if an echo is heard after 2 s?", "distance between the cliff and the person"),
+    ("How does a vibrating object produce compressions in air?", "vibrating object moves forward"),
+]
+
+
+def parse_config(config: str) -> Tuple[str, str, int, int]:
+    strategy, unit, size, overlap = config.split(":")
+    return strategy, unit, int(size), int(overlap)
+
+
+def evaluate(pages: List[str], config: str, questions: List[Tuple[str, str]], k: int) -> Dict[str, Any]:
+    strategy, unit, size, overlap = parse_config(config)
+    started = time.perf_counter()
+    chunks = list(Chunker(strategy, size, overlap, unit=unit).iter_chunks(pages))
+    chunk_ms = (time.perf_counter() - started) * 1000
+
+    texts = [chunk["text"] for chunk in chunks]
+    model, embeddings = EmbeddingService._fit(texts)
+    scores = (model.transform([question for question, _ in questions]) @ embeddings.T).toarray()
+    ranked = np.argsort(-scores, axis=1, kind="stable")
+    lowered = [text.lower() for text in texts]
+    word_counts = np.array([chunk["word_count"] for chunk in chunks])
+
+    hits_at_1 = hits_at_k = reciprocal_ranks = 0.0
+    for (_, phrase), order in zip(questions, ranked):
+        rank = next((position for position, row in enumerate(order, start=1) if phrase in lowered[row]), None)
+        if rank is None:
+            continue
+        hits_at_1 += rank == 1
+        hits_at_k += rank <= k
+        reciprocal_ranks += 1.0 / rank
+
+    count = len(questions)
+    return {
+        "config": config,
+        "chunks": len(chunks),
+        "mean_chunk_words": round(float(word_counts.mean()), 1),
+        "context_words": round(float(word_counts[ranked[:, :k]].sum(axis=1).mean()), 1),
+        "hit@1": round(hits_at_1 / count, 3),
+        f"hit@{k}": round(hits_at_k / count, 3),
+        "mrr": round(reciprocal_ranks / count, 3),
+        "chunk_ms": round(chunk_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--config", action="append", dest="configs", help="strategy:unit:size:overlap (repeatable)")
+    parser.add_argument("--questions", help="JSON list of {question, phrase}; defaults to the Sound.pdf set")
+    parser.add_argument("-k", type=int, default=3, help="chunks retrieved per question (TOP_K_CHUNKS)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    questions = SOUND_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [(item["question"], item["phrase"].lower()) for item in json.load(f)]
+
+    started = time.perf_counter()
+    pages = [text for _, text in PDFProcessor().iter_pages(args.pdf)]
+    print(f"{os.path.basename(args.pdf)}: {len(pages)} pages extracted in {time.perf_counter() - started:.1f}s, "
+          f"{len(questions)} questions, k={args.k}\n")
+
+    results = [evaluate(pages, config, questions, args.k) for config in args.configs or DEFAULT_CONFIGS]
+    columns = list(results[0])
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"pdf": args.pdf, "k": args.k, "questions": len(questions), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
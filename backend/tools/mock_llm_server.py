@@ -0,0 +1,114 @@
+"""
+Local stand-in for an OpenAI-compatible chat-completions API.
+
+Answers deterministically from the excerpts in the prompt after a
+configurable delay, optionally failing a fraction of requests, so the LLM
+provider (pooling, concurrency limit, coalescing, timeouts and fallback)
+can be exercised and benchmarked offline.
+
+    cd backend
+    python -m tools.mock_llm_server --port 8001 --latency-ms 300
+    LLM_PROVIDER=openai_compatible LLM_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Mock LLM server")
+
+config = {"latency_ms": 200.0, "fail_rate": 0.0, "token_delay_ms": 5.0}
+counters = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "failures": 0}
+
+
+def compose_answer(messages) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    question = prompt.rsplit("Question:", 1)[-1].strip()
+    first_excerpt = re.search(r"\[Source 1\]\n(.+?)(?:\n\n\[Source|\n\nQuestion:|$)", prompt, re.S)
+    sentence = ""
+    if first_excerpt:
+        sentence = re.split(r"(?<=[.!?])\s+", first_excerpt.group(1).strip())[0]
+    return f'Mock answer to "{question}". According to [Source 1]: {sentence}'.strip()
+
+
+def completion(model: str, content: str):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def chunk(model: str, delta: dict, finish_reason=None) -> str:
+    body = {
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    model = payload.get("model", "mock")
+    counters["requests"] += 1
+    counters["in_flight"] += 1
+    counters["peak_in_flight"] = max(counters["peak_in_flight"], counters["in_flight"])
+    try:
+        await asyncio.sleep(config["latency_ms"] / 1000)
+        if random.random() < config["fail_rate"]:
+            counters["failures"] += 1
+            raise HTTPException(status_code=503, detail="Injected failure")
+        content = compose_answer(payload.get("messages", []))
+    finally:
+        counters["in_flight"] -= 1
+
+    if not payload.get("stream"):
+        return completion(model, content)
+
+    async def events():
+        yield chunk(model, {"role": "assistant"})
+        for word in re.findall(r"\S+\s*", content):
+            await asyncio.sleep(config["token_delay_ms"] / 1000)
+            yield chunk(model, {"content": word})
+        yield chunk(model, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+
+@app.get("/stats")
+async def stats():
+    return dict(counters, **config)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"])
+    parser.add_argument("--fail-rate", type=float, default=config["fail_rate"])
+    parser.add_argument("--token-delay-ms", type=float, default=config["token_delay_ms"])
+    args = parser.parse_args()
+    config.update(latency_ms=args.latency_ms, fail_rate=args.fail_rate, token_delay_ms=args.token_delay_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
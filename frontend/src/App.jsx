@@ -16,6 +16,9 @@ const App = () => {
     
     try {
       const uploadResponse = await apiService.uploadPDF(file);
+      const job = uploadResponse.job_id
+        ? await apiService.waitForIngestion(uploadResponse.job_id)
+        : uploadResponse;
       
       const newChat = {
         id: Date.now(),
@@ -34,7 +37,7 @@ const App = () => {
           },
           {
             id: Date.now() + 1,
-            text: `I've processed your PDF (${uploadResponse.chunks_processed} sections). Ask me anything about the content!`,
+            text: `I've processed your PDF (${job.chunks_processed} sections). Ask me anything about the content!`,
             sender: 'ai',
             timestamp: new Date(),
             type: 'text'
@@ -6,6 +6,7 @@ import apiService from '../services/apiService';
 const ChatInterface = ({ currentChat, onUpdateChat, onNewChat }) => {
   const [message, setMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -31,24 +32,49 @@ const ChatInterface = ({ currentChat, onUpdateChat, onNewChat }) => {
       setMessage('');
       setIsLoading(true);
 
+      const question = message.trim();
+      const toImage = (data) => data.image_filename ? {
+        id: data.image_id || `img_${Date.now()}`,
+        filename: data.image_filename,
+        title: data.image_title || 'Relevant Diagram',
+        url: apiService.getImageUrl(data.image_filename)
+      } : null;
+
+      // Render the answer as it streams in; the diagram arrives last
+      const aiMessage = {
+        id: Date.now() + 1,
+        text: '',
+        sender: 'ai',
+        timestamp: new Date(),
+        type: 'text',
+        image: null
+      };
+      const renderAiMessage = () => onUpdateChat(currentChat.id, [...updatedMessages, { ...aiMessage }]);
+
       try {
-        const response = await apiService.sendChatMessage(currentChat.topicId, message.trim());
-        
-        const aiMessage = {
-          id: Date.now() + 1,
-          text: response.answer,
-          sender: 'ai',
-          timestamp: new Date(),
-          type: 'text',
-          image: response.image_filename ? {
-            id: response.image_id || `img_${Date.now()}`,
-            filename: response.image_filename,
-            title: response.image_title || 'Relevant Diagram',
-            url: apiService.getImageUrl(response.image_filename)
-          } : null
-        };
+        let response;
+        try {
+          response = await apiService.streamChatMessage(currentChat.topicId, question, {
+            onAnswer: (delta) => {
+              aiMessage.text += delta;
+              setIsStreaming(true);
+              renderAiMessage();
+            },
+            onImage: (data) => {
+              aiMessage.image = toImage(data);
+              renderAiMessage();
+            }
+          });
+        } catch (streamError) {
+          // Nothing shown yet (e.g. a proxy that buffers streams): retry without streaming
+          if (aiMessage.text) throw streamError;
+          console.warn('Chat stream failed, falling back to /chat:', streamError);
+          response = await apiService.sendChatMessage(currentChat.topicId, question);
+        }
 
-        onUpdateChat(currentChat.id, [...updatedMessages, aiMessage]);
+        aiMessage.text = response.answer;
+        aiMessage.image = toImage(response);
+        renderAiMessage();
       } catch (error) {
         console.error('Error sending message:', error);
         
@@ -63,6 +89,7 @@ const ChatInterface = ({ currentChat, onUpdateChat, onNewChat }) => {
         onUpdateChat(currentChat.id, [...updatedMessages, errorMessage]);
       } finally {
         setIsLoading(false);
+        setIsStreaming(false);
       }
     }
   };
@@ -137,7 +164,7 @@ const ChatInterface = ({ currentChat, onUpdateChat, onNewChat }) => {
             )}
           </div>
         ))}
-        {isLoading && (
+        {isLoading && !isStreaming && (
           <div className="message ai-message">
             <div className="message-avatar">🤖</div>
             <div className="message-content-wrapper">
@@ -38,6 +38,26 @@ class ApiService {
     }
   }
 
+  async getUploadStatus(jobId) {
+    try {
+      return await request(`/upload/jobs/${jobId}`, { method: 'GET' });
+    } catch (error) {
+      console.error('Upload status error:', error);
+      throw error;
+    }
+  }
+
+  async waitForIngestion(jobId, { intervalMs = 1000, onProgress } = {}) {
+    // Poll the background ingestion job until it finishes
+    while (true) {
+      const job = await this.getUploadStatus(jobId);
+      if (onProgress) onProgress(job);
+      if (job.status === 'completed') return job;
+      if (job.status === 'failed') throw new Error(job.error || 'PDF processing failed');
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+  }
+
   async sendChatMessage(topicId, question) {
     try {
       return await request('/chat', {
@@ -54,6 +74,56 @@ class ApiService {
     }
   }
 
+  async streamChatMessage(topicId, question, { onChunks, onAnswer, onImage } = {}) {
+    // Server-Sent Events over fetch: chunks -> answer deltas -> image -> done
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify({
+        topic_id: topicId,
+        question: question,
+      }),
+    });
+
+    if (!response.ok || !response.body) {
+      const errorText = await response.text();
+      throw new Error(errorText || response.statusText);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = 'message';
+        const dataLines = [];
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+        }
+        if (!dataLines.length) continue;
+        const data = JSON.parse(dataLines.join('\n'));
+
+        if (event === 'chunks' && onChunks) onChunks(data.relevant_chunks);
+        else if (event === 'answer' && onAnswer) onAnswer(data.delta);
+        else if (event === 'image' && onImage) onImage(data);
+        else if (event === 'error') throw new Error(data.detail || 'Chat stream failed');
+        else if (event === 'done') return data;
+      }
+    }
+
+    throw new Error('Chat stream ended before completion');
+  }
+
   async getTopicImages(topicId) {
     try {
       return await request(`/images/${topicId}`, { method: 'GET' });